@@ -0,0 +1,211 @@
+"""Пул endpoint-ов LLM: несколько ключей API и шлюзов вместо одной пары API_KEY/BASE_URL.
+
+Каждый вызов валидатора получает endpoint из пула (acquire) и возвращает его
+с исходом вызова (release):
+- маршрутизация — наименьшее число незавершенных запросов с учетом веса
+  (outstanding / weight), при равенстве — меньше запросов за запуск с учетом
+  веса, поэтому и последовательные вызовы делятся между ключами по весам;
+- 429 сразу исключает endpoint на Retry-After (или cooldown), 5xx, таймауты
+  и обрывы соединения — после failure_threshold сбоев подряд, 401/403 (плохой
+  ключ) — на max_cooldown;
+- по истечении cooldown endpoint возвращается в пул; повторное исключение
+  удваивает cooldown (до max_cooldown), успешный ответ его сбрасывает.
+
+Если исключены все endpoint-ы, запрос уходит на тот, что вернется первым:
+паузы между попытками задает retry_policy.
+
+Endpoint-ы из окружения (.env):
+- API_KEY / BASE_URL — endpoint 1 (или API_KEY_1 / BASE_URL_1);
+- API_KEY_2, API_KEY_3, ... — дополнительные ключи; BASE_URL_<n> — шлюз
+  ключа (по умолчанию BASE_URL);
+- LLM_ENDPOINT_WEIGHT_<n> — вес endpoint-а (по умолчанию 1);
+- LLM_ENDPOINT_COOLDOWN, LLM_ENDPOINT_MAX_COOLDOWN — cooldown исключения, сек (30 и 300);
+- LLM_ENDPOINT_FAILURES — сбоев подряд до исключения (3).
+
+Пул создается, только если настроено хотя бы два endpoint-а; с одним
+валидаторы работают как раньше.
+"""
+
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+from urllib.parse import urlparse
+
+import openai
+
+from retry import classify_error, get_retry_after
+
+
+# Сколько номеров API_KEY_<n> просматривать (пропуски в нумерации допустимы)
+MAX_ENDPOINTS = 64
+
+
+@dataclass
+class Endpoint:
+    """Пара ключ/шлюз и ее состояние в пуле."""
+
+    index: int
+    api_key: Optional[str] = None
+    base_url: Optional[str] = None
+    weight: float = 1.0
+    outstanding: int = 0  # запросы в работе
+    requests: int = 0
+    failures: int = 0
+    consecutive_failures: int = 0
+    ejections: int = 0
+    ejected: bool = False
+    ejected_until: float = 0.0  # time.monotonic()
+    next_cooldown: float = 0.0
+
+    @property
+    def name(self) -> str:
+        """Имя для логов: номер и хост, без ключа."""
+        host = urlparse(self.base_url).netloc if self.base_url else "default"
+        return f"#{self.index} ({host})"
+
+
+class EndpointPool:
+    """Взвешенный пул endpoint-ов с учетом здоровья; общий для потоков и корутин."""
+
+    def __init__(
+        self,
+        endpoints: List[Endpoint],
+        cooldown: float = 30.0,
+        max_cooldown: float = 300.0,
+        failure_threshold: int = 3,
+    ):
+        if not endpoints:
+            raise ValueError("Пул endpoint-ов пуст")
+        self.endpoints = endpoints
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.failure_threshold = failure_threshold
+        for endpoint in endpoints:
+            endpoint.next_cooldown = cooldown
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> Optional["EndpointPool"]:
+        """Пул из API_KEY_<n> / BASE_URL_<n> или None, если настроено меньше двух endpoint-ов."""
+        default_base_url = os.getenv("BASE_URL")
+        endpoints = []
+        for index in range(1, MAX_ENDPOINTS + 1):
+            api_key = os.getenv(f"API_KEY_{index}") or (os.getenv("API_KEY") if index == 1 else None)
+            if not api_key:
+                continue
+            endpoints.append(
+                Endpoint(
+                    index=index,
+                    api_key=api_key,
+                    base_url=os.getenv(f"BASE_URL_{index}") or default_base_url,
+                    weight=float(os.getenv(f"LLM_ENDPOINT_WEIGHT_{index}") or 1.0),
+                )
+            )
+        if len(endpoints) < 2:
+            return None
+        return cls(
+            endpoints,
+            cooldown=float(os.getenv("LLM_ENDPOINT_COOLDOWN") or 30.0),
+            max_cooldown=float(os.getenv("LLM_ENDPOINT_MAX_COOLDOWN") or 300.0),
+            failure_threshold=int(os.getenv("LLM_ENDPOINT_FAILURES") or 3),
+        )
+
+    def acquire(self) -> Endpoint:
+        """Endpoint для следующего запроса; вернуть его нужно через release."""
+        with self._lock:
+            now = time.monotonic()
+            for endpoint in self.endpoints:
+                if endpoint.ejected and endpoint.ejected_until <= now:
+                    endpoint.ejected = False
+                    print(f"Endpoint {endpoint.name} возвращен в пул")
+            candidates = [e for e in self.endpoints if not e.ejected]
+            if not candidates:
+                candidates = [min(self.endpoints, key=lambda e: e.ejected_until)]
+            endpoint = min(
+                candidates,
+                key=lambda e: (e.outstanding / e.weight, e.requests / e.weight),
+            )
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+            return endpoint
+
+    def release(self, endpoint: Endpoint, error: Optional[BaseException] = None) -> None:
+        """Завершение запроса; error — исключение вызова (None — успешный ответ)."""
+        with self._lock:
+            endpoint.outstanding = max(0, endpoint.outstanding - 1)
+            if error is None:
+                endpoint.consecutive_failures = 0
+                endpoint.next_cooldown = self.cooldown
+                return
+            if isinstance(error, (openai.AuthenticationError, openai.PermissionDeniedError)):
+                endpoint.failures += 1
+                self._eject(endpoint, self.max_cooldown, "ключ отклонен")
+                return
+            kind = classify_error(error)
+            if kind is None:
+                # Ошибки запроса (400 и т. п.) не говорят о здоровье endpoint-а.
+                return
+            endpoint.failures += 1
+            endpoint.consecutive_failures += 1
+            if kind == "rate_limit":
+                self._eject(endpoint, get_retry_after(error) or None, "429")
+            elif endpoint.consecutive_failures >= self.failure_threshold:
+                self._eject(endpoint, None, f"{endpoint.consecutive_failures} сбоев подряд")
+
+    def _eject(self, endpoint: Endpoint, duration: Optional[float], reason: str) -> None:
+        backoff = duration is None
+        if backoff:
+            duration = endpoint.next_cooldown
+        until = time.monotonic() + duration
+        # Сбои параллельных запросов к уже исключенному endpoint-у не продлевают и не сокращают cooldown.
+        if endpoint.ejected and endpoint.ejected_until >= until:
+            return
+        if backoff:
+            endpoint.next_cooldown = min(self.max_cooldown, endpoint.next_cooldown * 2)
+        endpoint.ejected = True
+        endpoint.ejected_until = until
+        endpoint.ejections += 1
+        endpoint.consecutive_failures = 0
+        print(f"Endpoint {endpoint.name} исключен из пула на {duration:.1f} сек ({reason})")
+
+    def summary(self) -> str:
+        now = time.monotonic()
+        lines = [f"Пул endpoint-ов: {len(self.endpoints)}"]
+        with self._lock:
+            for e in self.endpoints:
+                state = f", исключен еще {e.ejected_until - now:.0f} сек" if e.ejected and e.ejected_until > now else ""
+                lines.append(
+                    f"  {e.name}, вес {e.weight:g}: запросов {e.requests}, ошибок {e.failures}, "
+                    f"исключений {e.ejections}{state}"
+                )
+        return "\n".join(lines)
+
+
+def scale_workers(workers: int, pool: Optional[EndpointPool]) -> int:
+    """Число параллельных запросов, заданное на один ключ, умноженное на число endpoint-ов."""
+    return workers * (len(pool.endpoints) if pool is not None else 1)
+
+
+_pool: Optional[EndpointPool] = None
+_pool_loaded = False
+_pool_lock = threading.Lock()
+
+
+def get_endpoint_pool() -> Optional[EndpointPool]:
+    """Общий пул процесса из .env (None, если endpoint один)."""
+    global _pool, _pool_loaded
+    with _pool_lock:
+        if not _pool_loaded:
+            _pool = EndpointPool.from_env()
+            _pool_loaded = True
+        return _pool
+
+
+def configure_endpoints(pool: Optional[EndpointPool] = None) -> None:
+    """Задает общий пул явно; None — заново прочитать .env при следующем запросе."""
+    global _pool, _pool_loaded
+    with _pool_lock:
+        _pool = pool
+        _pool_loaded = pool is not None
@@ -0,0 +1,180 @@
+"""Чтение выгрузок сотрудников из Excel с кэшем разобранного листа.
+
+Каждая книга открывается один раз: одним объектом ExcelFile выбирается лист
+и разбирается только он. Движок чтения — python-calamine, если установлен
+(в разы быстрее openpyxl на больших выгрузках), иначе openpyxl; явно —
+EXCEL_ENGINE в .env.
+
+Разобранный лист кэшируется на диске (SheetCache) по sha256 содержимого
+книги, имени листа и версии pandas: повторные запуски на той же выгрузке не
+разбирают xlsx вовсе. Формат кэша — Parquet (нужен pyarrow), без pyarrow или
+если столбцы все же не сохраняются в Parquet — pickle. Режим EXCEL_CACHE в .env:
+"use" (по умолчанию), "refresh" или "off"; папка — EXCEL_CACHE_DIR.
+
+Записи отдаются лениво (iter_dataframe_records): limit применяется к таблице
+до преобразования строк в словари.
+"""
+
+import hashlib
+import importlib.util
+import os
+from datetime import datetime
+from typing import Any, Dict, Iterator, Optional, Sequence, Tuple
+
+import pandas as pd
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SHEET_CACHE_DIR = os.path.join(BASE_DIR, ".excel_cache")
+SHEET_CACHE_MODES = ("use", "refresh", "off")
+# Лист с сотрудниками; если его нет, читается первый лист книги
+EMPLOYEES_SHEET = "сотрудники"
+# Увеличивается при изменении способа чтения листа, чтобы не отдавать старый кэш
+SHEET_CACHE_VERSION = 1
+
+
+def file_hash(path: str) -> str:
+    """sha256 содержимого файла."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def get_excel_engine() -> str:
+    """EXCEL_ENGINE из .env, иначе calamine при наличии, иначе openpyxl."""
+    engine = (os.getenv("EXCEL_ENGINE") or "").strip().lower()
+    if engine:
+        return engine
+    if importlib.util.find_spec("python_calamine") is not None:
+        return "calamine"
+    return "openpyxl"
+
+
+def _has_pyarrow() -> bool:
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+class SheetCache:
+    """Разобранные листы Excel на диске, один файл на лист книги."""
+
+    def __init__(self, directory: str = DEFAULT_SHEET_CACHE_DIR, mode: str = "use"):
+        if mode not in SHEET_CACHE_MODES:
+            raise ValueError(f"Неизвестный режим кэша: {mode} (ожидается один из {SHEET_CACHE_MODES})")
+        self.directory = directory
+        self.mode = mode
+
+    @classmethod
+    def from_env(cls) -> Optional["SheetCache"]:
+        """Кэш по настройкам .env; None, если EXCEL_CACHE=off."""
+        mode = (os.getenv("EXCEL_CACHE") or "use").strip().lower()
+        if mode == "off":
+            return None
+        return cls(directory=os.getenv("EXCEL_CACHE_DIR") or DEFAULT_SHEET_CACHE_DIR, mode=mode)
+
+    def key(self, path: str, sheet: Optional[str]) -> str:
+        payload = f"{file_hash(path)}:{sheet}:v{SHEET_CACHE_VERSION}:pandas-{pd.__version__}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _entry_paths(self, key: str) -> Tuple[str, str]:
+        base = os.path.join(self.directory, key)
+        return f"{base}.parquet", f"{base}.pkl"
+
+    def get(self, key: str) -> Optional[pd.DataFrame]:
+        if self.mode != "use":
+            return None
+        parquet_path, pickle_path = self._entry_paths(key)
+        try:
+            if os.path.exists(parquet_path) and _has_pyarrow():
+                return pd.read_parquet(parquet_path)
+            if os.path.exists(pickle_path):
+                return pd.read_pickle(pickle_path)
+        except Exception as e:
+            print(f"Предупреждение: запись кэша {key[:12]} не прочитана ({e}), лист будет разобран заново")
+        return None
+
+    def put(self, key: str, df: pd.DataFrame) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        parquet_path, pickle_path = self._entry_paths(key)
+        if _has_pyarrow():
+            tmp_path = f"{parquet_path}.{os.getpid()}.tmp"
+            try:
+                df.to_parquet(tmp_path, index=False)
+                # Атомарная замена: прерванная запись не оставляет битый файл кэша.
+                os.replace(tmp_path, parquet_path)
+                return
+            except Exception:
+                # Столбцы со смешанными типами (например, числа и строки) Parquet не сохраняет
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+        tmp_path = f"{pickle_path}.{os.getpid()}.tmp"
+        df.to_pickle(tmp_path)
+        os.replace(tmp_path, pickle_path)
+
+    def clear(self) -> int:
+        """Удаляет весь кэш; возвращает число удаленных записей."""
+        if not os.path.isdir(self.directory):
+            return 0
+        removed = 0
+        for name in os.listdir(self.directory):
+            if name.endswith((".parquet", ".pkl", ".tmp")):
+                os.remove(os.path.join(self.directory, name))
+                removed += 1
+        return removed
+
+
+def normalize_mixed_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """Даты Excel в текстовых столбцах переводит в строки "дд.мм.гггг" на месте.
+
+    В выгрузках дата рождения обычно текстом, но отдельные ячейки Excel
+    превращает в даты; такой столбец не сохраняется в Parquet. Формат тот же,
+    что дает normalize_value в horoscope_generator.
+    """
+    for column in df.columns[df.dtypes == object]:
+        values = df[column]
+        is_date = values.map(lambda value: isinstance(value, (pd.Timestamp, datetime)))
+        if is_date.any() and not is_date.all():
+            df.loc[is_date, column] = values[is_date].map(lambda value: value.strftime("%d.%m.%Y"))
+    return df
+
+
+def read_sheet(
+    path: str,
+    sheet: Optional[str] = EMPLOYEES_SHEET,
+    cache: Optional[SheetCache] = None,
+    use_cache: bool = True,
+) -> pd.DataFrame:
+    """Лист sheet (или первый лист, если его нет) одной книги, из кэша или с одним открытием файла.
+
+    cache=None и use_cache=True — кэш по настройкам .env (SheetCache.from_env).
+    """
+    if cache is None and use_cache:
+        cache = SheetCache.from_env()
+    key = None
+    if cache is not None:
+        key = cache.key(path, sheet)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    with pd.ExcelFile(path, engine=get_excel_engine()) as xl:
+        sheet_name = sheet if sheet in xl.sheet_names else xl.sheet_names[0]
+        df = normalize_mixed_columns(xl.parse(sheet_name))
+
+    if cache is not None:
+        try:
+            cache.put(key, df)
+        except OSError as e:
+            print(f"Предупреждение: не удалось сохранить лист {os.path.basename(path)} в кэш ({e})")
+    return df
+
+
+def iter_dataframe_records(df: pd.DataFrame, limit: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """Строки таблицы словарями по одной; NaN заменяется на None."""
+    if limit is not None:
+        df = df.head(limit)
+    columns: Sequence[str] = list(df.columns)
+    cleaned = df.astype(object).where(pd.notna(df), None)
+    for values in cleaned.itertuples(index=False, name=None):
+        yield dict(zip(columns, values))
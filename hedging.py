@@ -0,0 +1,238 @@
+"""Хеджирование запросов к LLM: дубль медленного запроса ради хвоста задержки.
+
+Если ответ не пришел за порог — перцентиль задержки недавних вызовов
+(скользящее окно) — HedgePolicy отправляет такой же запрос еще раз и
+возвращает первый успешный ответ. В асинхронном режиме проигравший запрос
+отменяется (соединение закрывается); в синхронном HTTP-вызов из другого
+потока прервать нельзя, поэтому проигравший дорабатывает в фоне, а его ответ
+отбрасывается (резерв лимитера при этом исправляется как обычно).
+
+Дубли расходуют бюджет RPM/TPM и деньги, поэтому их доля ограничена:
+каждый вызов добавляет max_rate "дубля" в запас (не больше burst), дубль
+отправляется только при наличии целого дубля в запасе. Пока в окне меньше
+min_samples задержек, порога нет и запросы не дублируются.
+
+Потоковые вызовы не хеджируются.
+
+Настройки из окружения (.env):
+- LLM_HEDGE — on, чтобы включить (по умолчанию выключено);
+- LLM_HEDGE_PERCENTILE — перцентиль задержки для порога (95);
+- LLM_HEDGE_MAX_RATE — максимальная доля вызовов с дублем (0.05);
+- LLM_HEDGE_MIN_SAMPLES — сколько задержек нужно до первого дубля (20);
+- LLM_HEDGE_WINDOW — размер окна задержек (200);
+- LLM_HEDGE_MIN_DELAY — нижняя граница порога, сек (0.1).
+"""
+
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+from telemetry import percentile as compute_percentile
+
+
+@dataclass
+class HedgeOutcome:
+    """Хеджирование одного вызова (по всем его попыткам)."""
+
+    hedges: int = 0  # отправлено дублей
+    won: bool = False  # ответ дал дубль
+
+
+class HedgePolicy:
+    """Порог по перцентилю недавних задержек и ограничение доли дублей.
+
+    Один экземпляр можно разделять между потоками и корутинами; для запросов с
+    другим распределением задержки (например, пакетов) нужна своя политика — clone().
+    """
+
+    def __init__(
+        self,
+        percentile: float = 95.0,
+        max_rate: float = 0.05,
+        min_samples: int = 20,
+        window: int = 200,
+        min_delay: float = 0.1,
+        burst: float = 3.0,
+    ):
+        self.percentile = percentile
+        self.max_rate = max_rate
+        self.min_samples = min_samples
+        self.window = window
+        self.min_delay = min_delay
+        self.burst = burst
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.calls = 0
+        self.hedges = 0
+        self.wins = 0
+        self._budget = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> Optional["HedgePolicy"]:
+        """Политика по переменным окружения или None, если LLM_HEDGE не включен."""
+        if (os.getenv("LLM_HEDGE") or "off").strip().lower() not in ("1", "on", "true", "yes"):
+            return None
+        defaults = cls()
+        return cls(
+            percentile=float(os.getenv("LLM_HEDGE_PERCENTILE") or defaults.percentile),
+            max_rate=float(os.getenv("LLM_HEDGE_MAX_RATE") or defaults.max_rate),
+            min_samples=int(os.getenv("LLM_HEDGE_MIN_SAMPLES") or defaults.min_samples),
+            window=int(os.getenv("LLM_HEDGE_WINDOW") or defaults.window),
+            min_delay=float(os.getenv("LLM_HEDGE_MIN_DELAY") or defaults.min_delay),
+        )
+
+    def clone(self) -> "HedgePolicy":
+        """Та же политика с пустым окном задержек и своими счетчиками."""
+        return type(self)(
+            percentile=self.percentile,
+            max_rate=self.max_rate,
+            min_samples=self.min_samples,
+            window=self.window,
+            min_delay=self.min_delay,
+            burst=self.burst,
+        )
+
+    def observe(self, latency: float) -> None:
+        with self._lock:
+            self.latencies.append(latency)
+
+    def threshold(self) -> Optional[float]:
+        """Текущий порог дубля, сек, или None, пока задержек меньше min_samples."""
+        with self._lock:
+            if len(self.latencies) < self.min_samples:
+                return None
+            values = list(self.latencies)
+        return max(self.min_delay, compute_percentile(values, self.percentile))
+
+    def _start_call(self) -> Optional[float]:
+        with self._lock:
+            self.calls += 1
+            self._budget = min(self.burst, self._budget + self.max_rate)
+        return self.threshold()
+
+    def _acquire_hedge(self, outcome: HedgeOutcome) -> bool:
+        with self._lock:
+            if self._budget < 1:
+                return False
+            self._budget -= 1
+            self.hedges += 1
+        outcome.hedges += 1
+        return True
+
+    def _record_win(self, outcome: HedgeOutcome) -> None:
+        with self._lock:
+            self.wins += 1
+        outcome.won = True
+
+    def _timed(self, send: Callable[[], Any]) -> Any:
+        started = time.perf_counter()
+        result = send()
+        self.observe(time.perf_counter() - started)
+        return result
+
+    def _start(self, send: Callable[[], Any]) -> Future:
+        """send() в своем потоке: запрос стартует сразу, без очереди общего пула.
+
+        Очередь пула попала бы и в ожидание порога (лишние дубли), и в число
+        одновременных запросов (потолок на размер пула).
+        """
+        future: Future = Future()
+        future.set_running_or_notify_cancel()
+
+        def run() -> None:
+            try:
+                future.set_result(self._timed(send))
+            except BaseException as exc:
+                future.set_exception(exc)
+
+        threading.Thread(target=run, name="hedge", daemon=True).start()
+        return future
+
+    def call(self, send: Callable[[], Any], outcome: Optional[HedgeOutcome] = None) -> Any:
+        """Результат send(); если он медленнее порога — первый из двух одинаковых запросов."""
+        outcome = outcome if outcome is not None else HedgeOutcome()
+        delay = self._start_call()
+        if delay is None:
+            return self._timed(send)
+
+        primary = self._start(send)
+        is_hedge: Dict[Future, bool] = {primary: False}
+        done, _ = wait([primary], timeout=delay)
+        if not done and self._acquire_hedge(outcome):
+            is_hedge[self._start(send)] = True
+
+        pending = set(is_hedge)
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = error or future.exception()
+                    continue
+                if is_hedge[future]:
+                    self._record_win(outcome)
+                # Проигравший дорабатывает в своем потоке, его ответ отбрасывается.
+                return future.result()
+        raise error
+
+    async def _timed_async(self, send: Callable[[], Awaitable[Any]]) -> Any:
+        started = time.perf_counter()
+        try:
+            result = await send()
+        except asyncio.CancelledError:
+            # Отмененный запрос шел не меньше этого времени: нижняя оценка не дает порогу
+            # сползать вниз из-за того, что медленные запросы не доживают до ответа.
+            self.observe(time.perf_counter() - started)
+            raise
+        self.observe(time.perf_counter() - started)
+        return result
+
+    async def call_async(
+        self, send: Callable[[], Awaitable[Any]], outcome: Optional[HedgeOutcome] = None
+    ) -> Any:
+        """Асинхронный вариант call: проигравший запрос отменяется."""
+        outcome = outcome if outcome is not None else HedgeOutcome()
+        delay = self._start_call()
+        if delay is None:
+            return await self._timed_async(send)
+
+        primary = asyncio.ensure_future(self._timed_async(send))
+        is_hedge: Dict[asyncio.Future, bool] = {primary: False}
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if not done and self._acquire_hedge(outcome):
+                is_hedge[asyncio.ensure_future(self._timed_async(send))] = True
+
+            pending = set(is_hedge)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = error or task.exception()
+                        continue
+                    if is_hedge[task]:
+                        self._record_win(outcome)
+                    return task.result()
+            raise error
+        finally:
+            for task in is_hedge:
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    task.exception()  # иначе asyncio предупредит о неполученной ошибке
+
+    def summary(self) -> str:
+        threshold = self.threshold()
+        limit = f"{self.max_rate:.0%}"
+        if threshold is None:
+            return f"Хеджирование: порог еще не определен ({len(self.latencies)}/{self.min_samples} задержек), вызовов {self.calls}"
+        return (
+            f"Хеджирование: порог p{self.percentile:g} = {threshold:.2f} сек, "
+            f"дублей {self.hedges} на {self.calls} вызовов (лимит {limit}), выиграли {self.wins}"
+        )
@@ -0,0 +1,159 @@
+"""Проверка структуры сгенерированных гороскопов без обращения к LLM.
+
+HOROSCOPE_PROMPT требует четыре раздела с ограничением числа предложений;
+check_horoscope проверяет текст по правилам:
+- есть все разделы SECTION_LIMITS и ни один не пуст;
+- в разделе не больше предложений, чем разрешено (цитата в «» — одно слово);
+- упомянуты имя сотрудника (ИО) и его город (Город чист) — по основе
+  слова, чтобы "Ульяновске" совпадало с "Ульяновск";
+- длина текста в пределах MIN_CHARS..MAX_CHARS
+  (HOROSCOPE_MIN_CHARS / HOROSCOPE_MAX_CHARS в .env).
+
+Возвращается список нарушений; пустой список — гороскоп прошел проверку.
+
+Отдельно по готовому CSV:
+    python horoscope_checks.py horoscope_results/horoscopes_<время>.csv
+"""
+
+import argparse
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+
+# Раздел и максимум предложений в нем, в порядке из промта
+SECTION_LIMITS = {
+    "Астро-профиль": 4,
+    "Бизнес-прогноз": 4,
+    "Совет": 4,
+    "Девиз года": 1,
+}
+MIN_CHARS = int(os.getenv("HOROSCOPE_MIN_CHARS") or 600)
+MAX_CHARS = int(os.getenv("HOROSCOPE_MAX_CHARS") or 3500)
+# Сокращения, после точки в которых предложение не заканчивается ("г. Москва")
+ABBREVIATIONS = {"г", "гг", "ул", "им", "др", "пр", "см", "стр", "т", "д", "тыс", "млн", "руб"}
+
+# Заголовок раздела в начале строки; модели добавляют разметку: **Совет:**, ### Совет (отдельной строкой), Совет —
+SECTION_RE = re.compile(
+    r"^[\s#*_>\-]*(" + "|".join(re.escape(name) for name in SECTION_LIMITS) + r")[*_ \t]*(?:[:—–\-]|$)[*_\s]*",
+    re.IGNORECASE | re.MULTILINE,
+)
+QUOTE_RE = re.compile(r"«[^«»]*»|\"[^\"]*\"|“[^“”]*”")
+SENTENCE_END_RE = re.compile(r"([^\s.!?…]*)[.!?…]+[)\]»”\"]*(?=\s+[«\"“(]?[A-ZА-ЯЁ0-9]|\s*$)")
+WORD_RE = re.compile(r"[A-Za-zА-Яа-яЁё]+(?:-[A-Za-zА-Яа-яЁё]+)*")
+
+
+def split_sections(text: str) -> Dict[str, str]:
+    """Текст каждого найденного раздела по его каноническому имени."""
+    canonical = {name.lower(): name for name in SECTION_LIMITS}
+    matches = list(SECTION_RE.finditer(text))
+    sections: Dict[str, str] = {}
+    for index, match in enumerate(matches):
+        end = matches[index + 1].start() if index + 1 < len(matches) else len(text)
+        name = canonical[match.group(1).lower()]
+        # Повтор заголовка (например, в подписи) не затирает уже найденный раздел.
+        sections.setdefault(name, text[match.end():end].strip())
+    return sections
+
+
+def count_sentences(text: str) -> int:
+    """Число предложений: конец — . ! ? … перед заглавной буквой или концом текста."""
+    text = QUOTE_RE.sub("Цитата", text).strip()
+    if not text:
+        return 0
+    count = 0
+    for match in SENTENCE_END_RE.finditer(text):
+        if match.group(1).lower() in ABBREVIATIONS and match.end() < len(text):
+            continue
+        count += 1
+    # Последнее предложение без точки тоже считается.
+    if not re.search(r"[.!?…][)\]»”\"]*\s*$", text):
+        count += 1
+    return count
+
+
+def word_stem(word: str) -> str:
+    """Грубая основа слова для поиска с учетом падежа: без двух последних букв, не короче 4."""
+    word = word.lower().replace("ё", "е")
+    return word if len(word) <= 4 else word[: max(4, len(word) - 2)]
+
+
+def mentions(text: str, phrase: Optional[str]) -> bool:
+    """Упомянута ли фраза (все ее слова длиннее двух букв) в любой падежной форме."""
+    stems = [word_stem(word) for word in WORD_RE.findall(phrase or "") if len(word) > 2]
+    if not stems:
+        return True
+    words = {word.lower().replace("ё", "е") for word in WORD_RE.findall(text)}
+    return all(any(word.startswith(stem) for word in words) for stem in stems)
+
+
+def mentions_name(text: str, name: Optional[str]) -> bool:
+    """Имя или отчество из ИО: в тексте обычно обращение по одной части."""
+    parts = [part for part in WORD_RE.findall(name or "") if len(part) > 2]
+    return not parts or any(mentions(text, part) for part in parts)
+
+
+def check_horoscope(text: Optional[str], record: Dict[str, Any]) -> List[str]:
+    """Нарушения структуры гороскопа; [] — проверка пройдена."""
+    text = (text or "").strip()
+    if not text:
+        return ["пустой текст"]
+    problems: List[str] = []
+    if len(text) < MIN_CHARS:
+        problems.append(f"слишком короткий ({len(text)} < {MIN_CHARS} символов)")
+    elif len(text) > MAX_CHARS:
+        problems.append(f"слишком длинный ({len(text)} > {MAX_CHARS} символов)")
+
+    sections = split_sections(text)
+    for name, limit in SECTION_LIMITS.items():
+        if name not in sections:
+            problems.append(f"нет раздела «{name}»")
+            continue
+        sentences = count_sentences(sections[name])
+        if sentences == 0:
+            problems.append(f"пустой раздел «{name}»")
+        elif sentences > limit:
+            problems.append(f"в разделе «{name}» {sentences} предложений (не больше {limit})")
+
+    name = str(record.get("ИО") or "").strip()
+    if name and not mentions_name(text, name):
+        problems.append(f"не упомянуто имя ({name})")
+    city = str(record.get("Город чист") or "").strip()
+    if city and not mentions(text, city):
+        problems.append(f"не упомянут город ({city})")
+    return problems
+
+
+def format_problems(problems: List[str]) -> Optional[str]:
+    """Нарушения одной строкой для колонки check_errors; None, если их нет."""
+    return "; ".join(problems) or None
+
+
+def check_results_file(path: str) -> pd.DataFrame:
+    """Проверяет гороскопы итогового CSV/XLSX; возвращает строки с нарушениями."""
+    df = pd.read_excel(path) if path.lower().endswith(".xlsx") else pd.read_csv(path)
+    df = df.astype(object).where(pd.notna(df), None)
+    checked = df[df["horoscope"].notna()].copy()
+    checked["check_errors"] = [
+        format_problems(check_horoscope(row["horoscope"], row)) for row in checked.to_dict("records")
+    ]
+    return checked[checked["check_errors"].notna()]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Проверка структуры гороскопов в итоговой таблице")
+    parser.add_argument("path", help="CSV или XLSX с колонкой horoscope")
+    parser.add_argument("--limit", type=int, default=20, help="Сколько нарушений показать")
+    args = parser.parse_args()
+
+    failed = check_results_file(args.path)
+    print(f"Не прошли проверку: {len(failed)}")
+    columns = [column for column in ("BitrixId", "ИО", "check_errors") if column in failed.columns]
+    if len(failed):
+        print(failed[columns].head(args.limit).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
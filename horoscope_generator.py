@@ -1,24 +1,74 @@
 import argparse
+import asyncio
+import glob
+import hashlib
+import json
 import os
+import sys
 from datetime import datetime
-from typing import Any, Dict, Iterable, List, Optional, Tuple
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 
 import pandas as pd
 
-from openai_agent import GPT_Validator
-from prompts import HOROSCOPE_PROMPT
+from llm_batch import (
+    BATCH_RUNNERS,
+    get_batch_runner,
+    load_batch_results,
+    make_batch_request,
+    write_batch_file,
+)
+from llm_client import AsyncGPT_Validator, GPT_Validator, resolve_model
+from excel_ingest import EMPLOYEES_SHEET, iter_dataframe_records, read_sheet
+from hedging import HedgePolicy
+from horoscope_checks import check_horoscope, format_problems
+from journal import JsonlJournal
+from llm_cache import ResponseCache
+from prompts import HOROSCOPE_FIX_PROMPT, HOROSCOPE_PACK_PROMPT, HOROSCOPE_PROMPT
+from rate_limiter import RateLimiter
+from retry import CircuitBreaker, RetryPolicy, describe_error
+from telemetry import Telemetry
+from zodiac import enrich_zodiac
 
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DEFAULT_DATA_DIR = os.path.join(BASE_DIR, "horoscope_data")
 DEFAULT_OUTPUT_DIR = os.path.join(BASE_DIR, "horoscope_results")
+# Каждые CHECKPOINT_EVERY записей журнал собирается в промежуточный CSV.
+CHECKPOINT_EVERY = 300
+# Пакет сотрудников в одном запросе (pack_size > 1): общий текст промта отправляется
+# один раз на пакет, а размер пакета ограничен лимитом выходных токенов запроса.
+TOKENS_PER_HOROSCOPE = 700  # оценка выходных токенов одного гороскопа с запасом
+PACK_MAX_TOKENS = int(os.getenv("HOROSCOPE_PACK_MAX_TOKENS") or 16000)
+PACK_RESPONSE_FORMAT = {"type": "json_object"}
+# Сколько раз повторно запрашивать гороскопы, не прошедшие проверку структуры (horoscope_checks.py)
+REGENERATE_ROUNDS = int(os.getenv("HOROSCOPE_REGENERATE_ROUNDS") or 1)
 
 # Настройки для запуска из IDE: включите флаг enabled и укажите параметры ниже.
+# Используются только при запуске без аргументов; аргументы командной строки всегда важнее.
 IDE_RUN_CONFIG = {
+    "enabled": True,
     "data_dir": DEFAULT_DATA_DIR,
     "limit": 1800,
     "target_file": "Гороскопы 2026 год.xlsx",
     "output_dir": DEFAULT_OUTPUT_DIR,
+    # Число одновременных запросов к LLM; 1 — последовательный режим.
+    "concurrency": 1,
+    # Сотрудников в одном запросе; 1 — по одному (урезается по HOROSCOPE_PACK_MAX_TOKENS).
+    "pack_size": 1,
+    # Продолжить прерванный запуск: путь к *.journal.jsonl или "latest"; None — новый запуск.
+    "resume": None,
+    # Пакетный режим (Batch API): дешевле и без поминутных лимитов, ответ — в пределах суток.
+    "batch": False,
+    # Исполнитель пакета: "api" или "local"; None — LLM_BATCH_RUNNER из .env.
+    "batch_runner": None,
+    # Шард "i/N" (i от 1 до N): процесс берет только свою долю записей; None — все записи.
+    "shard": None,
+    # Собрать части шардированного запуска: список *.journal.jsonl, [] — все части в output_dir.
+    "merge": None,
+    # Раунды перегенерации гороскопов, не прошедших проверку структуры; 0 — только отметить в check_errors.
+    "regenerate_rounds": REGENERATE_ROUNDS,
+    # Проверить и перегенерировать готовый запуск без новых записей: путь к *.journal.jsonl или "latest".
+    "recheck": None,
 }
 
 
@@ -46,8 +96,7 @@ def list_xlsx_files(data_dir: str, target_file: Optional[str]) -> List[str]:
 
 def dataframe_to_records(df: pd.DataFrame) -> List[Dict[str, Any]]:
     """Преобразует датафрейм к списку словарей, заменяя NaN на None."""
-    cleaned = df.where(pd.notna(df), None)
-    return cleaned.to_dict(orient="records")
+    return list(iter_dataframe_records(df))
 
 
 def normalize_value(value: Any) -> Optional[str]:
@@ -71,6 +120,7 @@ def format_record_context(record: Dict[str, Any]) -> str:
         "BitrixId": "Bitrix ID",
         "Знак зодиака": "Знак зодиака",
         "Китайский календарь": "Китайский календарь",
+        "Пиньинь": "Пиньинь",
     }
     parts: List[str] = []
     for source_field, label in fields.items():
@@ -88,110 +138,1035 @@ def serialize_record(record: Dict[str, Any]) -> Dict[str, Any]:
 
 
 def iter_records(
-    data_dir: str, target_file: Optional[str], limit: Optional[int]
+    data_dir: str, target_file: Optional[str], limit: Optional[int], fill_zodiac: bool = True
 ) -> Iterable[Tuple[str, Dict[str, Any]]]:
-    """Итерируется по всем записям xlsx файлов, ограничивая их при необходимости."""
+    """Итерируется по всем записям xlsx файлов, ограничивая их при необходимости.
+
+    Лист "сотрудники" каждой книги читается один раз (или берется из кэша,
+    см. excel_ingest), а записи отдаются лениво: limit обрезает таблицу до
+    преобразования строк. fill_zodiac — дозаполнить пустые или отсутствующие
+    колонки знака зодиака, китайского календаря и пиньиня по дате рождения.
+    """
     files = list_xlsx_files(data_dir, target_file)
-    yielded = 0
+    remaining = limit if limit is not None and limit > 0 else None
 
     for file_path in files:
+        if remaining is not None and remaining <= 0:
+            return
         try:
-            xl = pd.ExcelFile(file_path)
-            sheet_name = "сотрудники" if "сотрудники" in xl.sheet_names else 0
-            df = pd.read_excel(file_path, sheet_name=sheet_name)
+            df = read_sheet(file_path, EMPLOYEES_SHEET)
         except Exception as e:
             print(f"Ошибка при чтении файла {file_path}: {e}")
             continue
 
-        records = dataframe_to_records(df)
-        for record in records:
+        if remaining is not None:
+            df = df.head(remaining).copy()
+            remaining -= len(df)
+        if fill_zodiac:
+            filled = enrich_zodiac(df)
+            if filled:
+                print(f"Заполнено {filled} ячеек знаков зодиака по дате рождения в {os.path.basename(file_path)}")
+
+        for record in iter_dataframe_records(df):
             yield file_path, record
-            yielded += 1
-            if limit is not None and limit > 0 and yielded >= limit:
-                return
 
 
-def generate_horoscopes(
+def iter_keyed_records(
+    data_dir: str, target_file: Optional[str], limit: Optional[int]
+) -> Iterable[Tuple[str, str, Dict[str, Any]]]:
+    """Как iter_records, но с устойчивым ключом записи для журнала.
+
+    Ключ — BitrixId, а если его нет — имя файла и номер строки. Повтор
+    BitrixId получает суффикс с номером строки, чтобы не склеить записи.
+    """
+    seen: set = set()
+    row_numbers: Dict[str, int] = {}
+    for file_path, record in iter_records(data_dir, target_file, limit):
+        file_name = os.path.basename(file_path)
+        row_numbers[file_name] = row_numbers.get(file_name, 0) + 1
+        row_number = row_numbers[file_name]
+
+        bitrix_id = normalize_value(record.get("BitrixId"))
+        if bitrix_id:
+            if bitrix_id.endswith(".0"):
+                bitrix_id = bitrix_id[:-2]
+            key = f"bitrix:{bitrix_id}"
+            if key in seen:
+                key = f"{key}#{file_name}:{row_number}"
+        else:
+            key = f"{file_name}:{row_number}"
+        seen.add(key)
+        yield key, file_path, record
+
+
+Shard = Optional[Tuple[int, int]]  # (номер шарда с 1, число шардов)
+PackItem = Tuple[int, str, str, Dict[str, Any]]  # (idx, key, file_path, record)
+
+
+def parse_shard(value: Optional[str]) -> Shard:
+    """Разбирает "i/N" в (i, N); None или пустая строка — без шардирования."""
+    if not value:
+        return None
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise ValueError(f"Шард задается как i/N, например 2/4: {value!r}")
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError(f"Номер шарда должен быть от 1 до N: {value!r}")
+    return index, count
+
+
+def shard_of(key: str, count: int) -> int:
+    """Номер шарда (с 1) для ключа записи; одинаков во всех процессах и на всех машинах."""
+    digest = hashlib.sha1(key.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % count + 1
+
+
+def iter_pending(
+    records: Iterable[Tuple[str, str, Dict[str, Any]]], done: set, shard: Shard = None
+) -> Iterator[PackItem]:
+    """Нумерует записи (order в журнале) и оставляет незавершенные записи своего шарда.
+
+    Номер считается до фильтрации, поэтому у всех шардов он общий и части
+    собираются в исходном порядке.
+    """
+    for idx, (key, file_path, record) in enumerate(records, start=1):
+        if key in done:
+            continue
+        if shard is not None and shard_of(key, shard[1]) != shard[0]:
+            continue
+        yield idx, key, file_path, record
+
+
+def _prompt_fields(record: Dict[str, Any]) -> Dict[str, str]:
+    return dict(
+        name=normalize_value(record.get("ИО")) or "Сотрудник",
+        position=normalize_value(record.get("Должность")) or "Сотрудник",
+        city=normalize_value(record.get("Город чист")) or "Не указан",
+        birthdate=normalize_value(record.get("День рождения")) or "Не указана",
+        zodiac_sign=normalize_value(record.get("Знак зодиака")) or "Не указан",
+        zodiac_animal=normalize_value(record.get("Китайский календарь")) or "Не указан",
+        pinyin=normalize_value(record.get("Пиньинь")) or "Не указан",
+        # context=record_context
+    )
+
+
+def build_horoscope_prompt(record: Dict[str, Any]) -> str:
+    """Подставляет данные сотрудника в HOROSCOPE_PROMPT."""
+    return HOROSCOPE_PROMPT.format(**_prompt_fields(record))
+
+
+def build_regeneration_prompt(record: Dict[str, Any], problems: Sequence[str]) -> str:
+    """HOROSCOPE_FIX_PROMPT: тот же промт и нарушения прежнего варианта."""
+    return HOROSCOPE_FIX_PROMPT.format(problems="; ".join(problems), **_prompt_fields(record))
+
+
+def resolve_pack_size(pack_size: Optional[int], max_tokens: int = PACK_MAX_TOKENS) -> int:
+    """Размер пакета, урезанный до числа гороскопов, умещающихся в max_tokens ответа."""
+    pack_size = max(1, pack_size or 1)
+    limit = max(1, max_tokens // TOKENS_PER_HOROSCOPE)
+    if pack_size > limit:
+        print(f"Размер пакета {pack_size} не умещается в {max_tokens} выходных токенов, используется {limit}")
+        return limit
+    return pack_size
+
+
+def iter_packs(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """Делит поток записей на пакеты по size."""
+    pack: List[Any] = []
+    for item in items:
+        pack.append(item)
+        if len(pack) >= size:
+            yield pack
+            pack = []
+    if pack:
+        yield pack
+
+
+def build_pack_prompt(records: Sequence[Dict[str, Any]]) -> str:
+    """Промт для нескольких сотрудников; id карточки — ее номер в пакете."""
+    cards = "\n\n".join(
+        f"id: {pack_id}\n{format_record_context(record)}"
+        for pack_id, record in enumerate(records, start=1)
+    )
+    return HOROSCOPE_PACK_PROMPT.format(count=len(records), cards=cards)
+
+
+def parse_pack_response(text: Optional[str], ids: Sequence[str]) -> Dict[str, str]:
+    """Гороскопы из JSON-ответа на пакет по id.
+
+    Элементы с неизвестным или повторным id и пустым текстом отбрасываются;
+    ValueError — ответ не разбирается как JSON с массивом гороскопов
+    (например, обрезан по max_tokens).
+    """
+    if not text or not text.strip():
+        raise ValueError("пустой ответ")
+    cleaned = text.strip()
+    if cleaned.startswith("```"):
+        # Модель иногда оборачивает JSON в блок кода
+        cleaned = cleaned.strip("`").strip()
+        if cleaned.startswith("json"):
+            cleaned = cleaned[len("json"):]
+    data = json.loads(cleaned)
+    if isinstance(data, dict):
+        data = data.get("horoscopes")
+    if not isinstance(data, list):
+        raise ValueError("в ответе нет массива horoscopes")
+
+    expected = set(ids)
+    horoscopes: Dict[str, str] = {}
+    for item in data:
+        if not isinstance(item, dict):
+            continue
+        pack_id = str(item.get("id", "")).strip()
+        horoscope = item.get("horoscope")
+        if pack_id in expected and pack_id not in horoscopes and isinstance(horoscope, str) and horoscope.strip():
+            horoscopes[pack_id] = horoscope.strip()
+    return horoscopes
+
+
+def build_result_row(
+    file_path: str,
+    record: Dict[str, Any],
+    horoscope: Optional[str],
+    error: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Формирует строку итоговой таблицы; при сбое horoscope пуст, а причина — в error.
+
+    Нарушения структуры гороскопа (horoscope_checks) — в check_errors.
+    """
+    printable_record = serialize_record(record)
+    printable_record["source_file"] = os.path.basename(file_path)
+    printable_record["horoscope"] = horoscope
+    printable_record["error"] = error
+    printable_record["check_errors"] = (
+        format_problems(check_horoscope(horoscope, record)) if horoscope is not None else None
+    )
+    return printable_record
+
+
+def make_retry_policy() -> RetryPolicy:
+    """Политика повторов с общим для всех воркеров выключателем."""
+    return RetryPolicy(circuit_breaker=CircuitBreaker())
+
+
+def make_pack_validator(validator: Any) -> Any:
+    """Валидатор для пакетов: те же лимитер, повторы, кэш и телеметрия, но больший max_tokens.
+
+    Порог хеджирования у пакетов свой: они отвечают в разы дольше одиночных запросов.
+    """
+    hedge_policy = validator.hedge_policy
+    pack_validator = type(validator)(
+        rate_limiter=validator.rate_limiter,
+        retry_policy=validator.retry_policy,
+        cache=validator.cache,
+        model=validator.model,
+        telemetry=validator.telemetry,
+        hedge_policy=hedge_policy.clone() if hedge_policy is not None else None,
+    )
+    pack_validator.max_tokens = PACK_MAX_TOKENS
+    return pack_validator
+
+
+def request_horoscope(validator: GPT_Validator, record: Dict[str, Any]) -> Tuple[Optional[str], Optional[str]]:
+    """Гороскоп одного сотрудника: (текст, None) или (None, описание ошибки)."""
+    try:
+        # Передаем пробел вторым аргументом, так как контекст уже вшит в промт
+        return validator(build_horoscope_prompt(record), " "), None
+    except Exception as exc:
+        return None, describe_error(exc)
+
+
+async def request_horoscope_async(
+    validator: AsyncGPT_Validator, record: Dict[str, Any]
+) -> Tuple[Optional[str], Optional[str]]:
+    try:
+        return await validator(build_horoscope_prompt(record), " "), None
+    except Exception as exc:
+        return None, describe_error(exc)
+
+
+def make_regeneration_validator(validator: Any) -> Any:
+    """Валидатор перегенерации: те же зависимости, но без кэша ответов.
+
+    Иначе повтор с тем же промтом вернул бы из кэша тот же неудачный гороскоп.
+    """
+    return type(validator)(
+        rate_limiter=validator.rate_limiter,
+        retry_policy=validator.retry_policy,
+        model=validator.model,
+        telemetry=validator.telemetry,
+        hedge_policy=validator.hedge_policy,
+        endpoint_pool=validator.endpoint_pool,
+    )
+
+
+def request_regeneration(
+    validator: GPT_Validator, row: Dict[str, Any], problems: Sequence[str]
+) -> Tuple[Optional[str], Optional[str]]:
+    """Новый вариант гороскопа по строке журнала: (текст, None) или (None, описание ошибки)."""
+    try:
+        response = validator.create_completion(build_regeneration_prompt(row, problems))
+        return response.choices[0].message.content, None
+    except Exception as exc:
+        return None, describe_error(exc)
+
+
+async def request_regeneration_async(
+    validator: AsyncGPT_Validator, row: Dict[str, Any], problems: Sequence[str]
+) -> Tuple[Optional[str], Optional[str]]:
+    try:
+        response = await validator.create_completion(build_regeneration_prompt(row, problems))
+        return response.choices[0].message.content, None
+    except Exception as exc:
+        return None, describe_error(exc)
+
+
+def _pack_ids(pack: Sequence[PackItem]) -> List[str]:
+    return [str(pack_id) for pack_id in range(1, len(pack) + 1)]
+
+
+def _parse_pack_completion(response: Any, pack: Sequence[PackItem]) -> Dict[str, str]:
+    horoscopes = parse_pack_response(response.choices[0].message.content, _pack_ids(pack))
+    missing = len(pack) - len(horoscopes)
+    if missing:
+        print(f"[{pack[0][0]}-{pack[-1][0]}] В ответе нет {missing} из {len(pack)} гороскопов, дозапрос по одному")
+    return horoscopes
+
+
+def generate_pack(
+    validator: GPT_Validator, pack_validator: GPT_Validator, pack: Sequence[PackItem]
+) -> List[Tuple[int, str, Dict[str, Any]]]:
+    """Гороскопы пакета одним запросом; недостающие запрашиваются по одному.
+
+    Возвращает (idx, key, строка результата) для каждой записи пакета.
+    """
+    horoscopes: Dict[str, str] = {}
+    # Запись, оставшаяся одна в хвосте, запрашивается обычным промтом.
+    try:
+        if len(pack) > 1:
+            response = pack_validator.create_completion(
+                build_pack_prompt([record for _, _, _, record in pack]), PACK_RESPONSE_FORMAT
+            )
+            horoscopes = _parse_pack_completion(response, pack)
+    except Exception as exc:
+        print(f"[{pack[0][0]}-{pack[-1][0]}] Пакет не получен ({describe_error(exc)}), запросы по одному")
+
+    rows = []
+    for pack_id, (idx, key, file_path, record) in zip(_pack_ids(pack), pack):
+        horoscope, error = horoscopes.get(pack_id), None
+        if horoscope is None:
+            horoscope, error = request_horoscope(validator, record)
+        rows.append((idx, key, build_result_row(file_path, record, horoscope, error)))
+    return rows
+
+
+async def generate_pack_async(
+    validator: AsyncGPT_Validator, pack_validator: AsyncGPT_Validator, pack: Sequence[PackItem]
+) -> List[Tuple[int, str, Dict[str, Any]]]:
+    """Асинхронный вариант generate_pack; дозапросы выполняются параллельно."""
+    horoscopes: Dict[str, str] = {}
+    # Запись, оставшаяся одна в хвосте, запрашивается обычным промтом.
+    try:
+        if len(pack) > 1:
+            response = await pack_validator.create_completion(
+                build_pack_prompt([record for _, _, _, record in pack]), PACK_RESPONSE_FORMAT
+            )
+            horoscopes = _parse_pack_completion(response, pack)
+    except Exception as exc:
+        print(f"[{pack[0][0]}-{pack[-1][0]}] Пакет не получен ({describe_error(exc)}), запросы по одному")
+
+    missing = [
+        (idx, key, file_path, record)
+        for pack_id, (idx, key, file_path, record) in zip(_pack_ids(pack), pack)
+        if pack_id not in horoscopes
+    ]
+    retried = await asyncio.gather(*(request_horoscope_async(validator, record) for _, _, _, record in missing))
+    outcomes = {idx: outcome for (idx, _, _, _), outcome in zip(missing, retried)}
+
+    rows = []
+    for pack_id, (idx, key, file_path, record) in zip(_pack_ids(pack), pack):
+        horoscope, error = outcomes.get(idx, (horoscopes.get(pack_id), None))
+        rows.append((idx, key, build_result_row(file_path, record, horoscope, error)))
+    return rows
+
+
+def part_suffix(shard: Shard) -> str:
+    return f".part{shard[0]}of{shard[1]}" if shard is not None else ""
+
+
+def open_run(output_dir: str, resume: Optional[str], shard: Shard = None) -> Tuple[JsonlJournal, str]:
+    """Возвращает журнал запуска и путь к итоговому CSV.
+
+    resume — путь к журналу прерванного запуска или "latest" для самого
+    свежего журнала в output_dir; None начинает новый запуск. У шарда
+    журнал и CSV — части с суффиксом .part<i>of<N>, "latest" ищет части того же шарда.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    suffix = part_suffix(shard)
+    if resume:
+        journal_path = resume
+        if resume == "latest":
+            journals = sorted(
+                path
+                for path in glob.glob(os.path.join(output_dir, f"horoscopes_*{suffix}.journal.jsonl"))
+                if shard is not None or ".part" not in os.path.basename(path)
+            )
+            if not journals:
+                raise FileNotFoundError(f"В папке {output_dir} нет журналов для продолжения")
+            journal_path = journals[-1]
+        elif not os.path.isfile(journal_path):
+            raise FileNotFoundError(f"Журнал {journal_path} не найден")
+        print(f"Продолжение запуска по журналу {journal_path}")
+    else:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        journal_path = os.path.join(output_dir, f"horoscopes_{timestamp}{suffix}.journal.jsonl")
+
+    output_path = journal_path[: -len(".journal.jsonl")] + ".csv"
+    return JsonlJournal(journal_path), output_path
+
+
+def save_results(
+    results: List[Dict[str, Any]], output_path: str, write_xlsx: bool = False
+) -> str:
+    """Сохраняет итоговый CSV (и XLSX) и сообщает, сколько записей завершились ошибкой."""
+    if not results:
+        print("Не удалось получить ни одного гороскопа")
+        return ""
+
+    df = pd.DataFrame(results)
+    df.to_csv(output_path, index=False)
+    if write_xlsx:
+        df.to_excel(os.path.splitext(output_path)[0] + ".xlsx", index=False)
+    failed = sum(1 for row in results if row.get("error"))
+    print(f"Сохранено {len(results) - failed} гороскопов в {output_path}")
+    if failed:
+        print(f"Записей с ошибками: {failed} (причины в колонке error)")
+    check_failed = sum(1 for row in results if row.get("check_errors"))
+    if check_failed:
+        print(f"Не прошли проверку структуры: {check_failed} (причины в колонке check_errors)")
+    return output_path
+
+
+def compact_journal(journal: JsonlJournal, output_path: str, final: bool = False) -> str:
+    """Собирает CSV (в конце запуска и XLSX) из журнала в порядке входных записей."""
+    entries = sorted(journal.load().values(), key=lambda entry: entry.get("order") or 0)
+    results = [entry["row"] for entry in entries]
+    if not final:
+        pd.DataFrame(results).to_csv(output_path, index=False)
+        print(f"Промежуточное сохранение {len(results)} записей в {output_path}")
+        return output_path
+    return save_results(results, output_path, write_xlsx=True)
+
+
+CheckFailure = Tuple[str, Dict[str, Any], List[str]]  # (ключ, запись журнала, нарушения)
+
+
+def find_check_failures(journal: JsonlJournal) -> List[CheckFailure]:
+    """Записи журнала с гороскопом, не прошедшим проверку (правила применяются заново).
+
+    Записи с ошибкой API сюда не входят: их повторяет --resume.
+    """
+    failures = []
+    for key, entry in journal.load().items():
+        row = entry["row"]
+        if row.get("error") or not row.get("horoscope"):
+            continue
+        problems = check_horoscope(row["horoscope"], row)
+        if problems:
+            failures.append((key, entry, problems))
+    return sorted(failures, key=lambda failure: failure[1].get("order") or 0)
+
+
+def apply_regeneration(
+    journal: JsonlJournal,
+    failure: CheckFailure,
+    horoscope: Optional[str],
+    error: Optional[str],
+) -> bool:
+    """Дописывает новый вариант в журнал, если нарушений в нем не больше; True — вариант принят.
+
+    Прежний вариант остается, если запрос не удался или новый хуже; его
+    check_errors при этом обновляется по текущим правилам.
+    """
+    key, entry, problems = failure
+    row, order = entry["row"], entry.get("order")
+    if error is None:
+        new_problems = check_horoscope(horoscope, row)
+        if len(new_problems) <= len(problems):
+            journal.append(key, dict(row, horoscope=horoscope, check_errors=format_problems(new_problems)), order=order)
+            return True
+        print(f"[{order}] Новый вариант хуже прежнего ({format_problems(new_problems)}), оставлен прежний")
+    else:
+        print(f"[{order}] Перегенерация не удалась: {error}")
+    if row.get("check_errors") != format_problems(problems):
+        journal.append(key, dict(row, check_errors=format_problems(problems)), order=order)
+    return False
+
+
+def _report_check_failures(failures: Sequence[CheckFailure], rounds: int) -> None:
+    if failures:
+        suffix = f" после {rounds} раундов перегенерации" if rounds else ""
+        print(f"Гороскопов с нарушениями структуры{suffix}: {len(failures)} (причины в колонке check_errors)")
+
+
+def regenerate_failed(validator: GPT_Validator, journal: JsonlJournal, rounds: int = REGENERATE_ROUNDS) -> int:
+    """Выборочная перегенерация: повторно запрашиваются только гороскопы, не прошедшие проверку.
+
+    Новые варианты дописываются в журнал (побеждает последняя запись по
+    ключу), поэтому итоговый CSV собирается из него как обычно. Возвращает
+    число записей, оставшихся с нарушениями.
+    """
+    failures = find_check_failures(journal)
+    regeneration_validator = make_regeneration_validator(validator)
+    for round_number in range(1, rounds + 1):
+        if not failures:
+            break
+        print(f"Перегенерация {round_number}/{rounds}: {len(failures)} гороскопов не прошли проверку")
+        for failure in failures:
+            horoscope, error = request_regeneration(regeneration_validator, failure[1]["row"], failure[2])
+            apply_regeneration(journal, failure, horoscope, error)
+        failures = find_check_failures(journal)
+    _report_check_failures(failures, rounds)
+    return len(failures)
+
+
+async def regenerate_failed_async(
+    validator: AsyncGPT_Validator, journal: JsonlJournal, rounds: int = REGENERATE_ROUNDS, concurrency: int = 16
+) -> int:
+    """Асинхронный вариант regenerate_failed, не более concurrency запросов одновременно."""
+    failures = find_check_failures(journal)
+    regeneration_validator = make_regeneration_validator(validator)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def regenerate(failure: CheckFailure) -> None:
+        async with semaphore:
+            horoscope, error = await request_regeneration_async(regeneration_validator, failure[1]["row"], failure[2])
+        apply_regeneration(journal, failure, horoscope, error)
+
+    for round_number in range(1, rounds + 1):
+        if not failures:
+            break
+        print(f"Перегенерация {round_number}/{rounds}: {len(failures)} гороскопов не прошли проверку")
+        await asyncio.gather(*(regenerate(failure) for failure in failures))
+        failures = find_check_failures(journal)
+    _report_check_failures(failures, rounds)
+    return len(failures)
+
+
+def recheck_journal(
+    journal: JsonlJournal, output_path: str, rounds: int = REGENERATE_ROUNDS, concurrency: int = 1
+) -> str:
+    """Проверка и перегенерация готового журнала; пересобирает итоговый CSV/XLSX."""
+    if rounds and find_check_failures(journal):
+        telemetry = Telemetry.from_env("horoscope_regenerate")
+        validator_class = AsyncGPT_Validator if concurrency > 1 else GPT_Validator
+        validator = validator_class(
+            rate_limiter=RateLimiter.from_env(),
+            retry_policy=make_retry_policy(),
+            telemetry=telemetry,
+            hedge_policy=HedgePolicy.from_env(),
+        )
+        if concurrency > 1:
+            asyncio.run(regenerate_failed_async(validator, journal, rounds, concurrency))
+        else:
+            regenerate_failed(validator, journal, rounds)
+        print(telemetry.format_summary())
+        telemetry.close()
+    else:
+        _report_check_failures(find_check_failures(journal), 0)
+    return compact_journal(journal, output_path, final=True)
+
+
+def recheck_run(
+    output_dir: str,
+    resume: str = "latest",
+    rounds: int = REGENERATE_ROUNDS,
+    concurrency: int = 1,
+    shard: Optional[str] = None,
+) -> str:
+    """--recheck: перегенерировать только не прошедшие проверку гороскопы готового запуска."""
+    journal, output_path = open_run(output_dir, resume, parse_shard(shard))
+    return recheck_journal(journal, output_path, rounds, concurrency)
+
+
+def merge_parts(
+    part_journals: Sequence[str],
     data_dir: str,
     limit: Optional[int],
     target_file: Optional[str],
     output_dir: str,
 ) -> str:
-    """Основной цикл генерации гороскопов."""
-    prompt_template = HOROSCOPE_PROMPT
-    validator = GPT_Validator()
-    os.makedirs(output_dir, exist_ok=True)
+    """Собирает журналы шардов в итоговый CSV/XLSX в исходном порядке записей.
 
-    results: List[Dict[str, Any]] = []
+    Ожидаемые записи берутся из тех же входных данных, поэтому отчет
+    показывает недостающие записи, записи с ошибкой, дубли (ключ есть в
+    нескольких частях — берется успешная строка) и ключи не из входа.
+    Пустой part_journals — все части *.part*of*.journal.jsonl в output_dir.
+    """
+    if not part_journals:
+        part_journals = sorted(glob.glob(os.path.join(output_dir, "horoscopes_*.part*of*.journal.jsonl")))
+    if not part_journals:
+        raise FileNotFoundError(f"В папке {output_dir} нет частей для сборки")
 
+    expected = {key: idx for idx, (key, _, _) in enumerate(iter_keyed_records(data_dir, target_file, limit), start=1)}
+    merged: Dict[str, Dict[str, Any]] = {}
+    sources: Dict[str, List[str]] = {}
+
+    def rank(entry: Dict[str, Any]) -> Tuple[bool, bool]:
+        return bool(entry["row"].get("error")), bool(entry["row"].get("check_errors"))
+
+    for path in part_journals:
+        name = os.path.basename(path)
+        for key, entry in JsonlJournal(path).load().items():
+            sources.setdefault(key, []).append(name)
+            current = merged.get(key)
+            # Успешная строка не перекрывается строкой с ошибкой из другой части,
+            # гороскоп, прошедший проверку, — гороскопом с нарушениями.
+            if current is None or rank(entry) < rank(current):
+                merged[key] = entry
+
+    missing = [key for key in expected if key not in merged]
+    duplicates = {key: names for key, names in sources.items() if len(names) > 1}
+    unexpected = [key for key in merged if key not in expected]
+    failed = [key for key, entry in merged.items() if entry["row"].get("error")]
+
+    print(f"Частей: {len(part_journals)}, ожидается записей: {len(expected)}, собрано: {len(merged)}")
+    if missing:
+        print(f"Нет результата для {len(missing)} записей: {', '.join(missing[:20])}{' ...' if len(missing) > 20 else ''}")
+    if duplicates:
+        print(f"Записи в нескольких частях: {len(duplicates)}")
+        for key, names in list(duplicates.items())[:20]:
+            print(f"  - {key}: {', '.join(names)}")
+    if unexpected:
+        print(f"Записи не из входных данных (другой запуск или входной файл?): {len(unexpected)}")
+    if failed:
+        print(f"Записей с ошибкой: {len(failed)} (повторите шард с --resume)")
+    check_failed = [key for key, entry in merged.items() if entry["row"].get("check_errors")]
+    if check_failed:
+        print(f"Гороскопов с нарушениями структуры: {len(check_failed)} (перегенерация — --recheck для части)")
+
+    # Порядок входа — по номеру записи во входных данных, как в обычном запуске.
+    entries = sorted(merged.items(), key=lambda item: expected.get(item[0], item[1].get("order") or 0))
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    output_path = os.path.join(output_dir, f"horoscopes_{timestamp}.csv")
+    output_path = os.path.join(output_dir, f"horoscopes_{timestamp}.merged.csv")
+    return save_results([entry["row"] for _, entry in entries], output_path, write_xlsx=True)
+
 
-    for idx, (file_path, record) in enumerate(
-        iter_records(data_dir, target_file, limit), start=1
-    ):
-        record_context = format_record_context(record)
-        name = normalize_value(record.get("ИО")) or "Сотрудник"
-        position = normalize_value(record.get("Должность")) or "Сотрудник"
-        city = normalize_value(record.get("Город чист")) or "Не указан"
-        birthdate = normalize_value(record.get("День рождения")) or "Не указана"
-        zodiac_sign = normalize_value(record.get("Знак зодиака")) or "Не указан"
-        zodiac_animal = normalize_value(record.get("Китайский календарь")) or "Не указан"
-        pinyin = normalize_value(record.get("Пиньинь")) or "Не указан"
+def generate_horoscopes(
+    data_dir: str,
+    limit: Optional[int],
+    target_file: Optional[str],
+    output_dir: str,
+    resume: Optional[str] = None,
+    pack_size: int = 1,
+    shard: Shard = None,
+    regenerate_rounds: int = REGENERATE_ROUNDS,
+) -> str:
+    """Основной цикл генерации гороскопов (pack_size > 1 — по несколько сотрудников в запросе).
+
+    Затем до regenerate_rounds раз перезапрашиваются гороскопы, не прошедшие проверку структуры.
+    """
+    cache = ResponseCache.from_env()
+    telemetry = Telemetry.from_env("horoscope")
+    validator = GPT_Validator(
+        rate_limiter=RateLimiter.from_env(),
+        retry_policy=make_retry_policy(),
+        cache=cache,
+        telemetry=telemetry,
+        hedge_policy=HedgePolicy.from_env(),
+    )
+    journal, output_path = open_run(output_dir, resume, shard)
+    done = journal.done_keys()
+    pending = iter_pending(iter_keyed_records(data_dir, target_file, limit), done, shard)
+
+    if pack_size > 1:
+        pack_validator = make_pack_validator(validator)
+        for pack in iter_packs(pending, pack_size):
+            print(f"[{pack[0][0]}-{pack[-1][0]}] Пакет из {len(pack)} записей")
+            for idx, key, row in generate_pack(validator, pack_validator, pack):
+                journal.append(key, row, order=idx)
+                if idx % CHECKPOINT_EVERY == 0:
+                    compact_journal(journal, output_path)
+    else:
+        for idx, key, file_path, record in pending:
+            record_context = format_record_context(record)
+
+            print(f"[{idx}] Обработка записи из файла {os.path.basename(file_path)}")
+            print(record_context)
+
+            horoscope, error = request_horoscope(validator, record)
+            if error is not None:
+                print(f"Ошибка при обращении к LLM: {error}")
+
+            journal.append(key, build_result_row(file_path, record, horoscope, error), order=idx)
+
+            if idx % CHECKPOINT_EVERY == 0:
+                compact_journal(journal, output_path)
 
+    regenerate_failed(validator, journal, regenerate_rounds)
+    if done:
+        print(f"Пропущено {len(done)} записей, завершенных в прошлых запусках")
+    if cache is not None:
+        print(cache.summary())
+    if validator.hedge_policy is not None:
+        print(validator.hedge_policy.summary())
+    if validator.endpoint_pool is not None:
+        print(validator.endpoint_pool.summary())
+    print(telemetry.format_summary())
+    telemetry.close()
+    return compact_journal(journal, output_path, final=True)
 
+
+async def _generate_horoscopes_async(
+    records: Iterable[Tuple[str, str, Dict[str, Any]]],
+    concurrency: int,
+    journal: JsonlJournal,
+    output_path: str,
+    pack_size: int = 1,
+    shard: Shard = None,
+    regenerate_rounds: int = REGENERATE_ROUNDS,
+) -> None:
+    """Запускает запросы (или пакеты записей) конкурентно, не более concurrency одновременно."""
+    cache = ResponseCache.from_env()
+    telemetry = Telemetry.from_env("horoscope")
+    validator = AsyncGPT_Validator(
+        rate_limiter=RateLimiter.from_env(),
+        retry_policy=make_retry_policy(),
+        cache=cache,
+        telemetry=telemetry,
+        hedge_policy=HedgePolicy.from_env(),
+    )
+    done = journal.done_keys()
+    written = 0
+
+    def append(idx: int, key: str, row: Dict[str, Any]) -> None:
+        nonlocal written
+        # Порядок входа восстанавливается по order при сборке из журнала.
+        journal.append(key, row, order=idx)
+        # Контрольные точки считаются по записям: пакет дает сразу несколько строк.
+        written += 1
+        if written % CHECKPOINT_EVERY == 0:
+            compact_journal(journal, output_path)
+
+    async def process(item: PackItem) -> None:
+        idx, key, file_path, record = item
         print(f"[{idx}] Обработка записи из файла {os.path.basename(file_path)}")
-        print(record_context)
-        
-        try:
-            full_prompt = prompt_template.format(
-                name=name,
-                position=position,
-                city=city,
-                birthdate=birthdate,
-                zodiac_sign=zodiac_sign,
-                zodiac_animal=zodiac_animal,
-                pinyin=pinyin,
-                # context=record_context
-            )
-            # Передаем пробел вторым аргументом, так как контекст уже вшит в промт
-            horoscope = validator(full_prompt, " ")
-        except Exception as exc:
-            print(f"Ошибка при обращении к LLM: {exc}")
-            continue
+        horoscope, error = await request_horoscope_async(validator, record)
+        if error is not None:
+            print(f"[{idx}] Ошибка при обращении к LLM: {error}")
+        append(idx, key, build_result_row(file_path, record, horoscope, error))
 
-        printable_record = serialize_record(record)
-        printable_record["source_file"] = os.path.basename(file_path)
-        printable_record["horoscope"] = horoscope
-        results.append(printable_record)
+    pack_validator = make_pack_validator(validator)
 
-        if idx % 300 == 0:
-            pd.DataFrame(results).to_csv(output_path, index=False)
-            print(f"Промежуточное сохранение {len(results)} записей в {output_path}")
+    async def process_pack(pack: List[PackItem]) -> None:
+        print(f"[{pack[0][0]}-{pack[-1][0]}] Пакет из {len(pack)} записей")
+        for idx, key, row in await generate_pack_async(validator, pack_validator, pack):
+            append(idx, key, row)
 
-    if results:
-        pd.DataFrame(results).to_csv(output_path, index=False)
-        print(f"Сохранено {len(results)} гороскопов в {output_path}")
-        return output_path
+    pending = iter_pending(records, done, shard)
+    units: Iterator[Any] = iter_packs(pending, pack_size) if pack_size > 1 else pending
+    handle = process_pack if pack_size > 1 else process
 
-    print("Не удалось получить ни одного гороскопа")
-    return ""
+    async def worker() -> None:
+        # Воркеры берут записи из общего итератора по одной, когда освобождаются:
+        # в работе не больше concurrency задач, и входные файлы не читаются целиком заранее.
+        for unit in units:
+            await handle(unit)
+
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+
+    await regenerate_failed_async(validator, journal, regenerate_rounds, concurrency)
+    if done:
+        print(f"Пропущено {len(done)} записей, завершенных в прошлых запусках")
+    if cache is not None:
+        print(cache.summary())
+    if validator.hedge_policy is not None:
+        print(validator.hedge_policy.summary())
+    if validator.endpoint_pool is not None:
+        print(validator.endpoint_pool.summary())
+    print(telemetry.format_summary())
+    telemetry.close()
+
+
+def generate_horoscopes_batch(
+    data_dir: str,
+    limit: Optional[int],
+    target_file: Optional[str],
+    output_dir: str,
+    resume: Optional[str] = None,
+    runner_name: Optional[str] = None,
+    shard: Shard = None,
+    regenerate_rounds: int = REGENERATE_ROUNDS,
+) -> str:
+    """Генерация одним пакетным заданием: промты в JSONL, ответы — обратно в журнал и CSV.
+
+    custom_id строки пакета — ключ записи журнала (bitrix:<BitrixId>). id
+    отправленного задания сохраняется рядом с журналом, поэтому --resume
+    продолжает ждать то же задание, а не отправляет пакет заново.
+    Гороскопы, не прошедшие проверку, перезапрашиваются обычными вызовами —
+    их обычно единицы, и ждать ради них еще одно задание невыгодно.
+    """
+    journal, output_path = open_run(output_dir, resume, shard)
+    run_base = output_path[: -len(".csv")]
+    input_path = f"{run_base}.batch_input.jsonl"
+    results_path = f"{run_base}.batch_output.jsonl"
+    state_path = f"{run_base}.batch.json"
+    done = journal.done_keys()
+
+    pending: Dict[str, Tuple[int, str, Dict[str, Any]]] = {
+        key: (idx, file_path, record)
+        for idx, key, file_path, record in iter_pending(
+            iter_keyed_records(data_dir, target_file, limit), done, shard
+        )
+    }
+    if done:
+        print(f"Пропущено {len(done)} записей, завершенных в прошлых запусках")
+    if not pending:
+        return recheck_journal(journal, output_path, regenerate_rounds)
+
+    runner = get_batch_runner(runner_name)
+    batch_id = None
+    if os.path.exists(state_path):
+        with open(state_path, encoding="utf-8") as f:
+            batch_id = json.load(f)["batch_id"]
+        print(f"Продолжение пакетного задания {batch_id}")
+    else:
+        model = resolve_model()
+        count = write_batch_file(
+            input_path,
+            (
+                make_batch_request(
+                    key,
+                    build_horoscope_prompt(record),
+                    model,
+                    GPT_Validator.temperature,
+                    GPT_Validator.max_tokens,
+                )
+                for key, (idx, file_path, record) in pending.items()
+            ),
+        )
+        print(f"Записано {count} запросов в {input_path}")
+        batch_id = runner.submit(input_path)
+        with open(state_path, "w", encoding="utf-8") as f:
+            json.dump({"batch_id": batch_id, "input_path": input_path}, f)
+
+    outcome = runner.run(input_path, results_path, batch_id=batch_id)
+    results = load_batch_results([outcome.output_path, outcome.error_path])
+    print(f"Пакет {outcome.batch_id}: {outcome.status}, получено результатов {len(results)} из {len(pending)}")
+
+    for key, (idx, file_path, record) in pending.items():
+        result = results.get(key)
+        if result is None:
+            horoscope, error = None, f"batch: нет результата (статус задания {outcome.status})"
+        else:
+            horoscope, error = result.text, result.error
+        journal.append(key, build_result_row(file_path, record, horoscope, error), order=idx)
+
+    # Задание отработано: следующий --resume отправит новый пакет из оставшихся ошибок.
+    os.remove(state_path)
+    return recheck_journal(journal, output_path, regenerate_rounds)
+
+
+def generate_horoscopes_async(
+    data_dir: str,
+    limit: Optional[int],
+    target_file: Optional[str],
+    output_dir: str,
+    concurrency: int = 16,
+    resume: Optional[str] = None,
+    pack_size: int = 1,
+    shard: Shard = None,
+    regenerate_rounds: int = REGENERATE_ROUNDS,
+) -> str:
+    """Конкурентная генерация гороскопов через асинхронный клиент OpenAI."""
+    journal, output_path = open_run(output_dir, resume, shard)
+    records = iter_keyed_records(data_dir, target_file, limit)
+
+    asyncio.run(
+        _generate_horoscopes_async(
+            records, concurrency, journal, output_path,
+            pack_size=pack_size, shard=shard, regenerate_rounds=regenerate_rounds,
+        )
+    )
+
+    return compact_journal(journal, output_path, final=True)
+
+
+def run_generation(
+    data_dir: str,
+    limit: Optional[int],
+    target_file: Optional[str],
+    output_dir: str,
+    concurrency: int = 1,
+    resume: Optional[str] = None,
+    batch: bool = False,
+    batch_runner: Optional[str] = None,
+    pack_size: int = 1,
+    shard: Optional[str] = None,
+    regenerate_rounds: int = REGENERATE_ROUNDS,
+) -> str:
+    """Выбирает пакетный, последовательный или конкурентный режим.
+
+    shard="i/N" — обработать только i-ю из N долей записей (разбиение по
+    хэшу ключа записи) и записать отдельную часть; части собирает merge_parts.
+    """
+    shard_value = parse_shard(shard)
+    if shard_value is not None:
+        print(f"Шард {shard_value[0]} из {shard_value[1]}")
+    if batch:
+        return generate_horoscopes_batch(
+            data_dir, limit, target_file, output_dir,
+            resume=resume, runner_name=batch_runner, shard=shard_value, regenerate_rounds=regenerate_rounds,
+        )
+    pack_size = resolve_pack_size(pack_size)
+    if concurrency and concurrency > 1:
+        return generate_horoscopes_async(
+            data_dir, limit, target_file, output_dir,
+            concurrency=concurrency, resume=resume, pack_size=pack_size, shard=shard_value,
+            regenerate_rounds=regenerate_rounds,
+        )
+    return generate_horoscopes(
+        data_dir, limit, target_file, output_dir,
+        resume=resume, pack_size=pack_size, shard=shard_value, regenerate_rounds=regenerate_rounds,
+    )
 
 
 def run_from_ide_config() -> bool:
     """Позволяет запускать скрипт из IDE с настройками выше."""
+    if len(sys.argv) > 1 or not IDE_RUN_CONFIG.get("enabled"):
+        return False
+
     limit = IDE_RUN_CONFIG.get("limit")
     limit_value: Optional[int] = limit if limit and limit > 0 else None
 
-    generate_horoscopes(
+    if IDE_RUN_CONFIG.get("merge") is not None:
+        merge_parts(
+            IDE_RUN_CONFIG["merge"],
+            data_dir=IDE_RUN_CONFIG.get("data_dir", DEFAULT_DATA_DIR),
+            limit=limit_value,
+            target_file=IDE_RUN_CONFIG.get("target_file"),
+            output_dir=IDE_RUN_CONFIG.get("output_dir", DEFAULT_OUTPUT_DIR),
+        )
+        return True
+
+    if IDE_RUN_CONFIG.get("recheck"):
+        recheck_run(
+            IDE_RUN_CONFIG.get("output_dir", DEFAULT_OUTPUT_DIR),
+            IDE_RUN_CONFIG["recheck"],
+            rounds=IDE_RUN_CONFIG.get("regenerate_rounds", REGENERATE_ROUNDS),
+            concurrency=IDE_RUN_CONFIG.get("concurrency", 1),
+            shard=IDE_RUN_CONFIG.get("shard"),
+        )
+        return True
+
+    run_generation(
         data_dir=IDE_RUN_CONFIG.get("data_dir", DEFAULT_DATA_DIR),
         limit=limit_value,
         target_file=IDE_RUN_CONFIG.get("target_file"),
         output_dir=IDE_RUN_CONFIG.get("output_dir", DEFAULT_OUTPUT_DIR),
+        concurrency=IDE_RUN_CONFIG.get("concurrency", 1),
+        resume=IDE_RUN_CONFIG.get("resume"),
+        batch=IDE_RUN_CONFIG.get("batch", False),
+        batch_runner=IDE_RUN_CONFIG.get("batch_runner"),
+        pack_size=IDE_RUN_CONFIG.get("pack_size", 1),
+        shard=IDE_RUN_CONFIG.get("shard"),
+        regenerate_rounds=IDE_RUN_CONFIG.get("regenerate_rounds", REGENERATE_ROUNDS),
     )
     return True
 
 
+def parse_args() -> argparse.Namespace:
+    """Разбирает аргументы командной строки."""
+    parser = argparse.ArgumentParser(description="Генерация гороскопов для сотрудников")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR, help="Папка с xlsx файлами")
+    parser.add_argument("--target-file", default=None, help="Имя конкретного xlsx файла")
+    parser.add_argument("--limit", type=int, default=None, help="Максимум записей")
+    parser.add_argument("--output-dir", default=DEFAULT_OUTPUT_DIR, help="Папка для результатов")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=1,
+        help="Число одновременных запросов к LLM (1 — последовательно)",
+    )
+    parser.add_argument(
+        "--resume",
+        nargs="?",
+        const="latest",
+        default=None,
+        help="Продолжить запуск по журналу (путь к *.journal.jsonl, по умолчанию самый свежий)",
+    )
+    parser.add_argument(
+        "--shard",
+        default=None,
+        metavar="I/N",
+        help="Обработать только i-ю из N долей записей (по хэшу BitrixId) в отдельную часть",
+    )
+    parser.add_argument(
+        "--merge",
+        nargs="*",
+        metavar="JOURNAL",
+        default=None,
+        help="Собрать части шардов (*.journal.jsonl; без аргументов — все части в --output-dir) в итоговый CSV/XLSX",
+    )
+    parser.add_argument(
+        "--regenerate-rounds",
+        type=int,
+        default=REGENERATE_ROUNDS,
+        help="Раунды перегенерации гороскопов, не прошедших проверку структуры (0 — только отметить)",
+    )
+    parser.add_argument(
+        "--recheck",
+        nargs="?",
+        const="latest",
+        default=None,
+        metavar="JOURNAL",
+        help="Проверить готовый запуск и перегенерировать только не прошедшие проверку гороскопы",
+    )
+    parser.add_argument(
+        "--pack-size",
+        type=int,
+        default=1,
+        help="Сотрудников в одном запросе (JSON-ответ); ограничивается HOROSCOPE_PACK_MAX_TOKENS",
+    )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="Отправить все промты одним пакетным заданием (Batch API) и дождаться результатов",
+    )
+    parser.add_argument(
+        "--batch-runner",
+        choices=BATCH_RUNNERS,
+        default=None,
+        help="Исполнитель пакета: api или local (по умолчанию LLM_BATCH_RUNNER из .env)",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    limit_value = args.limit if args.limit and args.limit > 0 else None
+    if args.merge is not None:
+        merge_parts(args.merge, args.data_dir, limit_value, args.target_file, args.output_dir)
+        return
+    if args.recheck is not None:
+        recheck_run(args.output_dir, args.recheck, args.regenerate_rounds, args.concurrency, args.shard)
+        return
+    run_generation(
+        data_dir=args.data_dir,
+        limit=limit_value,
+        target_file=args.target_file,
+        output_dir=args.output_dir,
+        concurrency=args.concurrency,
+        resume=args.resume,
+        batch=args.batch,
+        batch_runner=args.batch_runner,
+        pack_size=args.pack_size,
+        shard=args.shard,
+        regenerate_rounds=args.regenerate_rounds,
+    )
+
 
 if __name__ == "__main__":
-    run_from_ide_config()
+    if not run_from_ide_config():
+        main()
@@ -0,0 +1,128 @@
+"""Журналы результатов только на дозапись.
+
+Каждая завершенная запись дописывается сразу после получения ответа, поэтому
+падение процесса теряет не больше одной строки. При чтении побеждает
+последняя запись с данным ключом, а оборванная последняя строка (падение
+посреди записи) пропускается.
+
+JsonlJournal — служебный журнал в JSON Lines (гороскопы), AppendOnlyTableWriter —
+человекочитаемая таблица CSV/TSV (результаты проверки чатов).
+"""
+
+import csv
+import json
+import os
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import pandas as pd
+
+
+class JsonlJournal:
+    """Журнал {key, order, row} с дозаписью и чтением по ключу."""
+
+    def __init__(self, path: str, fsync: bool = False):
+        self.path = path
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+    def append(self, key: str, row: Dict[str, Any], order: Optional[int] = None) -> None:
+        line = json.dumps({"key": key, "order": order, "row": row}, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+
+    def iter_entries(self) -> Iterator[Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as f:
+            for line_number, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"Пропущена поврежденная строка {line_number} журнала {self.path}")
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        """Последняя запись по каждому ключу."""
+        return {entry["key"]: entry for entry in self.iter_entries()}
+
+    def done_keys(self) -> set:
+        """Ключи записей, завершившихся без ошибки."""
+        return {
+            key
+            for key, entry in self.load().items()
+            if not (entry.get("row") or {}).get("error")
+        }
+
+
+class AppendOnlyTableWriter:
+    """Таблица CSV/TSV, в которую строки только дописываются.
+
+    Заголовок пишется один раз при создании файла. Повторно обработанный ключ
+    дописывается новой строкой; compact() оставляет последнюю строку по ключу.
+    """
+
+    def __init__(self, path: str, columns: Sequence[str], key_column: str, sep: str = "\t"):
+        self.path = path
+        self.columns: List[str] = list(columns)
+        self.key_column = key_column
+        self.sep = sep
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        existing = self._existing_columns()
+        if existing and existing != self.columns:
+            # Не ломаем файл предыдущего запуска: дописываем строки в его формате.
+            print(f"Таблица {path} создана с колонками {existing}, новые строки пишутся в ее формате")
+            self.columns = existing
+
+    def _existing_columns(self) -> List[str]:
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return []
+        with open(self.path, encoding="utf-8", newline="") as f:
+            return next(csv.reader(f, delimiter=self.sep), [])
+
+    def _read(self) -> pd.DataFrame:
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return pd.DataFrame(columns=self.columns)
+        return pd.read_csv(self.path, sep=self.sep, dtype={self.key_column: str}, on_bad_lines="skip")
+
+    def done_keys(self, error_column: Optional[str] = "error") -> set:
+        """Ключи, уже записанные без ошибки (для продолжения прерванного запуска)."""
+        df = self._read()
+        if df.empty:
+            return set()
+        if error_column and error_column in df.columns:
+            # Учитываем только последнюю строку по ключу: успешный повтор перекрывает ошибку.
+            df = df.drop_duplicates(self.key_column, keep="last")
+            df = df[df[error_column].isna()]
+        return set(df[self.key_column].astype(str))
+
+    def append(self, row: Dict[str, Any]) -> None:
+        with self._lock:
+            new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+            with open(self.path, "a", encoding="utf-8", newline="") as f:
+                writer = csv.DictWriter(
+                    f, fieldnames=self.columns, delimiter=self.sep, extrasaction="ignore"
+                )
+                if new_file:
+                    writer.writeheader()
+                writer.writerow(row)
+
+    def compact(self) -> int:
+        """Убирает устаревшие дубли по ключу; возвращает число удаленных строк."""
+        with self._lock:
+            df = self._read()
+            compacted = df.drop_duplicates(self.key_column, keep="last")
+            removed = len(df) - len(compacted)
+            if removed:
+                compacted.to_csv(self.path, sep=self.sep, index=False)
+            return removed
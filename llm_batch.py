@@ -0,0 +1,248 @@
+"""Пакетный (batch) режим: запросы пишутся в JSONL и выполняются одним заданием.
+
+Для больших ночных запусков задержка отдельного ответа не важна, важны
+стоимость и пропускная способность. Batch API принимает файл JSONL, где
+каждая строка — самостоятельный запрос с custom_id, выполняет его в течение
+completion_window без поминутных лимитов и отдает файл результатов, который
+сопоставляется со входом по custom_id.
+
+Исполнители:
+- OpenAIBatchRunner — загрузка файла (purpose="batch"), создание задания,
+  опрос статуса и скачивание результатов и ошибок;
+- LocalBatchRunner — локальная замена: выполняет строки того же файла через
+  chat.completions (например, на mock_server.py) и пишет результат в формате
+  Batch API. Подходит для проверок и для провайдеров без Batch API.
+
+Исполнитель по умолчанию — LLM_BATCH_RUNNER в .env: "api" или "local".
+"""
+
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from llm_client import get_client
+from retry import describe_error
+
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+COMPLETION_WINDOW = "24h"
+# Статусы задания, после которых опрос прекращается
+FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+BATCH_RUNNERS = ("api", "local")
+
+
+def make_batch_request(
+    custom_id: str,
+    prompt: str,
+    model: str,
+    temperature: float,
+    max_tokens: int,
+    response_format: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """Строка входного файла: те же параметры, что у GPT_Validator._send."""
+    body: Dict[str, Any] = {
+        "model": model,
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": temperature,
+        "n": 1,
+        "max_tokens": max_tokens,
+    }
+    if response_format:
+        body["response_format"] = response_format
+    return {"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body}
+
+
+def write_batch_file(path: str, requests: Iterable[Dict[str, Any]]) -> int:
+    """Пишет запросы в JSONL; возвращает их число. custom_id должны быть уникальны."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    seen: set = set()
+    with open(path, "w", encoding="utf-8") as f:
+        for request in requests:
+            if request["custom_id"] in seen:
+                raise ValueError(f"Повтор custom_id в пакете: {request['custom_id']}")
+            seen.add(request["custom_id"])
+            f.write(json.dumps(request, ensure_ascii=False) + "\n")
+    return len(seen)
+
+
+def read_jsonl(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+@dataclass
+class BatchResult:
+    """Итог одного запроса пакета."""
+
+    custom_id: str
+    text: Optional[str] = None
+    usage: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+
+def parse_batch_line(line: Dict[str, Any]) -> BatchResult:
+    """Разбирает строку файла результатов (или ошибок) Batch API."""
+    result = BatchResult(custom_id=line.get("custom_id"))
+    if line.get("error"):
+        error = line["error"]
+        result.error = f"{error.get('code')}: {error.get('message')}" if isinstance(error, dict) else str(error)
+        return result
+    response = line.get("response") or {}
+    body = response.get("body") or {}
+    status_code = response.get("status_code")
+    if status_code != 200:
+        message = (body.get("error") or {}).get("message") if isinstance(body, dict) else body
+        result.error = f"batch ({status_code}): {message}"
+        return result
+    try:
+        result.text = body["choices"][0]["message"]["content"]
+    except (KeyError, IndexError, TypeError):
+        result.error = "batch: в ответе нет текста"
+    result.usage = body.get("usage")
+    return result
+
+
+def load_batch_results(paths: Iterable[Optional[str]]) -> Dict[str, BatchResult]:
+    """Результаты по custom_id из файлов результатов и ошибок."""
+    results: Dict[str, BatchResult] = {}
+    for path in paths:
+        if not path or not os.path.exists(path):
+            continue
+        for line in read_jsonl(path):
+            result = parse_batch_line(line)
+            # Успешный ответ не перекрывается ошибкой того же custom_id.
+            if result.custom_id not in results or result.error is None:
+                results[result.custom_id] = result
+    return results
+
+
+@dataclass
+class BatchOutcome:
+    """Файлы, полученные по завершении задания."""
+
+    batch_id: str
+    status: str
+    output_path: Optional[str] = None
+    error_path: Optional[str] = None
+
+
+class OpenAIBatchRunner:
+    """Выполнение пакета через Batch API (files + batches)."""
+
+    def __init__(self, client: Any = None, poll_interval: float = 30.0, completion_window: str = COMPLETION_WINDOW):
+        self._client = client
+        self.poll_interval = poll_interval
+        self.completion_window = completion_window
+
+    @property
+    def client(self) -> Any:
+        if self._client is None:
+            self._client = get_client()
+        return self._client
+
+    def submit(self, input_path: str, metadata: Optional[Dict[str, str]] = None) -> str:
+        """Загружает входной файл и создает задание; возвращает id задания."""
+        with open(input_path, "rb") as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        extra = {"metadata": metadata} if metadata else {}
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=self.completion_window,
+            **extra,
+        )
+        print(f"Создано пакетное задание {batch.id} (файл {input_file.id})")
+        return batch.id
+
+    def wait(self, batch_id: str) -> Any:
+        """Опрашивает задание до финального статуса."""
+        while True:
+            batch = self.client.batches.retrieve(batch_id)
+            counts = batch.request_counts
+            progress = f"{counts.completed + counts.failed}/{counts.total}" if counts else "-"
+            print(f"Пакет {batch_id}: {batch.status}, выполнено {progress}")
+            if batch.status in FINAL_STATUSES:
+                return batch
+            time.sleep(self.poll_interval)
+
+    def download(self, file_id: Optional[str], path: str) -> Optional[str]:
+        if not file_id:
+            return None
+        self.client.files.content(file_id).write_to_file(path)
+        return path
+
+    def run(self, input_path: str, output_path: str, batch_id: Optional[str] = None) -> BatchOutcome:
+        """Отправляет файл (или продолжает ждать задание batch_id) и скачивает результаты."""
+        if batch_id is None:
+            batch_id = self.submit(input_path)
+        batch = self.wait(batch_id)
+        error_path = os.path.splitext(output_path)[0] + ".errors.jsonl"
+        return BatchOutcome(
+            batch_id=batch_id,
+            status=batch.status,
+            output_path=self.download(batch.output_file_id, output_path),
+            error_path=self.download(batch.error_file_id, error_path),
+        )
+
+
+class LocalBatchRunner:
+    """Локальная замена Batch API: строки файла выполняются через chat.completions."""
+
+    def __init__(self, client: Any = None, workers: int = 4):
+        self._client = client
+        self.workers = max(1, workers)
+
+    @property
+    def client(self) -> Any:
+        if self._client is None:
+            self._client = get_client()
+        return self._client
+
+    def execute(self, index: int, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Одна строка результата в формате Batch API."""
+        line: Dict[str, Any] = {"id": f"local_req_{index}", "custom_id": request["custom_id"]}
+        try:
+            response = self.client.chat.completions.create(**request["body"])
+        except Exception as exc:
+            status_code = getattr(exc, "status_code", None)
+            if status_code is None:
+                line["response"] = None
+                line["error"] = {"code": type(exc).__name__, "message": describe_error(exc)}
+                return line
+            line["response"] = {"status_code": status_code, "body": {"error": {"message": describe_error(exc)}}}
+        else:
+            line["response"] = {"status_code": 200, "request_id": response.id, "body": response.model_dump()}
+        line["error"] = None
+        return line
+
+    def submit(self, input_path: str, metadata: Optional[Dict[str, str]] = None) -> str:
+        """Локальное задание не ставится в очередь: строки выполняет run."""
+        return f"local_{int(time.time())}"
+
+    def run(self, input_path: str, output_path: str, batch_id: Optional[str] = None) -> BatchOutcome:
+        requests: List[Dict[str, Any]] = list(read_jsonl(input_path))
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            lines = list(executor.map(self.execute, range(len(requests)), requests))
+        with open(output_path, "w", encoding="utf-8") as f:
+            for line in lines:
+                f.write(json.dumps(line, ensure_ascii=False) + "\n")
+        print(f"Локальный пакет: {len(lines)} запросов за {time.perf_counter() - started:.1f} сек")
+        return BatchOutcome(batch_id=batch_id or "local", status="completed", output_path=output_path)
+
+
+def get_batch_runner(name: Optional[str] = None) -> Any:
+    """Исполнитель по имени или по LLM_BATCH_RUNNER в .env (по умолчанию "api")."""
+    name = (name or os.getenv("LLM_BATCH_RUNNER") or "api").strip().lower()
+    if name not in BATCH_RUNNERS:
+        raise ValueError(f"Неизвестный исполнитель пакета: {name} (ожидается один из {BATCH_RUNNERS})")
+    if name == "local":
+        return LocalBatchRunner()
+    return OpenAIBatchRunner()
@@ -0,0 +1,193 @@
+"""Персистентный кэш ответов LLM в SQLite.
+
+Ключ — sha256 от (model, prompt, temperature, max_tokens), значение — JSON
+полного ответа chat.completions, так что из кэша возвращается тот же объект
+ChatCompletion (с usage), что и от API.
+
+Режимы (LLM_CACHE в .env или параметр mode):
+- "use" — читать и записывать (по умолчанию);
+- "refresh" — не читать, но перезаписывать свежими ответами;
+- "off" — кэш полностью выключен.
+
+Вытеснение: по возрасту (max_age, секунды), по числу записей (max_entries)
+и по суммарному размеру ответов (max_bytes); при переполнении удаляются
+давно не читанные записи.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from openai.types.chat import ChatCompletion
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CACHE_PATH = os.path.join(BASE_DIR, ".llm_cache.sqlite")
+CACHE_MODES = ("use", "refresh", "off")
+
+
+def make_cache_key(
+    model: str,
+    prompt: str,
+    temperature: float,
+    max_tokens: Optional[int],
+    response_format: Optional[Dict[str, Any]] = None,
+) -> str:
+    parts: List[Any] = [model, prompt, temperature, max_tokens]
+    if response_format:
+        # Добавляется только при наличии, чтобы не сдвигать ключи обычных запросов.
+        parts.append(response_format)
+    payload = json.dumps(parts, ensure_ascii=False, separators=(",", ":"), sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Кэш ответов, общий для потоков одного процесса."""
+
+    def __init__(
+        self,
+        path: str = DEFAULT_CACHE_PATH,
+        mode: str = "use",
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        max_age: Optional[float] = None,
+    ):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Неизвестный режим кэша: {mode} (ожидается один из {CACHE_MODES})")
+        self.path = path
+        self.mode = mode
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @classmethod
+    def from_env(cls) -> Optional["ResponseCache"]:
+        """Кэш по настройкам .env; None, если LLM_CACHE=off."""
+        mode = (os.getenv("LLM_CACHE") or "use").strip().lower()
+        if mode == "off":
+            return None
+        max_age_days = os.getenv("LLM_CACHE_MAX_AGE_DAYS")
+        max_entries = os.getenv("LLM_CACHE_MAX_ENTRIES")
+        max_mb = os.getenv("LLM_CACHE_MAX_MB")
+        return cls(
+            path=os.getenv("LLM_CACHE_PATH") or DEFAULT_CACHE_PATH,
+            mode=mode,
+            max_entries=int(max_entries) if max_entries else None,
+            max_bytes=int(float(max_mb) * 1024 * 1024) if max_mb else None,
+            max_age=float(max_age_days) * 86400 if max_age_days else None,
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    model TEXT,
+                    response TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed_at)")
+            self._conn = conn
+        return self._conn
+
+    def get(self, key: str) -> Optional[ChatCompletion]:
+        """Возвращает сохраненный ответ или None (промах)."""
+        if self.mode != "use":
+            return None
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self.max_age is not None and now - row[1] > self.max_age:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                conn.commit()
+                self.stats["evictions"] += 1
+                row = None
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            conn.commit()
+            self.stats["hits"] += 1
+        return ChatCompletion.model_validate(json.loads(row[0]))
+
+    def put(self, key: str, response: Any) -> None:
+        """Сохраняет ответ API и применяет правила вытеснения."""
+        if not self.enabled:
+            return
+        data = response.model_dump_json() if hasattr(response, "model_dump_json") else json.dumps(response)
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, getattr(response, "model", None), data, len(data), now, now),
+            )
+            self.stats["writes"] += 1
+            self._evict(conn, now)
+            conn.commit()
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        removed = 0
+        if self.max_age is not None:
+            removed += conn.execute(
+                "DELETE FROM responses WHERE created_at < ?", (now - self.max_age,)
+            ).rowcount
+        if self.max_entries is not None:
+            removed += conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                " SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            ).rowcount
+        if self.max_bytes is not None:
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_bytes:
+                rows = conn.execute(
+                    "SELECT key, size FROM responses ORDER BY accessed_at ASC"
+                ).fetchall()
+                for key, size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    total -= size
+                    removed += 1
+        self.stats["evictions"] += removed
+
+    def clear(self) -> None:
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM responses")
+            conn.commit()
+
+    def summary(self) -> str:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        hit_rate = self.stats["hits"] / lookups if lookups else 0.0
+        return (
+            f"Кэш LLM ({self.mode}): попаданий {self.stats['hits']}, промахов {self.stats['misses']} "
+            f"({hit_rate:.0%}), записано {self.stats['writes']}, вытеснено {self.stats['evictions']}"
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,730 @@
+"""Общий клиентский слой LLM: пул HTTP-соединений, таймауты и валидаторы.
+
+Клиенты OpenAI/AsyncOpenAI создаются лениво, при первом запросе: импорт
+модуля не открывает соединений. Все валидаторы процесса разделяют один
+пул соединений (синхронный клиент — общий на процесс, асинхронный — по
+одному на event loop), поэтому конкурентные запуски не платят за установку
+соединений и не упираются в лимиты пула httpx по умолчанию.
+
+Настройки из окружения (.env):
+- API_KEY, BASE_URL — доступ к API;
+- LLM_MAX_CONNECTIONS — размер пула (по умолчанию 100);
+- LLM_MAX_KEEPALIVE — сколько соединений держать открытыми (по умолчанию 20);
+- LLM_KEEPALIVE_EXPIRY — сколько секунд держать простаивающее соединение (30);
+- LLM_HTTP2 — 1, чтобы включить HTTP/2 (нужен пакет h2);
+- LLM_CONNECT_TIMEOUT, LLM_READ_TIMEOUT, LLM_POOL_TIMEOUT — таймауты, сек;
+- LLM_MAX_RETRIES — встроенные повторы клиента (если не задан retry_policy).
+
+Модель: явный параметр > MODEL в .env > DEFAULT_MODEL.
+
+С параметром telemetry валидаторы отправляют событие о каждом вызове
+(задержка, попытки, токены, статус) — см. telemetry.py.
+
+Если в .env настроено несколько ключей/шлюзов (API_KEY_2, BASE_URL_2, ...),
+каждая попытка вызова получает endpoint из общего пула — см. endpoints.py.
+Клиенты endpoint-ов — копии общего клиента с тем же пулом соединений.
+
+С параметром hedge_policy медленная попытка дублируется после порога,
+выученного по недавним вызовам; первый ответ побеждает — см. hedging.py.
+"""
+
+import asyncio
+import importlib.util
+import os
+import threading
+import time
+import weakref
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+from dotenv import load_dotenv
+from openai import AsyncOpenAI, OpenAI
+from openai.types import CompletionUsage
+from openai.types.chat import ChatCompletion
+
+from endpoints import Endpoint, EndpointPool, get_endpoint_pool
+from hedging import HedgeOutcome, HedgePolicy
+from llm_cache import ResponseCache, make_cache_key
+from rate_limiter import RateLimiter
+from retry import RetryPolicy, describe_error
+from telemetry import CallEvent, Telemetry
+from tokens import count_tokens
+
+load_dotenv()
+
+
+DEFAULT_MODEL = "openai/gpt-4o-mini" # id модели из списка моделей - можно использовать OpenAI, Anthropic и пр. меняя только этот параметр
+
+
+def resolve_model(model: Optional[str] = None) -> str:
+    """Модель вызова: явный параметр, затем MODEL из окружения, затем DEFAULT_MODEL."""
+    return model or os.getenv("MODEL") or DEFAULT_MODEL
+
+
+def _env_number(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+@dataclass
+class ClientSettings:
+    """Параметры HTTP-клиента, общие для синхронного и асинхронного вариантов."""
+
+    api_key: Optional[str] = None
+    base_url: Optional[str] = None
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+    http2: bool = False
+    connect_timeout: float = 10.0
+    read_timeout: float = 600.0
+    write_timeout: float = 60.0
+    pool_timeout: float = 30.0
+    max_retries: int = 2
+
+    @classmethod
+    def from_env(cls) -> "ClientSettings":
+        defaults = cls()
+        return cls(
+            # ваш ключ в VseGPT после регистрации; API_KEY_1 / BASE_URL_1 — то же для пула endpoint-ов
+            api_key=os.getenv("API_KEY") or os.getenv("API_KEY_1"),
+            base_url=os.getenv("BASE_URL") or os.getenv("BASE_URL_1"),
+            max_connections=int(_env_number("LLM_MAX_CONNECTIONS", defaults.max_connections)),
+            max_keepalive_connections=int(_env_number("LLM_MAX_KEEPALIVE", defaults.max_keepalive_connections)),
+            keepalive_expiry=_env_number("LLM_KEEPALIVE_EXPIRY", defaults.keepalive_expiry),
+            http2=(os.getenv("LLM_HTTP2") or "").strip().lower() in ("1", "true", "yes"),
+            connect_timeout=_env_number("LLM_CONNECT_TIMEOUT", defaults.connect_timeout),
+            read_timeout=_env_number("LLM_READ_TIMEOUT", defaults.read_timeout),
+            pool_timeout=_env_number("LLM_POOL_TIMEOUT", defaults.pool_timeout),
+            max_retries=int(_env_number("LLM_MAX_RETRIES", defaults.max_retries)),
+        )
+
+    def http_options(self) -> Dict[str, Any]:
+        """Общие аргументы httpx.Client / httpx.AsyncClient."""
+        http2 = self.http2
+        if http2 and importlib.util.find_spec("h2") is None:
+            print("Предупреждение: для HTTP/2 нужен пакет h2 (pip install httpx[http2]), используется HTTP/1.1")
+            http2 = False
+        return {
+            "limits": httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive_connections,
+                keepalive_expiry=self.keepalive_expiry,
+            ),
+            "timeout": httpx.Timeout(
+                self.read_timeout,
+                connect=self.connect_timeout,
+                write=self.write_timeout,
+                pool=self.pool_timeout,
+            ),
+            "http2": http2,
+            "follow_redirects": True,
+        }
+
+
+_settings: Optional[ClientSettings] = None
+# Ключ — max_retries или (номер endpoint-а, max_retries); None — базовый клиент с настройками .env
+_sync_clients: Dict[Any, OpenAI] = {}
+# У каждого event loop свои клиенты: httpx.AsyncClient привязан к циклу, в котором открыл соединения
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Any, AsyncOpenAI]]" = (
+    weakref.WeakKeyDictionary()
+)
+_clients_lock = threading.Lock()
+
+
+def get_settings() -> ClientSettings:
+    global _settings
+    with _clients_lock:
+        if _settings is None:
+            _settings = ClientSettings.from_env()
+        return _settings
+
+
+def configure_clients(settings: Optional[ClientSettings] = None) -> None:
+    """Задает настройки клиентов (None — заново из окружения); созданные клиенты пересоздаются."""
+    global _settings
+    with _clients_lock:
+        _settings = settings
+        base = _sync_clients.get(None)
+        _sync_clients.clear()
+        _async_clients.clear()
+    if base is not None:
+        # Копии with_options разделяют httpx.Client базового клиента — закрываем его один раз.
+        base.close()
+
+
+def _client_key(max_retries: Optional[int], endpoint: Optional[Endpoint]) -> Any:
+    return max_retries if endpoint is None else (endpoint.index, max_retries)
+
+
+def _client_options(max_retries: Optional[int], endpoint: Optional[Endpoint]) -> Dict[str, Any]:
+    """Отличия копии от базового клиента: повторы и ключ/шлюз endpoint-а."""
+    options: Dict[str, Any] = {}
+    if max_retries is not None:
+        options["max_retries"] = max_retries
+    if endpoint is not None:
+        options["api_key"] = endpoint.api_key
+        options["base_url"] = endpoint.base_url
+    return options
+
+
+def get_client(max_retries: Optional[int] = None, endpoint: Optional[Endpoint] = None) -> OpenAI:
+    """Общий синхронный клиент; max_retries=0 — вариант без встроенных повторов на том же пуле.
+
+    endpoint — клиент с ключом и шлюзом endpoint-а из пула (endpoints.py).
+    """
+    settings = get_settings()
+    key = _client_key(max_retries, endpoint)
+    with _clients_lock:
+        client = _sync_clients.get(key)
+        if client is not None:
+            return client
+        base = _sync_clients.get(None)
+        if base is None:
+            base = OpenAI(
+                api_key=settings.api_key,
+                base_url=settings.base_url,
+                max_retries=settings.max_retries,
+                http_client=httpx.Client(**settings.http_options()),
+            )
+            _sync_clients[None] = base
+        options = _client_options(max_retries, endpoint)
+        client = base.with_options(**options) if options else base
+        _sync_clients[key] = client
+        return client
+
+
+def get_async_client(max_retries: Optional[int] = None, endpoint: Optional[Endpoint] = None) -> AsyncOpenAI:
+    """Общий асинхронный клиент текущего event loop (вызывать внутри корутины)."""
+    settings = get_settings()
+    loop = asyncio.get_running_loop()
+    key = _client_key(max_retries, endpoint)
+    with _clients_lock:
+        clients = _async_clients.setdefault(loop, {})
+        client = clients.get(key)
+        if client is not None:
+            return client
+        base = clients.get(None)
+        if base is None:
+            base = AsyncOpenAI(
+                api_key=settings.api_key,
+                base_url=settings.base_url,
+                max_retries=settings.max_retries,
+                http_client=httpx.AsyncClient(**settings.http_options()),
+            )
+            clients[None] = base
+        options = _client_options(max_retries, endpoint)
+        client = base.with_options(**options) if options else base
+        clients[key] = client
+        return client
+
+
+@dataclass
+class StreamStats:
+    """Замеры одного потокового вызова."""
+
+    ttft: Optional[float] = None  # от отправки запроса до первого токена, сек
+    total_time: float = 0.0  # от отправки запроса до конца потока, сек
+    output_tokens: int = 0
+    chunks: int = 0  # фрагментов с текстом
+    inter_token_latency: Optional[float] = None  # средний интервал между фрагментами, сек
+    max_inter_token_latency: Optional[float] = None
+    tokens_per_second: Optional[float] = None  # скорость генерации после первого токена
+    cached: bool = False
+
+    def summary(self) -> str:
+        if self.cached:
+            return f"Ответ из кэша: {self.output_tokens} токенов"
+        parts = [f"TTFT {self.ttft:.2f} сек" if self.ttft is not None else "TTFT -"]
+        if self.inter_token_latency is not None:
+            parts.append(
+                f"интервал между токенами {self.inter_token_latency * 1000:.0f} мс "
+                f"(макс. {self.max_inter_token_latency * 1000:.0f} мс)"
+            )
+        if self.tokens_per_second is not None:
+            parts.append(f"{self.tokens_per_second:.1f} ток/сек")
+        parts.append(f"{self.output_tokens} токенов за {self.total_time:.2f} сек")
+        return ", ".join(parts)
+
+
+def record_call(
+    validator: Any,
+    started: float,
+    status: str,
+    usage: Any = None,
+    attempts: int = 1,
+    error: Optional[BaseException] = None,
+    stream: bool = False,
+    ttft: Optional[float] = None,
+    hedge: Optional[HedgeOutcome] = None,
+) -> None:
+    """Передает событие о вызове в телеметрию валидатора, если она подключена."""
+    telemetry = validator.telemetry
+    if telemetry is None:
+        return
+    telemetry.record(
+        CallEvent.from_usage(
+            usage,
+            timestamp=started,
+            run=telemetry.run,
+            model=validator.model,
+            status=status,
+            latency=time.time() - started,
+            attempts=attempts,
+            stream=stream,
+            ttft=ttft,
+            hedges=hedge.hedges if hedge is not None else 0,
+            hedge_won=hedge.won if hedge is not None else False,
+            error=describe_error(error) if error is not None else None,
+        )
+    )
+
+
+class CompletionStream:
+    """Итератор по фрагментам ответа по мере их прихода.
+
+    После исчерпания доступны text, response (ChatCompletion, собранный из
+    потока) и stats. Повторный обход отдает уже полученные фрагменты.
+    """
+
+    def __init__(self, validator: "GPT_Validator", prompt: str, response_format: Optional[Dict[str, Any]] = None):
+        self.validator = validator
+        self.prompt = prompt
+        self.response_format = response_format
+        self.parts: List[str] = []
+        self.response: Optional[ChatCompletion] = None
+        self.stats = StreamStats()
+        self._started = False
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts)
+
+    def __iter__(self) -> Iterator[str]:
+        if self._started:
+            return iter(list(self.parts))
+        self._started = True
+        return self.validator._iter_stream(self)
+
+class GPT_Validator:
+    temperature = 0.7
+    max_tokens = 3000 # максимальное число ВЫХОДНЫХ токенов. Для большинства моделей не должно превышать 4096
+    stream_usage = True # просить usage в последнем фрагменте потока (stream_options.include_usage)
+
+    def __init__(
+        self,
+        rate_limiter: Optional[RateLimiter] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        cache: Optional[ResponseCache] = None,
+        model: Optional[str] = None,
+        telemetry: Optional[Telemetry] = None,
+        hedge_policy: Optional[HedgePolicy] = None,
+        endpoint_pool: Optional[EndpointPool] = None,
+    ):
+        # Один лимитер (и один выключатель в retry_policy) можно передать нескольким валидаторам и потокам.
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy
+        self.cache = cache
+        self.telemetry = telemetry
+        self.hedge_policy = hedge_policy
+        # Без явного пула — общий пул процесса из .env (None, если endpoint один)
+        self.endpoint_pool = endpoint_pool if endpoint_pool is not None else get_endpoint_pool()
+        # Замеры всех потоковых вызовов этого валидатора (для анализа пропускной способности API)
+        self.stream_stats: List[StreamStats] = []
+        self._stats_lock = threading.Lock()
+        self.model = resolve_model(model)
+        self._client: Optional[OpenAI] = None
+
+    @property
+    def client(self) -> OpenAI:
+        """Общий клиент процесса (или заданный явно); создается при первом запросе."""
+        if self._client is not None:
+            return self._client
+        # Повторами управляет retry_policy, встроенные повторы клиента отключаем.
+        return get_client(max_retries=0 if self.retry_policy is not None else None)
+
+    @client.setter
+    def client(self, value: OpenAI) -> None:
+        self._client = value
+
+    def _acquire_client(self) -> Tuple[OpenAI, Optional[Endpoint]]:
+        """Клиент одной попытки: заданный явно, общий или клиент endpoint-а из пула."""
+        if self._client is not None or self.endpoint_pool is None:
+            return self.client, None
+        endpoint = self.endpoint_pool.acquire()
+        return get_client(max_retries=0 if self.retry_policy is not None else None, endpoint=endpoint), endpoint
+
+    def create_completion(self, prompt: str, response_format: Optional[Dict[str, Any]] = None):
+        """Отправляет готовый промт и возвращает полный ответ API (с usage).
+
+        response_format передается в API как есть, например {"type": "json_object"}.
+        """
+        cache_key = None
+        if self.cache is not None:
+            cache_key = make_cache_key(
+                self.model, prompt, self.temperature, self.max_tokens, response_format
+            )
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                record_call(self, time.time(), "cache_hit", cached.usage)
+                return cached
+
+        attempts = 0
+        hedge = HedgeOutcome()
+
+        def attempt():
+            nonlocal attempts
+            attempts += 1
+            if self.hedge_policy is None:
+                return self._send(prompt, response_format)
+            return self.hedge_policy.call(lambda: self._send(prompt, response_format), hedge)
+
+        started = time.time()
+        try:
+            response = attempt() if self.retry_policy is None else self.retry_policy.call(attempt)
+        except Exception as exc:
+            record_call(self, started, "error", attempts=attempts, error=exc, hedge=hedge)
+            raise
+        record_call(self, started, "ok", response.usage, attempts, hedge=hedge)
+
+        if cache_key is not None:
+            self.cache.put(cache_key, response)
+        return response
+
+    def _send(self, prompt: str, response_format: Optional[Dict[str, Any]] = None):
+        """Одна попытка вызова API с учетом лимитера."""
+        messages = []
+        messages.append({"role": "user", "content": prompt})
+        extra = {"response_format": response_format} if response_format else {}
+
+        reservation = None
+        if self.rate_limiter is not None:
+            reservation = self.rate_limiter.acquire(prompt, self.max_tokens)
+
+        usage = None
+        error: Optional[BaseException] = None
+        client, endpoint = self._acquire_client()
+        try:
+            response = client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=self.temperature,
+                n=1,
+                max_tokens=self.max_tokens,
+                extra_headers={ "X-Title": "My App" }, # опционально - передача информация об источнике API-вызова
+                **extra,
+            )
+            usage = response.usage
+            return response
+        except BaseException as exc:
+            error = exc
+            raise
+        finally:
+            if endpoint is not None:
+                self.endpoint_pool.release(endpoint, error)
+            if reservation is not None:
+                self.rate_limiter.reconcile(reservation, usage)
+
+    def stream_completion(
+        self, prompt: str, response_format: Optional[Dict[str, Any]] = None
+    ) -> CompletionStream:
+        """Потоковый вызов: фрагменты ответа отдаются по мере генерации.
+
+        Повторы (retry_policy) применяются только к открытию потока: после
+        первого фрагмента обрыв пробрасывается вызывающему.
+        """
+        return CompletionStream(self, prompt, response_format)
+
+    def _open_stream(self, prompt: str, response_format: Optional[Dict[str, Any]] = None):
+        """Открывает поток; возвращает (поток, резерв лимитера, endpoint из пула, время отправки)."""
+        messages = [{"role": "user", "content": prompt}]
+        extra: Dict[str, Any] = {"response_format": response_format} if response_format else {}
+        if self.stream_usage:
+            extra["stream_options"] = {"include_usage": True}
+
+        reservation = None
+        if self.rate_limiter is not None:
+            reservation = self.rate_limiter.acquire(prompt, self.max_tokens)
+        client, endpoint = self._acquire_client()
+        sent_at = time.perf_counter()
+        try:
+            response_stream = client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=self.temperature,
+                n=1,
+                max_tokens=self.max_tokens,
+                extra_headers={ "X-Title": "My App" },
+                stream=True,
+                **extra,
+            )
+        except Exception as exc:
+            if endpoint is not None:
+                self.endpoint_pool.release(endpoint, exc)
+            if reservation is not None:
+                self.rate_limiter.reconcile(reservation, None)
+            raise
+        return response_stream, reservation, endpoint, sent_at
+
+    def _iter_stream(self, stream: CompletionStream) -> Iterator[str]:
+        cache_key = None
+        if self.cache is not None:
+            cache_key = make_cache_key(
+                self.model, stream.prompt, self.temperature, self.max_tokens, stream.response_format
+            )
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                text = cached.choices[0].message.content or ""
+                stream.response = cached
+                stream.parts.append(text)
+                stream.stats = StreamStats(
+                    output_tokens=getattr(cached.usage, "completion_tokens", 0) or 0, cached=True
+                )
+                record_call(self, time.time(), "cache_hit", cached.usage, stream=True)
+                yield text
+                return
+
+        attempts = 0
+
+        def attempt():
+            nonlocal attempts
+            attempts += 1
+            return self._open_stream(stream.prompt, stream.response_format)
+
+        started = time.time()
+        try:
+            if self.retry_policy is None:
+                response_stream, reservation, endpoint, sent_at = attempt()
+            else:
+                response_stream, reservation, endpoint, sent_at = self.retry_policy.call(attempt)
+        except Exception as exc:
+            record_call(self, started, "error", attempts=attempts, error=exc, stream=True)
+            raise
+
+        usage = None
+        stream_error: Optional[BaseException] = None
+        response_id, created, finish_reason = None, None, None
+        first_at = last_at = None
+        gaps: List[float] = []
+        try:
+            for chunk in response_stream:
+                response_id = response_id or chunk.id
+                created = created or chunk.created
+                if chunk.usage is not None:
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                finish_reason = choice.finish_reason or finish_reason
+                delta = choice.delta.content if choice.delta is not None else None
+                if not delta:
+                    continue
+                now = time.perf_counter()
+                if first_at is None:
+                    first_at = now
+                else:
+                    gaps.append(now - last_at)
+                last_at = now
+                stream.parts.append(delta)
+                yield delta
+        except Exception as exc:
+            stream_error = exc
+            record_call(self, started, "error", attempts=attempts, error=exc, stream=True)
+            raise
+        finally:
+            # Срабатывает и при досрочном выходе вызывающего из цикла.
+            response_stream.close()
+            if endpoint is not None:
+                self.endpoint_pool.release(endpoint, stream_error)
+            if usage is None:
+                prompt_tokens = count_tokens(stream.prompt)
+                completion_tokens = count_tokens(stream.text)
+                usage = CompletionUsage(
+                    prompt_tokens=prompt_tokens,
+                    completion_tokens=completion_tokens,
+                    total_tokens=prompt_tokens + completion_tokens,
+                )
+            if reservation is not None:
+                self.rate_limiter.reconcile(reservation, usage)
+
+        finished_at = time.perf_counter()
+        stats = StreamStats(
+            total_time=finished_at - sent_at,
+            output_tokens=usage.completion_tokens,
+            chunks=len(stream.parts),
+        )
+        if first_at is not None:
+            stats.ttft = first_at - sent_at
+            generation_time = finished_at - first_at
+            if generation_time > 0:
+                stats.tokens_per_second = usage.completion_tokens / generation_time
+        if gaps:
+            stats.inter_token_latency = sum(gaps) / len(gaps)
+            stats.max_inter_token_latency = max(gaps)
+        stream.stats = stats
+        with self._stats_lock:
+            self.stream_stats.append(stats)
+        record_call(self, started, "ok", usage, attempts, stream=True, ttft=stats.ttft)
+
+        stream.response = ChatCompletion.model_validate(
+            {
+                "id": response_id or "stream",
+                "object": "chat.completion",
+                "created": created or int(time.time()),
+                "model": self.model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": stream.text},
+                        "finish_reason": finish_reason or "stop",
+                    }
+                ],
+                "usage": usage.model_dump(),
+            }
+        )
+        if cache_key is not None:
+            self.cache.put(cache_key, stream.response)
+
+    def gpt_validation(
+        self,
+        init_prompt: str,
+        dialogue: str,
+        response_format: Optional[Dict[str, Any]] = None,
+        stream: bool = False,
+    ):
+        """Текст ответа модели; при stream=True — CompletionStream с фрагментами ответа."""
+        prompt = init_prompt.format(str(dialogue))
+        if stream:
+            return self.stream_completion(prompt, response_format)
+        response_big = self.create_completion(prompt, response_format)
+
+        #print("Response BIG:",response_big)
+        return response_big.choices[0].message.content
+
+    def __call__(
+        self, p:str, d: str, response_format: Optional[Dict[str, Any]] = None, stream: bool = False
+    ):
+        return self.gpt_validation(p, d, response_format, stream)
+
+
+class AsyncGPT_Validator:
+    """Асинхронный вариант GPT_Validator для конкурентных запросов."""
+    temperature = 0.7
+    max_tokens = 3000
+
+    def __init__(
+        self,
+        rate_limiter: Optional[RateLimiter] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        cache: Optional[ResponseCache] = None,
+        model: Optional[str] = None,
+        telemetry: Optional[Telemetry] = None,
+        hedge_policy: Optional[HedgePolicy] = None,
+        endpoint_pool: Optional[EndpointPool] = None,
+    ):
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy
+        self.cache = cache
+        self.telemetry = telemetry
+        self.hedge_policy = hedge_policy
+        # Без явного пула — общий пул процесса из .env (None, если endpoint один)
+        self.endpoint_pool = endpoint_pool if endpoint_pool is not None else get_endpoint_pool()
+        self.model = resolve_model(model)
+        self._client: Optional[AsyncOpenAI] = None
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        """Общий клиент текущего event loop (или заданный явно)."""
+        if self._client is not None:
+            return self._client
+        return get_async_client(max_retries=0 if self.retry_policy is not None else None)
+
+    @client.setter
+    def client(self, value: AsyncOpenAI) -> None:
+        self._client = value
+
+    def _acquire_client(self) -> Tuple[AsyncOpenAI, Optional[Endpoint]]:
+        """Клиент одной попытки: заданный явно, общий или клиент endpoint-а из пула."""
+        if self._client is not None or self.endpoint_pool is None:
+            return self.client, None
+        endpoint = self.endpoint_pool.acquire()
+        return get_async_client(max_retries=0 if self.retry_policy is not None else None, endpoint=endpoint), endpoint
+
+    async def create_completion(self, prompt: str, response_format: Optional[Dict[str, Any]] = None):
+        """Отправляет готовый промт и возвращает полный ответ API (с usage)."""
+        cache_key = None
+        if self.cache is not None:
+            cache_key = make_cache_key(
+                self.model, prompt, self.temperature, self.max_tokens, response_format
+            )
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                record_call(self, time.time(), "cache_hit", cached.usage)
+                return cached
+
+        attempts = 0
+        hedge = HedgeOutcome()
+
+        async def attempt():
+            nonlocal attempts
+            attempts += 1
+            if self.hedge_policy is None:
+                return await self._send(prompt, response_format)
+            return await self.hedge_policy.call_async(lambda: self._send(prompt, response_format), hedge)
+
+        started = time.time()
+        try:
+            response = await (attempt() if self.retry_policy is None else self.retry_policy.call_async(attempt))
+        except Exception as exc:
+            record_call(self, started, "error", attempts=attempts, error=exc, hedge=hedge)
+            raise
+        record_call(self, started, "ok", response.usage, attempts, hedge=hedge)
+
+        if cache_key is not None:
+            self.cache.put(cache_key, response)
+        return response
+
+    async def _send(self, prompt: str, response_format: Optional[Dict[str, Any]] = None):
+        """Одна попытка вызова API с учетом лимитера."""
+        messages = []
+        messages.append({"role": "user", "content": prompt})
+        extra = {"response_format": response_format} if response_format else {}
+
+        reservation = None
+        if self.rate_limiter is not None:
+            reservation = await self.rate_limiter.acquire_async(prompt, self.max_tokens)
+
+        usage = None
+        error: Optional[BaseException] = None
+        client, endpoint = self._acquire_client()
+        try:
+            response = await client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=self.temperature,
+                n=1,
+                max_tokens=self.max_tokens,
+                extra_headers={ "X-Title": "My App" },
+                **extra,
+            )
+            usage = response.usage
+            return response
+        except BaseException as exc:
+            error = exc
+            raise
+        finally:
+            if endpoint is not None:
+                self.endpoint_pool.release(endpoint, error)
+            if reservation is not None:
+                self.rate_limiter.reconcile(reservation, usage)
+
+    async def gpt_validation(
+        self, init_prompt: str, dialogue: str, response_format: Optional[Dict[str, Any]] = None
+    ):
+        prompt = init_prompt.format(str(dialogue))
+        response_big = await self.create_completion(prompt, response_format)
+        return response_big.choices[0].message.content
+
+    async def __call__(self, p: str, d: str, response_format: Optional[Dict[str, Any]] = None):
+        return await self.gpt_validation(p, d, response_format)
@@ -0,0 +1,319 @@
+"""Нагрузочное тестирование LLM API: пропускная способность, задержки, ошибки.
+
+Запросы идут через тот же путь, что и в рабочих скриптах
+(AsyncGPT_Validator.create_completion), нагрузка — реальные промты:
+HOROSCOPE_PROMPT по записям сотрудников или PDF_SUMMARY_PROMPT по актам из data/.
+
+Два режима:
+- закрытый цикл: фиксированные уровни конкурентности (--concurrency 1,4,16);
+- открытый цикл: фиксированная частота запросов (--rate 1,5,10 запросов/сек).
+
+Пример:
+    python loadtest.py --workload horoscope --concurrency 1,4,16 --requests-per-step 40
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+
+import openai
+
+from llm_client import AsyncGPT_Validator
+from prompts import PDF_SUMMARY_PROMPT
+from retry import RetryPolicy
+from telemetry import percentile
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_OUTPUT_DIR = os.path.join(BASE_DIR, "loadtest_results")
+DEFAULT_PDF_DIR = os.path.join(BASE_DIR, "data")
+
+
+@dataclass
+class RequestResult:
+    """Итог одного запроса к API."""
+
+    started: float
+    latency: float
+    status: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.status == "ok"
+
+
+def classify_error(exc: Exception) -> str:
+    """Сводит исключение клиента OpenAI к короткому статусу для отчета."""
+    if isinstance(exc, openai.APIStatusError):
+        return str(exc.status_code)
+    if isinstance(exc, openai.APITimeoutError):
+        return "timeout"
+    if isinstance(exc, openai.APIConnectionError):
+        return "connection"
+    return type(exc).__name__
+
+
+def build_horoscope_workload(limit: int) -> List[str]:
+    """Промты гороскопов для первых limit сотрудников."""
+    from horoscope_generator import (
+        DEFAULT_DATA_DIR,
+        IDE_RUN_CONFIG,
+        build_horoscope_prompt,
+        iter_records,
+    )
+
+    records = iter_records(DEFAULT_DATA_DIR, IDE_RUN_CONFIG.get("target_file"), limit)
+    return [build_horoscope_prompt(record) for _, record in records]
+
+
+def build_pdf_workload(data_folder: str) -> List[str]:
+    """Промты краткого пересказа для каждого PDF из папки."""
+    from pdf_extract import extract_pdfs
+
+    names = sorted(name for name in os.listdir(data_folder) if name.lower().endswith(".pdf"))
+    prompts = []
+    for pdf in extract_pdfs([os.path.join(data_folder, name) for name in names]):
+        text = pdf.text
+        if text and text.strip():
+            prompts.append(PDF_SUMMARY_PROMPT.format(text))
+    return prompts
+
+
+def build_workload(name: str, limit: int, pdf_dir: str) -> List[str]:
+    if name == "horoscope":
+        prompts = build_horoscope_workload(limit)
+    elif name == "pdf":
+        prompts = build_pdf_workload(pdf_dir)
+    else:
+        raise ValueError(f"Неизвестная нагрузка: {name}")
+    if not prompts:
+        raise ValueError(f"Нагрузка {name} не содержит ни одного промта")
+    return prompts
+
+
+async def send_request(validator: AsyncGPT_Validator, prompt: str) -> RequestResult:
+    started = time.perf_counter()
+    try:
+        response = await validator.create_completion(prompt)
+    except Exception as exc:
+        return RequestResult(
+            started=started,
+            latency=time.perf_counter() - started,
+            status=classify_error(exc),
+            error=str(exc)[:200],
+        )
+    usage = getattr(response, "usage", None)
+    return RequestResult(
+        started=started,
+        latency=time.perf_counter() - started,
+        status="ok",
+        prompt_tokens=getattr(usage, "prompt_tokens", 0) or 0,
+        completion_tokens=getattr(usage, "completion_tokens", 0) or 0,
+    )
+
+
+async def run_closed_loop_step(
+    validator: AsyncGPT_Validator,
+    prompts: List[str],
+    concurrency: int,
+    requests: int,
+    duration: Optional[float],
+) -> List[RequestResult]:
+    """concurrency воркеров шлют запросы друг за другом без пауз."""
+    results: List[RequestResult] = []
+    counter = {"next": 0}
+    deadline = time.perf_counter() + duration if duration else None
+
+    async def worker() -> None:
+        while True:
+            if deadline is not None:
+                if time.perf_counter() >= deadline:
+                    return
+            elif counter["next"] >= requests:
+                return
+            prompt = prompts[counter["next"] % len(prompts)]
+            counter["next"] += 1
+            results.append(await send_request(validator, prompt))
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return results
+
+
+async def run_open_loop_step(
+    validator: AsyncGPT_Validator,
+    prompts: List[str],
+    rate: float,
+    requests: int,
+    duration: Optional[float],
+) -> List[RequestResult]:
+    """Запросы отправляются по расписанию rate в секунду, не дожидаясь ответов."""
+    total = int(rate * duration) if duration else requests
+    interval = 1.0 / rate
+    start = time.perf_counter()
+    tasks = []
+    for i in range(total):
+        delay = start + i * interval - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        prompt = prompts[i % len(prompts)]
+        tasks.append(asyncio.create_task(send_request(validator, prompt)))
+    return list(await asyncio.gather(*tasks))
+
+
+def summarize_step(
+    mode: str, level: float, results: List[RequestResult], elapsed: float
+) -> Dict[str, Any]:
+    """Метрики одного шага нагрузки."""
+    total = len(results)
+    ok = [r for r in results if r.ok]
+    latencies = [r.latency for r in ok]
+    completion_tokens = sum(r.completion_tokens for r in ok)
+    prompt_tokens = sum(r.prompt_tokens for r in ok)
+    errors: Dict[str, int] = {}
+    for r in results:
+        if not r.ok:
+            errors[r.status] = errors.get(r.status, 0) + 1
+
+    def rate(part: int) -> float:
+        return part / total if total else 0.0
+
+    return {
+        "mode": mode,
+        "level": level,
+        "requests": total,
+        "succeeded": len(ok),
+        "elapsed_sec": elapsed,
+        "requests_per_sec": len(ok) / elapsed if elapsed else 0.0,
+        "completion_tokens_per_sec": completion_tokens / elapsed if elapsed else 0.0,
+        "total_tokens_per_sec": (prompt_tokens + completion_tokens) / elapsed if elapsed else 0.0,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "latency_p50": percentile(latencies, 50),
+        "latency_p90": percentile(latencies, 90),
+        "latency_p99": percentile(latencies, 99),
+        "latency_mean": sum(latencies) / len(latencies) if latencies else None,
+        "error_rate": rate(total - len(ok)),
+        "rate_429": rate(errors.get("429", 0)),
+        "errors": errors,
+    }
+
+
+def print_step(step: Dict[str, Any]) -> None:
+    def fmt(value: Optional[float]) -> str:
+        return "-" if value is None else f"{value:.2f}"
+
+    label = "конкурентность" if step["mode"] == "concurrency" else "запросов/сек"
+    print(
+        f"{label}={step['level']:g}: {step['succeeded']}/{step['requests']} ok, "
+        f"{step['requests_per_sec']:.2f} rps, "
+        f"{step['completion_tokens_per_sec']:.1f} ток/сек, "
+        f"p50={fmt(step['latency_p50'])} p90={fmt(step['latency_p90'])} "
+        f"p99={fmt(step['latency_p99'])} сек, "
+        f"ошибки={step['error_rate']:.1%}, 429={step['rate_429']:.1%}"
+    )
+
+
+async def run_load_test(
+    prompts: List[str],
+    concurrency_levels: Sequence[int],
+    rates: Sequence[float],
+    requests_per_step: int,
+    duration: Optional[float],
+) -> List[Dict[str, Any]]:
+    # Одна попытка без встроенных повторов клиента: повторы скрыли бы 429/5xx от измерения.
+    # Клиент не задается явно, поэтому запросы распределяются по пулу endpoint-ов.
+    validator = AsyncGPT_Validator(retry_policy=RetryPolicy(max_attempts=1))
+
+    steps: List[Dict[str, Any]] = []
+    plan = [("concurrency", level) for level in concurrency_levels]
+    plan += [("rate", level) for level in rates]
+
+    for mode, level in plan:
+        started = time.perf_counter()
+        if mode == "concurrency":
+            results = await run_closed_loop_step(
+                validator, prompts, int(level), requests_per_step, duration
+            )
+        else:
+            results = await run_open_loop_step(
+                validator, prompts, float(level), requests_per_step, duration
+            )
+        step = summarize_step(mode, level, results, time.perf_counter() - started)
+        step["results"] = [asdict(r) for r in results]
+        print_step(step)
+        steps.append(step)
+    return steps
+
+
+def write_report(
+    steps: List[Dict[str, Any]], config: Dict[str, Any], output_dir: str
+) -> str:
+    """Сохраняет отчет в JSON для последующего сравнения прогонов."""
+    os.makedirs(output_dir, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    path = os.path.join(output_dir, f"loadtest_{timestamp}.json")
+    report = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "base_url": os.getenv("BASE_URL"),
+        "config": config,
+        "steps": steps,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def parse_levels(value: str, cast) -> List:
+    return [cast(part) for part in value.split(",") if part.strip()]
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Нагрузочный тест LLM API")
+    parser.add_argument("--workload", choices=["horoscope", "pdf"], default="horoscope")
+    parser.add_argument("--workload-size", type=int, default=50, help="Сколько разных промтов взять для horoscope")
+    parser.add_argument("--pdf-dir", default=DEFAULT_PDF_DIR)
+    parser.add_argument("--concurrency", default="", help="Уровни конкурентности через запятую, например 1,4,16")
+    parser.add_argument("--rate", default="", help="Частоты запросов в секунду через запятую, например 1,5")
+    parser.add_argument("--requests-per-step", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=None, help="Длительность шага в секундах (вместо числа запросов)")
+    parser.add_argument("--output-dir", default=DEFAULT_OUTPUT_DIR)
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    concurrency_levels = parse_levels(args.concurrency, int)
+    rates = parse_levels(args.rate, float)
+    if not concurrency_levels and not rates:
+        concurrency_levels = [1, 4, 16]
+
+    prompts = build_workload(args.workload, args.workload_size, args.pdf_dir)
+    print(f"Нагрузка {args.workload}: {len(prompts)} промтов")
+
+    steps = asyncio.run(
+        run_load_test(
+            prompts, concurrency_levels, rates, args.requests_per_step, args.duration
+        )
+    )
+    config = {
+        "workload": args.workload,
+        "workload_size": len(prompts),
+        "concurrency": concurrency_levels,
+        "rate": rates,
+        "requests_per_step": args.requests_per_step,
+        "duration": args.duration,
+    }
+    path = write_report(steps, config, args.output_dir)
+    print(f"Отчет сохранен в {path}")
+
+
+if __name__ == "__main__":
+    main()
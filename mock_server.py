@@ -0,0 +1,418 @@
+"""Локальный OpenAI-совместимый сервер-заглушка для офлайн-замеров.
+
+Реализует POST /v1/chat/completions (и GET /v1/models) с настраиваемой
+задержкой, темпом генерации токенов, инъекцией ошибок 429/500 и подсчетом
+usage. Достаточно направить на него BASE_URL:
+
+    python mock_server.py --port 8000 --latency-dist lognormal --latency-mean 0.8 --rate-429 0.05
+    BASE_URL=http://127.0.0.1:8000/v1 API_KEY=test python loadtest.py
+
+При "stream": true ответ отдается по SSE фрагментами chat.completion.chunk:
+первый фрагмент — после базовой задержки, следующие — в темпе tokens_per_second;
+при stream_options.include_usage последним идет фрагмент с usage.
+
+GET /stats возвращает счетчики обработанных запросов, POST /stats/reset их обнуляет.
+"""
+
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - tiktoken есть в requirements.txt
+    tiktoken = None
+
+
+FILLER_WORDS = (
+    "прогноз", "год", "огненной", "лошади", "сотрудник", "успех", "проект",
+    "команда", "энергия", "стихия", "совет", "девиз", "рост", "клиенты",
+)
+
+
+@dataclass
+class MockServerConfig:
+    """Параметры поведения заглушки."""
+
+    # constant | uniform | normal | lognormal | exponential
+    latency_dist: str = "constant"
+    latency_mean: float = 0.2
+    latency_std: float = 0.05
+    latency_min: float = 0.0
+    latency_max: float = 1.0
+    # Темп "генерации": 0 — ответ без задержки на выходные токены.
+    tokens_per_second: float = 0.0
+    # Длина ответа в токенах; max_tokens запроса обрезает ее (finish_reason="length").
+    output_tokens: int = 200
+    rate_429: float = 0.0
+    rate_500: float = 0.0
+    retry_after: float = 1.0
+    seed: Optional[int] = None
+
+
+class MockState:
+    """Общее для всех потоков состояние: генератор случайных чисел и счетчики."""
+
+    def __init__(self, config: MockServerConfig):
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.lock = threading.Lock()
+        self.encoding = None
+        if tiktoken is not None:
+            try:
+                self.encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                print(f"Предупреждение: кодировка tiktoken недоступна ({e}), используется приблизительный подсчет")
+        self.reset()
+
+    def reset(self) -> None:
+        with self.lock:
+            self.stats = {
+                "requests": 0,
+                "ok": 0,
+                "rate_limited": 0,
+                "server_errors": 0,
+                "bad_requests": 0,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "in_flight": 0,
+                "max_in_flight": 0,
+            }
+
+    def count_tokens(self, text: str) -> int:
+        if self.encoding is not None:
+            return len(self.encoding.encode(text))
+        return max(1, len(text) // 3)
+
+    def sample_latency(self) -> float:
+        """Базовая задержка ответа (очередь + обработка промта) в секундах."""
+        c = self.config
+        with self.lock:
+            rnd = self.random
+            if c.latency_dist == "constant":
+                value = c.latency_mean
+            elif c.latency_dist == "uniform":
+                value = rnd.uniform(c.latency_min, c.latency_max)
+            elif c.latency_dist == "normal":
+                value = rnd.gauss(c.latency_mean, c.latency_std)
+            elif c.latency_dist == "lognormal":
+                # latency_mean задает медиану, latency_std — сигму логарифма.
+                value = rnd.lognormvariate(math.log(max(c.latency_mean, 1e-6)), c.latency_std)
+            elif c.latency_dist == "exponential":
+                value = rnd.expovariate(1.0 / c.latency_mean) if c.latency_mean > 0 else 0.0
+            else:
+                raise ValueError(f"Неизвестное распределение задержки: {c.latency_dist}")
+        return max(0.0, value)
+
+    def pick_fault(self) -> Optional[int]:
+        """Возвращает HTTP-код инъецируемой ошибки или None."""
+        with self.lock:
+            roll = self.random.random()
+        if roll < self.config.rate_429:
+            return 429
+        if roll < self.config.rate_429 + self.config.rate_500:
+            return 500
+        return None
+
+    def make_completion_text(self, tokens: int) -> str:
+        """Текст ровно (или почти ровно, на стыке букв) из tokens токенов."""
+        tokens = max(tokens, 1)
+        # Каждое слово — не меньше токена, поэтому tokens слов хватает с запасом.
+        text = " ".join(FILLER_WORDS[i % len(FILLER_WORDS)] for i in range(tokens))
+        if self.encoding is None:
+            return text[: tokens * 3]
+        text = self.encoding.decode(self.encoding.encode(text)[:tokens], errors="ignore")
+        # Обрезка посреди буквы могла дать текст, который кодируется иначе.
+        while self.count_tokens(text) > tokens:
+            text = text[:-1]
+        return text
+
+    def bump(self, **deltas: int) -> None:
+        with self.lock:
+            for key, delta in deltas.items():
+                self.stats[key] += delta
+            self.stats["max_in_flight"] = max(
+                self.stats["max_in_flight"], self.stats["in_flight"]
+            )
+
+
+def build_completion(
+    state: MockState, body: Dict[str, Any]
+) -> Tuple[Dict[str, Any], float]:
+    """Готовит ответ chat.completion и время, которое нужно "генерировать" его."""
+    messages: List[Dict[str, Any]] = body.get("messages") or []
+    prompt_text = "\n".join(str(m.get("content", "")) for m in messages)
+    prompt_tokens = state.count_tokens(prompt_text)
+
+    # output_tokens — длина "естественного" ответа в токенах, max_tokens его обрезает.
+    max_tokens = body.get("max_tokens") or body.get("max_completion_tokens")
+    target = state.config.output_tokens
+    truncated = bool(max_tokens) and target > int(max_tokens)
+    if truncated:
+        target = int(max_tokens)
+    text = state.make_completion_text(target)
+    completion_tokens = state.count_tokens(text)
+
+    generation_time = 0.0
+    if state.config.tokens_per_second > 0:
+        generation_time = completion_tokens / state.config.tokens_per_second
+
+    response = {
+        "id": f"chatcmpl-mock-{uuid.uuid4().hex[:12]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model") or "mock-model",
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": text},
+                "finish_reason": "length" if truncated else "stop",
+            }
+        ],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+    return response, generation_time
+
+
+class MockRequestHandler(BaseHTTPRequestHandler):
+    server_version = "MockOpenAI/1.0"
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def state(self) -> MockState:
+        return self.server.state  # type: ignore[attr-defined]
+
+    def log_message(self, format: str, *args: Any) -> None:
+        if getattr(self.server, "verbose", False):
+            super().log_message(format, *args)
+
+    def send_json(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        try:
+            self.end_headers()
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            # Клиент не дождался ответа (таймаут или отмененный дубль при хеджировании).
+            self.close_connection = True
+
+    def send_error_json(self, status: int, message: str, error_type: str, headers: Optional[Dict[str, str]] = None) -> None:
+        self.send_json(
+            status,
+            {"error": {"message": message, "type": error_type, "code": status}},
+            headers,
+        )
+
+    def write_chunk(self, data: bytes) -> None:
+        """Один фрагмент Transfer-Encoding: chunked."""
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def send_sse(self, payload: Any) -> None:
+        data = payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False)
+        self.write_chunk(f"data: {data}\n\n".encode("utf-8"))
+
+    def stream_completion(self, response: Dict[str, Any], generation_time: float, include_usage: bool) -> None:
+        """Отдает готовый ответ по SSE, растягивая генерацию на generation_time."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        choice = response["choices"][0]
+        words = choice["message"]["content"].split(" ")
+        delay = generation_time / len(words) if generation_time else 0.0
+        base = {
+            "id": response["id"],
+            "object": "chat.completion.chunk",
+            "created": response["created"],
+            "model": response["model"],
+        }
+        for index, word in enumerate(words):
+            if index and delay:
+                time.sleep(delay)
+            delta: Dict[str, Any] = {"content": word if index == 0 else " " + word}
+            if index == 0:
+                delta["role"] = "assistant"
+            self.send_sse({**base, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]})
+        self.send_sse({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": choice["finish_reason"]}]})
+        if include_usage:
+            self.send_sse({**base, "choices": [], "usage": response["usage"]})
+        self.send_sse("[DONE]")
+        self.write_chunk(b"")
+
+    def read_body(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b"{}"
+        return json.loads(raw.decode("utf-8") or "{}")
+
+    def do_GET(self) -> None:
+        path = self.path.rstrip("/")
+        if path.endswith("/models"):
+            self.send_json(200, {"object": "list", "data": [{"id": "mock-model", "object": "model", "owned_by": "mock"}]})
+        elif path.endswith("/stats"):
+            with self.state.lock:
+                stats = dict(self.state.stats)
+            stats["config"] = asdict(self.state.config)
+            self.send_json(200, stats)
+        else:
+            self.send_error_json(404, f"Unknown path {self.path}", "not_found")
+
+    def do_POST(self) -> None:
+        path = self.path.rstrip("/")
+        if path.endswith("/stats/reset"):
+            self.read_body()
+            self.state.reset()
+            self.send_json(200, {"status": "reset"})
+            return
+        if not path.endswith("/chat/completions"):
+            self.send_error_json(404, f"Unknown path {self.path}", "not_found")
+            return
+        self.handle_chat_completion()
+
+    def handle_chat_completion(self) -> None:
+        state = self.state
+        state.bump(requests=1, in_flight=1)
+        try:
+            try:
+                body = self.read_body()
+            except (ValueError, UnicodeDecodeError) as exc:
+                state.bump(bad_requests=1)
+                self.send_error_json(400, f"Invalid JSON: {exc}", "invalid_request_error")
+                return
+
+            time.sleep(state.sample_latency())
+
+            fault = state.pick_fault()
+            if fault == 429:
+                state.bump(rate_limited=1)
+                self.send_error_json(
+                    429,
+                    "Rate limit exceeded (mock)",
+                    "rate_limit_exceeded",
+                    {"Retry-After": f"{state.config.retry_after:g}"},
+                )
+                return
+            if fault == 500:
+                state.bump(server_errors=1)
+                self.send_error_json(500, "Internal server error (mock)", "server_error")
+                return
+
+            response, generation_time = build_completion(state, body)
+            usage = response["usage"]
+            state.bump(
+                ok=1,
+                prompt_tokens=usage["prompt_tokens"],
+                completion_tokens=usage["completion_tokens"],
+            )
+            if body.get("stream"):
+                include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+                try:
+                    self.stream_completion(response, generation_time, include_usage)
+                except (BrokenPipeError, ConnectionResetError):
+                    # Клиент прервал чтение потока — для заглушки это штатная ситуация.
+                    self.close_connection = True
+                return
+            if generation_time:
+                time.sleep(generation_time)
+            self.send_json(200, response)
+        finally:
+            state.bump(in_flight=-1)
+
+
+class MockHTTPServer(ThreadingHTTPServer):
+    # Очередь входящих соединений по умолчанию (5) переполняется при всплеске
+    # из десятков одновременных подключений, и клиенты получают обрывы соединения.
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+def create_mock_server(
+    config: MockServerConfig, host: str = "127.0.0.1", port: int = 0, verbose: bool = False
+) -> ThreadingHTTPServer:
+    """Создает сервер; port=0 выбирает свободный порт (см. server.server_address)."""
+    server = MockHTTPServer((host, port), MockRequestHandler)
+    server.state = MockState(config)  # type: ignore[attr-defined]
+    server.verbose = verbose  # type: ignore[attr-defined]
+    return server
+
+
+def start_mock_server(
+    config: Optional[MockServerConfig] = None, host: str = "127.0.0.1", port: int = 0
+) -> Tuple[ThreadingHTTPServer, str]:
+    """Запускает заглушку в фоновом потоке и возвращает (server, base_url)."""
+    server = create_mock_server(config or MockServerConfig(), host, port)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    bound_host, bound_port = server.server_address[:2]
+    return server, f"http://{bound_host}:{bound_port}/v1"
+
+
+def parse_args() -> argparse.Namespace:
+    defaults = MockServerConfig()
+    parser = argparse.ArgumentParser(description="OpenAI-совместимая заглушка с задержками и ошибками")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--latency-dist",
+        choices=["constant", "uniform", "normal", "lognormal", "exponential"],
+        default=defaults.latency_dist,
+    )
+    parser.add_argument("--latency-mean", type=float, default=defaults.latency_mean, help="Среднее (для lognormal — медиана), сек")
+    parser.add_argument("--latency-std", type=float, default=defaults.latency_std, help="Разброс (для lognormal — сигма логарифма)")
+    parser.add_argument("--latency-min", type=float, default=defaults.latency_min)
+    parser.add_argument("--latency-max", type=float, default=defaults.latency_max)
+    parser.add_argument("--tokens-per-second", type=float, default=defaults.tokens_per_second)
+    parser.add_argument("--output-tokens", type=int, default=defaults.output_tokens)
+    parser.add_argument("--rate-429", type=float, default=defaults.rate_429, help="Доля ответов 429")
+    parser.add_argument("--rate-500", type=float, default=defaults.rate_500, help="Доля ответов 500")
+    parser.add_argument("--retry-after", type=float, default=defaults.retry_after, help="Значение заголовка Retry-After для 429")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--verbose", action="store_true")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    config = MockServerConfig(
+        latency_dist=args.latency_dist,
+        latency_mean=args.latency_mean,
+        latency_std=args.latency_std,
+        latency_min=args.latency_min,
+        latency_max=args.latency_max,
+        tokens_per_second=args.tokens_per_second,
+        output_tokens=args.output_tokens,
+        rate_429=args.rate_429,
+        rate_500=args.rate_500,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+    server = create_mock_server(config, args.host, args.port, args.verbose)
+    host, port = server.server_address[:2]
+    print(f"Заглушка OpenAI слушает http://{host}:{port}/v1 (Ctrl+C для остановки)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
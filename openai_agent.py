@@ -1,123 +1,367 @@
 
+import json
 import os
+import queue
 import re
-import time
+import threading
+import numpy as np
 import pandas as pd
-from openai import OpenAI
-from itertools import groupby
-from operator import itemgetter
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 from dotenv import load_dotenv
 
+from endpoints import scale_workers
+from hedging import HedgePolicy
+from journal import AppendOnlyTableWriter
+from llm_cache import ResponseCache
+# Валидаторы живут в llm_client; реэкспорт сохраняет прежние импорты из openai_agent
+from llm_client import AsyncGPT_Validator, CompletionStream, GPT_Validator, StreamStats
+from prompts import CHAT_INSPECTOR_PROMPT, CHAT_MANAGER_PROMPT, CHAT_VERDICT_JSON_PROMPT
+from rate_limiter import RateLimiter
+from retry import CircuitBreaker, RetryPolicy, describe_error
+from telemetry import Telemetry
+
 load_dotenv()
 
-class GPT_Validator:
-    client = OpenAI(
-    api_key=os.getenv("API_KEY"), # ваш ключ в VseGPT после регистрации
-    base_url=os.getenv("BASE_URL"),)
+
+CHAT_FILES = ["chats_with_autophrases.csv", "chats_without_autophrases.csv"]
+# Максимум чатов на файл и размер порции при чтении TSV.
+MAX_CHATS = 5000
+CHUNK_SIZE = 20000
+# Размеры пулов конвейера: доклад специалиста длиннее резолюции, поэтому воркеров ступени 1 больше.
+STAGE1_WORKERS = 8
+STAGE2_WORKERS = 4
+PIPELINE_QUEUE_SIZE = 32
+# Режим проверки: "two_stage" — доклад и резолюция двумя вызовами,
+# "single_call" — один вызов с JSON {report, verdict}.
+CHAT_QA_MODE = "two_stage"
+# Просить у API режим JSON (response_format). Отключите, если провайдер его не поддерживает:
+# парсер все равно ищет JSON в тексте ответа.
+JSON_RESPONSE_FORMAT = True
+
+CLEAN_PATTERN = re.compile(r"\n|\¶|(?P<url>https?://[^\s]+)|<a href=|</a>|/#/document/\d\d/\d+/|\"\s*\">|\s+")
+
+USER_MESSAGES = ["UserMessage", "UserNewsPositiveReactionMessage"]
+OPERATOR_MESSAGES = ["AutoGoodbyeMessage", "AutoHello2Message",  "AutoHelloMessage", "AutoHelloNewsMessage", "AutoHelloOfflineMessage",
+                     "AutoRateMessage", "HotlineNotificationMessage", "MLRoboChatMessage", "NewsAutoMessage", "OperatorMessage"]
+
+RESULT_COLUMNS = ["chat_id", "dialogue", "report", "val", "verdict", "error"]
+VERDICT_NO_FINE = "Не штрафовать"
+VERDICT_FINE = "Оштрафовать"
+
+
+def clean_column(series: pd.Series) -> pd.Series:
+    """Векторная очистка текста от переносов, ссылок и html-хвостов."""
+    return series.astype(str).str.replace(CLEAN_PATTERN, " ", regex=True)
 
 
-    def gpt_validation(self, init_prompt: str, dialogue: str):
-        prompt = init_prompt.format(str(dialogue))
+def normalize_chat_id(series: pd.Series) -> pd.Series:
+    return clean_column(series).str.strip()
 
-        messages = []
-        messages.append({"role": "user", "content": prompt})
 
-        response_big = self.client.chat.completions.create(
-            model="openai/gpt-4o-mini", # id модели из списка моделей - можно использовать OpenAI, Anthropic и пр. меняя только этот параметр openai/gpt-4o-mini
-            messages=messages,
-            temperature=0.7,
-            n=1,
-            max_tokens=3000, # максимальное число ВЫХОДНЫХ токенов. Для большинства моделей не должно превышать 4096
-            extra_headers={ "X-Title": "My App" }, # опционально - передача информация об источнике API-вызова
+def iter_message_chunks(path: str, chunksize: int = CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """Читает TSV порциями и размечает автора сообщений без построчного apply."""
+    for chunk in pd.read_csv(path, sep="\t", chunksize=chunksize, dtype={"chat_id": str}):
+        chunk["chat_id"] = normalize_chat_id(chunk["chat_id"])
+        chunk["text"] = clean_column(chunk["text"])
+        discriminator = chunk["discriminator"].astype(str).str.replace(r"\s+", "", regex=True)
+        chunk["Autor"] = np.select(
+            [discriminator.isin(USER_MESSAGES), discriminator.isin(OPERATOR_MESSAGES)],
+            ["Пользователь", "Оператор"],
+            default="Нет",
         )
+        yield chunk[["chat_id", "Autor", "text"]]
 
-        #print("Response BIG:",response_big)
-        return response_big.choices[0].message.content
 
-    def __call__(self, p:str, d: str):
-        return self.gpt_validation(p, d)
+def chats_are_grouped(path: str, chunksize: int = CHUNK_SIZE) -> bool:
+    """Проверяет, что сообщения каждого чата идут в файле подряд (читается только chat_id)."""
+    closed = set()
+    current = None
+    for chunk in pd.read_csv(path, sep="\t", chunksize=chunksize, usecols=["chat_id"], dtype={"chat_id": str}):
+        for chat_id in normalize_chat_id(chunk["chat_id"]):
+            if chat_id == current:
+                continue
+            if chat_id in closed:
+                return False
+            if current is not None:
+                closed.add(current)
+            current = chat_id
+    return True
 
 
-if __name__ == "__main__":
+def iter_chats(path: str, chunksize: int = CHUNK_SIZE) -> Iterator[Tuple[str, List[Dict[str, str]]]]:
+    """Генератор (chat_id, сообщения) по файлу.
+
+    Если сообщения чатов идут подряд, чаты отдаются потоково по мере чтения.
+    Иначе сообщения группируются по chat_id в памяти и отдаются в порядке id.
+    """
+    if not chats_are_grouped(path, chunksize):
+        print(f"Сообщения чатов в {path} перемешаны, группировка выполняется в памяти")
+        grouped: Dict[str, List[Dict[str, str]]] = {}
+        for chunk in iter_message_chunks(path, chunksize):
+            for chat_id, autor, text in chunk.itertuples(index=False):
+                grouped.setdefault(chat_id, []).append({"Autor": autor, "Phrase": text})
+        for chat_id in sorted(grouped, key=chat_sort_key):
+            yield chat_id, grouped[chat_id]
+        return
+
+    current_id = None
+    messages: List[Dict[str, str]] = []
+    for chunk in iter_message_chunks(path, chunksize):
+        for chat_id, autor, text in chunk.itertuples(index=False):
+            if chat_id != current_id:
+                if current_id is not None:
+                    yield current_id, messages
+                current_id, messages = chat_id, []
+            messages.append({"Autor": autor, "Phrase": text})
+    if current_id is not None:
+        yield current_id, messages
+
+
+def chat_sort_key(chat_id: str) -> Tuple[int, Any]:
+    return (0, int(chat_id)) if chat_id.isdigit() else (1, chat_id)
+
+
+def format_dialogue(messages: List[Dict[str, str]]) -> str:
+    return "\n\t".join([str(d["Autor"]) + ": " + str(d["Phrase"]) for d in messages])
+
+
+def normalize_verdict(text: Optional[str]) -> Optional[str]:
+    """Сводит свободную резолюцию к VERDICT_NO_FINE / VERDICT_FINE или None."""
+    if not text:
+        return None
+    lowered = str(text).lower()
+    if "не штраф" in lowered:
+        return VERDICT_NO_FINE
+    if "оштраф" in lowered:
+        return VERDICT_FINE
+    return None
+
+
+def parse_verdict_response(text: Optional[str]) -> Tuple[str, Optional[str]]:
+    """Разбирает ответ режима single_call в (доклад, решение).
+
+    Понимает чистый JSON, JSON в ```-блоке или внутри текста. Если JSON не
+    разобран, весь ответ считается докладом, а решение ищется по ключевым
+    словам; None означает, что решение нужно получить отдельным вызовом.
+    """
+    text = (text or "").strip()
+    candidates = [text]
+    match = re.search(r"\{.*\}", text, re.DOTALL)
+    if match:
+        candidates.append(match.group(0))
+    for candidate in candidates:
+        try:
+            data = json.loads(candidate)
+        except ValueError:
+            continue
+        if isinstance(data, dict):
+            report = str(data.get("report") or "").strip() or text
+            return report, normalize_verdict(data.get("verdict"))
+    return text, normalize_verdict(text)
+
+
+class TwoStagePipeline:
+    """Конвейер проверки: пул специалистов (ступень 1) и пул руководителей (ступень 2).
+
+    Ступени связаны ограниченными очередями, поэтому резолюция по чату N
+    запрашивается, пока по чатам N+k еще идут доклады, а чтение файла не
+    убегает вперед больше чем на queue_size чатов.
+
+    В режиме single_call ступень 1 возвращает доклад и решение одним вызовом;
+    ступень 2 тогда нужна только как запасной путь, если решение не разобрано.
+    """
+
+    _STOP = object()
+
+    def __init__(
+        self,
+        validator: GPT_Validator,
+        stage1_workers: int = STAGE1_WORKERS,
+        stage2_workers: int = STAGE2_WORKERS,
+        queue_size: int = PIPELINE_QUEUE_SIZE,
+        mode: str = CHAT_QA_MODE,
+    ):
+        if mode not in ("two_stage", "single_call"):
+            raise ValueError(f"Неизвестный режим проверки: {mode}")
+        self.validator = validator
+        self.stage1_workers = max(1, stage1_workers)
+        self.stage2_workers = max(1, stage2_workers)
+        self.queue_size = queue_size
+        self.mode = mode
 
-    prompt1 = """Ты - опытный специалист службы контроля качества работы колл-центра экспертной поддержки.
-            Тебе для анализа передали диалог Оператора с Пользователем: 
-            Текст диалога: {}
-            
-            Оцени качество работы оператора. Остался ли Пользователь доволен ответами, не выражал ли Пользователь неудовольствие.
-            Выдай аргументированный ответ. В конце прими решение, достоин ли Оператор новогодней премии. 
-            Лишать Оператора премии можно только в случае явного недовольства пользователя.
-            Напиши резолюцию
-            """
-
-    prompt2 = """Ты - мудрый и опытный руководитель колл-центра экспертной поддержки. 
-            Ты получил сообщение от Специалиста службы контроля качества, который оценил работу твоих сотрудников.
-            Твоя задача быть справедливым к своим сотрудникам и штрафовать Операторов только в тех случаях, 
-            когда в докладе явно указано на недовольство Пользователя ответами Оператора.
-            
-            Доклад Специалиста отдела по оценке качества сотрудников колл-центра:
-            {}
-            
-            Внимательно прочитай доклад и прими решение о том, необходимо ли штрафовать Оператора.
-
-            Напиши краткую резолюцию, без объяснений: 
-            ### Не штрафовать Оператора / Оштрафовать Оператора
-            """
-    
-    fale_names = ["chats_with_autophrases.csv", "chats_without_autophrases.csv"]
-    validator = GPT_Validator()
-
-    for fale_name in fale_names:
-
-        data_df = pd.read_csv(os.path.join("data", fale_name), sep="\t")
-
-        patterns = re.compile(r"\n|\¶|(?P<url>https?://[^\s]+)|<a href=|</a>|/#/document/\d\d/\d+/|\"\s*\">|\s+")
-
-        for col in ["chat_id", "text"]:
-            data_df[col] = data_df[col].apply(lambda x: patterns.sub(" ", str(x)))
-        
-        data_df["discriminator"] = data_df["discriminator"].apply(lambda x: re.sub(r"\s+", "", str(x))) 
-        data_df["Autor"] = "Нет"
-        
-        user_messages = ["UserMessage", "UserNewsPositiveReactionMessage"]
-        operator_messages = ["AutoGoodbyeMessage", "AutoHello2Message",  "AutoHelloMessage", "AutoHelloNewsMessage", "AutoHelloOfflineMessage",
-                             "AutoRateMessage", "HotlineNotificationMessage", "MLRoboChatMessage", "NewsAutoMessage", "OperatorMessage"]
-
-        print(data_df["discriminator"].unique())
-        data_df["Autor"][data_df["discriminator"].isin(user_messages)] = "Пользователь"
-        data_df["Autor"][data_df["discriminator"].isin(operator_messages)] = "Оператор"
-        
-        data_dics = data_df[["chat_id", "Autor", "text"]].to_dict(orient="records")
-
-        # группировка текстов по чатам:
-        data_dics.sort(key=itemgetter('chat_id'))
-        dict_of_chats = {int(k): [{"Autor": d["Autor"], "Phrase": d["text"]} for d in list(g)] for k, g in groupby(data_dics, itemgetter("chat_id"))}
-
-        dict_results = []
-        k = 1
-
-        
-        for i in dict_of_chats:
+    def _inspect(self, dialogue: str) -> Tuple[str, Optional[str]]:
+        """Ступень 1: доклад и, в режиме single_call, сразу решение."""
+        if self.mode == "single_call":
+            response_format = {"type": "json_object"} if JSON_RESPONSE_FORMAT else None
+            raw = self.validator(CHAT_VERDICT_JSON_PROMPT, dialogue, response_format)
+            return parse_verdict_response(raw)
+        return self.validator(CHAT_INSPECTOR_PROMPT, dialogue), None
+
+    def _decide(self, cheking_report: str) -> str:
+        return self.validator(CHAT_MANAGER_PROMPT, cheking_report)
+
+    def run(self, items: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """Принимает словари с ключом dialogue, отдает их с val/error по мере готовности."""
+        inbox: "queue.Queue[Any]" = queue.Queue(self.queue_size)
+        reports: "queue.Queue[Any]" = queue.Queue(self.queue_size)
+        outbox: "queue.Queue[Any]" = queue.Queue()
+        remaining = {"stage1": self.stage1_workers, "stage2": self.stage2_workers}
+        lock = threading.Lock()
+        failures: List[BaseException] = []
+
+        def finish(stage: str, next_queue: "queue.Queue[Any]", stops: int) -> None:
+            # Последний воркер ступени передает сигнал остановки следующей ступени.
+            with lock:
+                remaining[stage] -= 1
+                last = remaining[stage] == 0
+            if last:
+                for _ in range(stops):
+                    next_queue.put(self._STOP)
+
+        def produce() -> None:
+            try:
+                for item in items:
+                    inbox.put(item)
+            except BaseException as e:
+                failures.append(e)
+            finally:
+                for _ in range(self.stage1_workers):
+                    inbox.put(self._STOP)
+
+        def stage1() -> None:
             try:
-                dialogue = "\n\t".join([str(d["Autor"]) + ": " + str(d["Phrase"]) for d in dict_of_chats[i]])
-
-                print(dialogue)
-
-                if k > 5000:
-                    break
-                
-                k += 1
-
-                cheking_report = validator(prompt1, dialogue)
-                val = validator(prompt2, cheking_report)
-                print(k, "/", len(dict_of_chats), "val:", val, "\n\n")
-                dict_results.append({"chat_id": i, "dialogue": dialogue, "val": val})
-
-                out_fn = "ai_agent_" + fale_name
-                results_df = pd.DataFrame(dict_results)
-                results_df.to_csv(os.path.join("results", out_fn), sep="\t", index=False)
-            
-            except Exception as e:
-                pass
-            
-            time.sleep(1)
\ No newline at end of file
+                while True:
+                    item = inbox.get()
+                    if item is self._STOP:
+                        break
+                    try:
+                        cheking_report, verdict = self._inspect(item["dialogue"])
+                    except Exception as e:
+                        # Ошибка остается в результатах, чтобы чат можно было перепроверить точечно
+                        outbox.put({**item, "val": None, "error": describe_error(e)})
+                        continue
+                    if verdict is not None:
+                        outbox.put({**item, "report": cheking_report, "val": verdict, "verdict": verdict, "error": None})
+                    else:
+                        reports.put((item, cheking_report))
+            except BaseException as e:
+                failures.append(e)
+            finally:
+                # Сигнал остановки уходит дальше и при падении воркера, иначе конвейер ждал бы вечно.
+                finish("stage1", reports, self.stage2_workers)
+
+        def stage2() -> None:
+            try:
+                while True:
+                    entry = reports.get()
+                    if entry is self._STOP:
+                        break
+                    item, cheking_report = entry
+                    try:
+                        val = self._decide(cheking_report)
+                        outbox.put({
+                            **item,
+                            "report": cheking_report,
+                            "val": val,
+                            "verdict": normalize_verdict(val),
+                            "error": None,
+                        })
+                    except Exception as e:
+                        outbox.put({**item, "report": cheking_report, "val": None, "error": describe_error(e)})
+            except BaseException as e:
+                failures.append(e)
+            finally:
+                finish("stage2", outbox, 1)
+
+        threads = [threading.Thread(target=produce, daemon=True)]
+        threads += [threading.Thread(target=stage1, daemon=True) for _ in range(self.stage1_workers)]
+        threads += [threading.Thread(target=stage2, daemon=True) for _ in range(self.stage2_workers)]
+        for thread in threads:
+            thread.start()
+
+        while True:
+            result = outbox.get()
+            if result is self._STOP:
+                break
+            yield result
+
+        if failures:
+            # Если упали все воркеры ступени, поставщик ждет места в очереди вечно —
+            # такие потоки (демоны) не ждем.
+            raise failures[0]
+        for thread in threads:
+            thread.join()
+
+
+def run_chat_qa(
+    validator: GPT_Validator,
+    fale_name: str,
+    data_dir: str = "data",
+    results_dir: str = "results",
+    max_chats: int = MAX_CHATS,
+    resume: bool = True,
+    stage1_workers: int = STAGE1_WORKERS,
+    stage2_workers: int = STAGE2_WORKERS,
+    mode: str = CHAT_QA_MODE,
+) -> str:
+    """Проверяет чаты из файла и дописывает результаты по мере готовности."""
+    out_path = os.path.join(results_dir, "ai_agent_" + fale_name)
+    writer = AppendOnlyTableWriter(out_path, RESULT_COLUMNS, key_column="chat_id")
+    done = writer.done_keys() if resume else set()
+    if done:
+        print(f"{fale_name}: {len(done)} чатов уже проверены, они будут пропущены")
+
+    def pending_chats() -> Iterator[Dict[str, Any]]:
+        k = 0
+        for chat_id, messages in iter_chats(os.path.join(data_dir, fale_name)):
+            if k >= max_chats:
+                break
+            k += 1
+            if chat_id not in done:
+                yield {"k": k, "chat_id": chat_id, "dialogue": format_dialogue(messages)}
+
+    pipeline = TwoStagePipeline(validator, stage1_workers, stage2_workers, mode=mode)
+    for result in pipeline.run(pending_chats()):
+        print(result["dialogue"])
+        if result["error"]:
+            print(result["k"], "ошибка:", result["error"])
+        print(result["k"], "val:", result["val"], "\n\n")
+        writer.append(result)
+
+    removed = writer.compact()
+    if removed:
+        print(f"Из {out_path} удалено {removed} устаревших строк повторно проверенных чатов")
+    return out_path
+
+
+def main() -> None:
+    # Бюджет RPM/TPM задается LLM_RPM_LIMIT / LLM_TPM_LIMIT в .env вместо паузы после каждого чата
+    cache = ResponseCache.from_env()
+    telemetry = Telemetry.from_env("chat_qa")
+    validator = GPT_Validator(
+        rate_limiter=RateLimiter.from_env(),
+        retry_policy=RetryPolicy(circuit_breaker=CircuitBreaker()),
+        cache=cache,
+        telemetry=telemetry,
+        hedge_policy=HedgePolicy.from_env(),
+    )
+
+    # Размеры пулов заданы на один ключ API: с пулом endpoint-ов воркеров пропорционально больше
+    stage1_workers = scale_workers(STAGE1_WORKERS, validator.endpoint_pool)
+    stage2_workers = scale_workers(STAGE2_WORKERS, validator.endpoint_pool)
+    for fale_name in CHAT_FILES:
+        run_chat_qa(validator, fale_name, stage1_workers=stage1_workers, stage2_workers=stage2_workers)
+
+        if cache is not None:
+            print(cache.summary())
+
+    if validator.hedge_policy is not None:
+        print(validator.hedge_policy.summary())
+    if validator.endpoint_pool is not None:
+        print(validator.endpoint_pool.summary())
+    print(telemetry.format_summary())
+    telemetry.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+"""Параллельное извлечение текста из PDF по страницам.
+
+pypdf извлекает текст на одном ядре, поэтому страницы раздаются процессам
+ProcessPoolExecutor диапазонами: каждый процесс сам открывает PDF и читает
+свой диапазон. Страницы всех файлов пакета идут в один пул, так что
+несколько файлов извлекаются на всех ядрах одновременно.
+
+Порядок страниц сохраняется; пустые страницы по умолчанию пропускаются
+(keep_empty=True возвращает все страницы, как нужно read_pdf.py).
+
+Число процессов: параметр workers или PDF_EXTRACT_WORKERS в .env
+(по умолчанию — число ядер).
+
+Извлеченный текст кэшируется на диске (PageTextCache) по sha256 содержимого
+файла и версии pypdf, поэтому повторные запуски на тех же PDF не парсят их
+заново. Режим PDF_TEXT_CACHE в .env: "use" (по умолчанию), "refresh"
+(извлечь заново и перезаписать) или "off"; папка — PDF_TEXT_CACHE_DIR.
+Явная очистка: python pdf_extract.py --clear-cache [файлы].
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pypdf
+from dotenv import load_dotenv
+from pypdf import PdfReader
+
+
+# Меньше страниц в пакете — быстрее извлечь в текущем процессе, чем запускать пул
+MIN_PAGES_FOR_POOL = 8
+# Сколько диапазонов страниц приходится на один процесс: мелкие задачи выравнивают нагрузку
+TASKS_PER_WORKER = 4
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_TEXT_CACHE_DIR = os.path.join(BASE_DIR, ".pdf_text_cache")
+TEXT_CACHE_MODES = ("use", "refresh", "off")
+
+
+@dataclass
+class ExtractedPdf:
+    """Результат извлечения одного файла."""
+
+    path: str
+    pages: Optional[List[str]] = None  # None — файл не удалось прочитать
+    page_numbers: List[int] = field(default_factory=list)  # номера страниц (с 1) для pages
+    num_pages: int = 0
+    seconds: float = 0.0  # суммарное время извлечения страниц файла во всех процессах
+    error: Optional[str] = None
+    cached: bool = False  # текст взят из PageTextCache без парсинга
+
+    @property
+    def name(self) -> str:
+        return os.path.basename(self.path)
+
+    @property
+    def text(self) -> Optional[str]:
+        """Текст всех страниц одним документом или None при ошибке."""
+        if self.pages is None:
+            return None
+        return "\n\n".join(self.pages)
+
+
+def file_hash(path: str) -> str:
+    """sha256 содержимого файла."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class PageTextCache:
+    """Постраничный текст PDF на диске, один JSON на файл.
+
+    Ключ — sha256 содержимого файла вместе с версией pypdf: измененный файл
+    или обновленный парсер дают новый ключ, старые записи удаляет clear().
+    Хранятся все страницы, включая пустые, чтобы обслуживать и keep_empty.
+    """
+
+    def __init__(self, directory: str = DEFAULT_TEXT_CACHE_DIR, mode: str = "use"):
+        if mode not in TEXT_CACHE_MODES:
+            raise ValueError(f"Неизвестный режим кэша: {mode} (ожидается один из {TEXT_CACHE_MODES})")
+        self.directory = directory
+        self.mode = mode
+
+    @classmethod
+    def from_env(cls) -> Optional["PageTextCache"]:
+        """Кэш по настройкам .env; None, если PDF_TEXT_CACHE=off."""
+        mode = (os.getenv("PDF_TEXT_CACHE") or "use").strip().lower()
+        if mode == "off":
+            return None
+        return cls(directory=os.getenv("PDF_TEXT_CACHE_DIR") or DEFAULT_TEXT_CACHE_DIR, mode=mode)
+
+    def key(self, path: str) -> str:
+        digest = hashlib.sha256(f"{file_hash(path)}:pypdf-{pypdf.__version__}".encode("utf-8"))
+        return digest.hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> Optional[List[str]]:
+        """Тексты всех страниц или None (промах)."""
+        if self.mode != "use":
+            return None
+        try:
+            with open(self._entry_path(key), encoding="utf-8") as f:
+                pages = json.load(f)["pages"]
+        except (OSError, ValueError, KeyError):
+            return None
+        return pages
+
+    def put(self, key: str, path: str, pages: List[str]) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        entry_path = self._entry_path(key)
+        tmp_path = f"{entry_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"source": os.path.basename(path), "pages": pages}, f, ensure_ascii=False)
+        # Атомарная замена: прерванная запись не оставляет битый файл кэша.
+        os.replace(tmp_path, entry_path)
+
+    def invalidate(self, path: str) -> bool:
+        """Удаляет запись для текущего содержимого файла; True, если она была."""
+        try:
+            os.remove(self._entry_path(self.key(path)))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def clear(self) -> int:
+        """Удаляет весь кэш; возвращает число удаленных записей."""
+        if not os.path.isdir(self.directory):
+            return 0
+        removed = 0
+        for name in os.listdir(self.directory):
+            if name.endswith(".json") or name.endswith(".tmp"):
+                os.remove(os.path.join(self.directory, name))
+                removed += 1
+        return removed
+
+
+def get_extract_workers(workers: Optional[int] = None) -> int:
+    if workers:
+        return workers
+    return int(os.getenv("PDF_EXTRACT_WORKERS") or os.cpu_count() or 1)
+
+
+def count_pages(path: str) -> int:
+    return len(PdfReader(path).pages)
+
+
+def extract_page_range(path: str, start: int, stop: int) -> Tuple[List[str], float]:
+    """Извлекает страницы [start, stop) одного файла; выполняется в процессе пула."""
+    started = time.perf_counter()
+    reader = PdfReader(path)
+    texts = [reader.pages[index].extract_text() for index in range(start, stop)]
+    return texts, time.perf_counter() - started
+
+
+def _split_ranges(num_pages: int, pages_per_task: int) -> List[Tuple[int, int]]:
+    return [
+        (start, min(start + pages_per_task, num_pages))
+        for start in range(0, num_pages, pages_per_task)
+    ]
+
+
+def _select_pages(result: ExtractedPdf, all_pages: List[str], keep_empty: bool) -> None:
+    result.num_pages = len(all_pages)
+    result.pages, result.page_numbers = [], []
+    for page_num, text in enumerate(all_pages, start=1):
+        if keep_empty or text.strip():  # По умолчанию добавляем только непустые страницы
+            result.pages.append(text)
+            result.page_numbers.append(page_num)
+
+
+def extract_pdfs(
+    paths: Iterable[str],
+    workers: Optional[int] = None,
+    keep_empty: bool = False,
+    cache: Optional[PageTextCache] = None,
+    use_cache: bool = True,
+) -> List[ExtractedPdf]:
+    """Извлекает текст из нескольких PDF; результаты в порядке paths.
+
+    cache=None и use_cache=True — кэш по настройкам .env (PageTextCache.from_env).
+    """
+    started = time.perf_counter()
+    results = [ExtractedPdf(path=path) for path in paths]
+    workers = get_extract_workers(workers)
+    if cache is None and use_cache:
+        cache = PageTextCache.from_env()
+
+    readable = []
+    cache_keys: Dict[int, str] = {}
+    for result in results:
+        try:
+            if cache is not None:
+                key = cache_keys[id(result)] = cache.key(result.path)
+                cached_pages = cache.get(key)
+                if cached_pages is not None:
+                    _select_pages(result, cached_pages, keep_empty)
+                    result.cached = True
+                    continue
+            result.num_pages = count_pages(result.path)
+            readable.append(result)
+        except Exception as e:
+            result.error = str(e)
+
+    total_pages = sum(result.num_pages for result in readable)
+    pages_per_task = max(1, -(-total_pages // (workers * TASKS_PER_WORKER)))
+    tasks = [
+        (result, start, stop)
+        for result in readable
+        for start, stop in _split_ranges(result.num_pages, pages_per_task)
+    ]
+    page_texts = {id(result): [] for result in readable}
+
+    def collect(result: ExtractedPdf, outcome) -> None:
+        texts, seconds = outcome
+        page_texts[id(result)].extend(texts)
+        result.seconds += seconds
+
+    use_pool = workers > 1 and total_pages >= MIN_PAGES_FOR_POOL
+    if not use_pool:
+        for result, start, stop in tasks:
+            if result.error is None:
+                try:
+                    collect(result, extract_page_range(result.path, start, stop))
+                except Exception as e:
+                    result.error = str(e)
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+            futures = [
+                (result, executor.submit(extract_page_range, result.path, start, stop))
+                for result, start, stop in tasks
+            ]
+            # Диапазоны файла отправлены по порядку, поэтому и собираются по порядку.
+            for result, future in futures:
+                try:
+                    outcome = future.result()
+                except Exception as e:
+                    result.error = str(e)
+                    continue
+                if result.error is None:
+                    collect(result, outcome)
+
+    for result in readable:
+        if result.error is not None:
+            continue
+        all_pages = page_texts[id(result)]
+        _select_pages(result, all_pages, keep_empty)
+        if cache is not None:
+            try:
+                cache.put(cache_keys[id(result)], result.path, all_pages)
+            except OSError as e:
+                print(f"Предупреждение: не удалось сохранить текст {result.name} в кэш ({e})")
+
+    for result in results:
+        if result.error is not None:
+            print(f"Ошибка при чтении файла {result.path}: {result.error}")
+    cached = sum(result.cached for result in results)
+    print(
+        f"Извлечено {total_pages} стр. из {len(readable)} файлов за {time.perf_counter() - started:.2f} сек "
+        f"(процессов: {min(workers, len(tasks)) if use_pool else 1}, из кэша файлов: {cached})"
+    )
+    return results
+
+
+def extract_pdf(path: str, workers: Optional[int] = None, keep_empty: bool = False) -> ExtractedPdf:
+    """Извлекает текст одного PDF, распределяя его страницы по процессам."""
+    return extract_pdfs([path], workers=workers, keep_empty=keep_empty)[0]
+
+
+def extract_text_from_pdf(pdf_path: str) -> Optional[str]:
+    """Весь текст PDF одним документом (непустые страницы) или None при ошибке."""
+    return extract_pdf(pdf_path).text
+
+
+def print_extraction_timings(results: List[ExtractedPdf]) -> None:
+    """Печатает время извлечения по файлам."""
+    print("Извлечение текста из PDF:")
+    for result in results:
+        if result.error is not None:
+            print(f"  - {result.name}: ошибка")
+            continue
+        timing = "из кэша" if result.cached else f"{result.seconds:.2f} сек"
+        print(f"  - {result.name}: {result.num_pages} стр. ({len(result.pages)} с текстом), {timing}")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Управление кэшем извлеченного текста PDF")
+    parser.add_argument(
+        "--clear-cache",
+        nargs="*",
+        metavar="PDF",
+        help="Удалить кэш целиком или только записи указанных файлов",
+    )
+    parser.add_argument("--cache-dir", default=None, help="Папка кэша (по умолчанию PDF_TEXT_CACHE_DIR)")
+    return parser.parse_args()
+
+
+def main() -> None:
+    load_dotenv()
+    args = parse_args()
+    cache = PageTextCache(directory=args.cache_dir or os.getenv("PDF_TEXT_CACHE_DIR") or DEFAULT_TEXT_CACHE_DIR)
+    if args.clear_cache is None:
+        print("Укажите --clear-cache [файлы]")
+        return
+    if not args.clear_cache:
+        print(f"Удалено записей кэша: {cache.clear()}")
+        return
+    for path in args.clear_cache:
+        status = "удален" if cache.invalidate(path) else "не найден"
+        print(f"{path}: {status}")
+
+
+if __name__ == "__main__":
+    main()
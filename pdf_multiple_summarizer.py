@@ -1,137 +1,276 @@
 import os
 import re
-from pypdf import PdfReader
-from openai import OpenAI
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-import tiktoken
 
-load_dotenv()
+from endpoints import scale_workers
+from llm_cache import ResponseCache
+from llm_client import GPT_Validator
+from pdf_extract import extract_pdfs, print_extraction_timings
+from prompts import PDF_CHUNK_SUMMARY_PROMPT, PDF_COMBINED_SUMMARY_PROMPT, PDF_REDUCE_SUMMARY_PROMPT
+from rate_limiter import RateLimiter
+from retry import CircuitBreaker, RetryPolicy, describe_error
+from telemetry import Telemetry
+from tokens import count_tokens, count_tokens_batch, count_words
 
-class GPT_Validator:
-    client = OpenAI(
-        api_key=os.getenv("API_KEY"), # ваш ключ в VseGPT после регистрации
-        base_url=os.getenv("BASE_URL"),
-    )
+load_dotenv()
 
-    def gpt_validation(self, init_prompt: str, dialogue: str):
-        prompt = init_prompt.format(str(dialogue))
+# Размер контекстного окна модели в токенах (MODEL_CONTEXT_TOKENS в .env)
+DEFAULT_CONTEXT_TOKENS = 128000
+# Какую долю окна можно занять промтом и ответом: остаток - запас на погрешность подсчета токенов
+CONTEXT_SAFETY_RATIO = 0.9
+# Максимальный размер фрагмента на этапе map: чем меньше фрагменты, тем больше параллельных запросов
+MAP_CHUNK_TOKENS = int(os.getenv("MAP_CHUNK_TOKENS") or 12000)
+# Число параллельных запросов на этапах map и reduce (на один ключ API, см. endpoints.scale_workers)
+MAP_WORKERS = int(os.getenv("MAP_WORKERS") or 4)
 
-        messages = []
-        messages.append({"role": "user", "content": prompt})
 
-        response_big = self.client.chat.completions.create(
-            model=os.getenv("MODEL"),
-            messages=messages,
-            temperature=0.7,
-            n=1,
-            max_tokens=3000, # максимальное число ВЫХОДНЫХ токенов. Для большинства моделей не должно превышать 4096
-            extra_headers={ "X-Title": "My App" }, # опционально - передача информация об источнике API-вызова
-        )
+def get_text_statistics(text, model_name=None):
+    """
+    Получает статистику по тексту: символы, слова и токены.
+    
+    Args:
+        text: текст для анализа
+        model_name: имя модели для подсчета токенов
+        
+    Returns:
+        dict: словарь со статистикой {'characters': int, 'words': int, 'tokens': int}
+    """
+    return {
+        'characters': len(text) if text else 0,
+        'words': count_words(text),
+        'tokens': count_tokens(text, model_name)
+    }
 
-        return response_big.choices[0].message.content
 
-    def __call__(self, p: str, d: str):
-        return self.gpt_validation(p, d)
+def get_context_tokens():
+    """Размер контекстного окна модели: MODEL_CONTEXT_TOKENS из .env или значение по умолчанию."""
+    return int(os.getenv("MODEL_CONTEXT_TOKENS") or DEFAULT_CONTEXT_TOKENS)
 
 
-def extract_text_from_pdf(pdf_path):
+def prompt_text_budget(prompt_template, max_tokens, model_name=None):
     """
-    Извлекает весь текст из PDF файла, объединяя все страницы в один документ.
+    Сколько токенов текста можно подставить в промт, чтобы промт и ответ поместились в контекст.
     
     Args:
-        pdf_path: путь к PDF файлу
+        prompt_template: шаблон промта с одним местом {} под текст
+        max_tokens: максимальное число выходных токенов
+        model_name: имя модели для подсчета токенов
         
     Returns:
-        str: объединенный текст со всех страниц
+        int: бюджет токенов на подставляемый текст
     """
-    try:
-        reader = PdfReader(pdf_path)
-        full_text = []
-        
-        for page_num, page in enumerate(reader.pages, start=1):
-            text = page.extract_text()
-            if text.strip():  # Добавляем только непустые страницы
-                full_text.append(text)
-        
-        return "\n\n".join(full_text)
-    except Exception as e:
-        print(f"Ошибка при чтении файла {pdf_path}: {e}")
-        return None
+    context = int(get_context_tokens() * CONTEXT_SAFETY_RATIO)
+    return context - (max_tokens or 0) - count_tokens(prompt_template.format(""), model_name)
 
 
-def count_words(text):
+def split_oversized_text(text, budget, model_name=None, tokens=None):
     """
-    Подсчитывает количество слов в тексте.
+    Делит текст на части не длиннее budget токенов: по строкам, а слишком длинные строки - по символам.
     
     Args:
-        text: текст для подсчета
-        
+        tokens: уже подсчитанное число токенов текста, если есть
+    
     Returns:
-        int: количество слов
+        list: пары (часть текста, число токенов)
     """
-    if not text:
-        return 0
-    # Разделяем по пробелам и фильтруем пустые строки
-    words = re.findall(r'\b\w+\b', text)
-    return len(words)
+    if tokens is None:
+        tokens = count_tokens(text, model_name)
+    if tokens <= budget:
+        return [(text, tokens)]
+    
+    raw_lines = text.split("\n")
+    lines = []
+    for line, line_tokens in zip(raw_lines, count_tokens_batch(raw_lines, model_name)):
+        if line_tokens > budget:
+            step = max(1, len(line) * budget // (line_tokens + 1))
+            lines.extend(line[i:i + step] for i in range(0, len(line), step))
+        else:
+            lines.append(line)
+    
+    parts = []
+    current, current_tokens = [], 0
+    for line, line_tokens in zip(lines, count_tokens_batch(lines, model_name)):
+        line_tokens += 1  # перенос строки
+        if current and current_tokens + line_tokens > budget:
+            parts.append(("\n".join(current), current_tokens))
+            current, current_tokens = [], 0
+        current.append(line)
+        current_tokens += line_tokens
+    if current:
+        parts.append(("\n".join(current), current_tokens))
+    return parts
 
 
-def count_tokens(text, model_name=None):
+def build_chunks(documents, budget, model_name=None):
     """
-    Подсчитывает количество токенов в тексте для указанной модели.
+    Делит документы на фрагменты не длиннее budget токенов по границам страниц.
+    
+    Страница разрезается только если сама не помещается во фрагмент. Каждый фрагмент
+    начинается с заголовка ДОКУМЕНТ, чтобы модель знала, из какого файла текст.
     
     Args:
-        text: текст для подсчета
-        model_name: имя модели (если None, используется значение из переменной окружения MODEL)
+        documents: список пар (имя файла, список текстов страниц)
+        budget: максимальный размер фрагмента в токенах
+        model_name: имя модели для подсчета токенов
         
     Returns:
-        int: количество токенов
+        list: тексты фрагментов по порядку
     """
-    if not text:
-        return 0
+    chunks = []
+    current, current_tokens = [], 0
     
-    try:
-        # Получаем имя модели из переменной окружения, если не указано
-        if model_name is None:
-            model_name = os.getenv("MODEL", "gpt-4")
-        
-        # Определяем кодировку на основе модели
-        # Для большинства современных OpenAI моделей используется cl100k_base
-        # Для старых моделей GPT-2/GPT-3 используется gpt2
-        if "gpt-4" in model_name.lower() or "gpt-3.5" in model_name.lower() or "gpt-4o" in model_name.lower():
-            encoding_name = "cl100k_base"
-        elif "gpt-3" in model_name.lower():
-            encoding_name = "p50k_base"
-        else:
-            # По умолчанию используем cl100k_base (для GPT-4 и GPT-3.5-turbo)
-            encoding_name = "cl100k_base"
+    for pdf_file, pages in documents:
+        header = f"{'='*80}\nДОКУМЕНТ: {pdf_file} (продолжение)\n{'='*80}"
+        header_tokens = count_tokens(header, model_name)
+        doc_in_chunk = False
+        doc_started = False
         
-        encoding = tiktoken.get_encoding(encoding_name)
-        tokens = encoding.encode(text)
-        return len(tokens)
+        # Все страницы документа считаются одним пакетом
+        for page, page_tokens in zip(pages, count_tokens_batch(pages, model_name)):
+            parts = split_oversized_text(page, budget - header_tokens - 2, model_name, tokens=page_tokens)
+            for part, part_tokens in parts:
+                part_tokens += 2  # разделитель между страницами
+                needed = part_tokens if doc_in_chunk else part_tokens + header_tokens
+                if current and current_tokens + needed > budget:
+                    chunks.append("\n\n".join(current))
+                    current, current_tokens = [], 0
+                    doc_in_chunk = False
+                if not doc_in_chunk:
+                    title = f"ДОКУМЕНТ: {pdf_file}" + (" (продолжение)" if doc_started else "")
+                    current.append(f"{'='*80}\n{title}\n{'='*80}")
+                    current_tokens += header_tokens
+                    doc_in_chunk = doc_started = True
+                current.append(part)
+                current_tokens += part_tokens
+    
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def group_summaries(summaries, budget, model_name=None):
+    """
+    Группирует частичные суммаризации так, чтобы каждая группа помещалась в budget токенов.
+    
+    Returns:
+        list: тексты групп для этапа reduce
+    """
+    parts = [f"--- Часть {number} ---\n{summary}" for number, summary in enumerate(summaries, start=1)]
+    groups = []
+    current, current_tokens = [], 0
+    for part, part_tokens in zip(parts, count_tokens_batch(parts, model_name)):
+        part_tokens += 2  # разделитель между частями
+        if current and current_tokens + part_tokens > budget:
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(part)
+        current_tokens += part_tokens
+    if current:
+        groups.append(current)
+    
+    if len(groups) == len(summaries):
+        # Суммаризации слишком длинные для группировки по бюджету - объединяем попарно, чтобы reduce сходился
+        groups = [[part for group in groups[i:i + 2] for part in group] for i in range(0, len(groups), 2)]
+    return ["\n\n".join(group) for group in groups]
+
+
+def summarize_parallel(validator, prompt, texts, workers=MAP_WORKERS):
+    """Параллельно отправляет тексты в GPT с одним промтом, сохраняя порядок ответов."""
+    workers = max(1, min(workers, len(texts)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(lambda text: validator(prompt, text), texts))
+
+
+def _try_summarize(validator, prompt, text):
+    """Вызов GPT, который вместо исключения возвращает пару (суммаризация, ошибка)."""
+    try:
+        return validator(prompt, text), None
     except Exception as e:
-        print(f"Предупреждение: не удалось подсчитать токены ({e}), используется приблизительный подсчет")
-        # Приблизительный подсчет: 1 токен ≈ 4 символа для английского текста
-        # Для русского текста может быть больше, используем коэффициент 3
-        return len(text) // 3
+        return None, e
 
 
-def get_text_statistics(text, model_name=None):
+def summarize_chunks(validator, prompt, chunks, workers=MAP_WORKERS):
     """
-    Получает статистику по тексту: символы, слова и токены.
+    Map-этап: параллельно суммаризирует фрагменты; сбой одного фрагмента не прерывает остальные.
+    
+    Неудавшиеся фрагменты запрашиваются повторно один раз, оставшиеся пропускаются
+    с сообщением, из каких документов они были. Исключение поднимается, только если
+    не удалось суммаризировать ни одного фрагмента.
     
     Args:
-        text: текст для анализа
-        model_name: имя модели для подсчета токенов
+        validator: экземпляр GPT_Validator
+        prompt: промт суммаризации фрагмента
+        chunks: тексты фрагментов
+        workers: число параллельных запросов
         
     Returns:
-        dict: словарь со статистикой {'characters': int, 'words': int, 'tokens': int}
+        tuple: (суммаризации удавшихся фрагментов по порядку, номера пропущенных фрагментов с 1)
     """
-    return {
-        'characters': len(text) if text else 0,
-        'words': count_words(text),
-        'tokens': count_tokens(text, model_name)
-    }
+    def attempt(prompt, text):
+        return _try_summarize(validator, prompt, text)
+    
+    outcomes = summarize_parallel(attempt, prompt, chunks, workers)
+    failed = [i for i, (summary, _) in enumerate(outcomes) if summary is None]
+    if failed:
+        print(f"Map: не удалось суммаризировать {len(failed)} из {len(chunks)} фрагментов, повторная попытка")
+        retried = summarize_parallel(attempt, prompt, [chunks[i] for i in failed], workers)
+        for i, outcome in zip(failed, retried):
+            outcomes[i] = outcome
+    
+    summaries = [summary for summary, _ in outcomes if summary is not None]
+    skipped = []
+    last_error = None
+    for i, (summary, error) in enumerate(outcomes):
+        if summary is not None:
+            continue
+        skipped.append(i + 1)
+        last_error = error
+        files = sorted(set(re.findall(r"^ДОКУМЕНТ: (.+?)(?: \(продолжение\))?$", chunks[i], re.M)))
+        reason = describe_error(error) if error is not None else "пустой ответ модели"
+        print(f"Map: фрагмент {i + 1} ({', '.join(files)}) пропущен: {reason}")
+    
+    if not summaries:
+        raise RuntimeError(f"Не удалось суммаризировать ни одного из {len(chunks)} фрагментов") from last_error
+    if skipped:
+        print(f"ВНИМАНИЕ: итоговая суммаризация без фрагментов {', '.join(map(str, skipped))} из {len(chunks)}")
+    return summaries, skipped
+
+
+def map_reduce_summarize(validator, documents, workers=MAP_WORKERS):
+    """
+    Суммаризирует документы, не помещающиеся в контекст модели, по схеме map-reduce.
+    
+    Map: документы делятся на фрагменты по границам страниц, фрагменты суммаризируются параллельно;
+    фрагменты, не суммаризированные и после повтора, пропускаются (см. summarize_chunks).
+    Reduce: частичные суммаризации объединяются группами, пока не останется одна.
+    
+    Args:
+        validator: экземпляр GPT_Validator
+        documents: список пар (имя файла, список текстов страниц)
+        workers: число параллельных запросов
+        
+    Returns:
+        str: итоговая суммаризация
+    """
+    model_name = validator.model
+    map_budget = min(
+        MAP_CHUNK_TOKENS,
+        prompt_text_budget(PDF_CHUNK_SUMMARY_PROMPT, validator.max_tokens, model_name),
+    )
+    chunks = build_chunks(documents, map_budget, model_name)
+    print(f"Map: {len(chunks)} фрагментов до {map_budget:,} токенов, параллельных запросов: {workers}")
+    summaries, _ = summarize_chunks(validator, PDF_CHUNK_SUMMARY_PROMPT, chunks, workers)
+    
+    reduce_budget = prompt_text_budget(PDF_REDUCE_SUMMARY_PROMPT, validator.max_tokens, model_name)
+    level = 1
+    while len(summaries) > 1:
+        groups = group_summaries(summaries, reduce_budget, model_name)
+        print(f"Reduce, уровень {level}: {len(summaries)} суммаризаций -> {len(groups)}")
+        summaries = summarize_parallel(validator, PDF_REDUCE_SUMMARY_PROMPT, groups, workers)
+        level += 1
+    
+    return summaries[0]
 
 
 def combine_pdfs_and_summarize(pdf_file_list, data_folder="data"):
@@ -157,38 +296,41 @@ def combine_pdfs_and_summarize(pdf_file_list, data_folder="data"):
     print(f"Список файлов для обработки: {', '.join(pdf_file_list)}\n")
     
     # Инициализируем валидатор GPT
-    validator = GPT_Validator()
-    
-    # Промпт для суммаризации объединенного текста
-    summary_prompt = """Ты - опытный редактор и специалист по созданию кратких пересказов.
-    Тебе предоставлен объединенный текст из нескольких документов:
-    
-    Объединенный текст документов:
-    {}
-    
-    Создай краткую суммаризацию данного текста, выделив основные мысли, ключевые моменты и важные детали из всех документов.
-    Суммаризация должна быть информативной, структурированной и легко читаемой.
-    Обрати внимание на общие темы и связи между разными документами.
-    """
+    # Модель берется из MODEL в .env (см. llm_client.resolve_model), повторные запуски на тех же файлах читают ответы из кэша
+    cache = ResponseCache.from_env()
+    telemetry = Telemetry.from_env("pdf_combined_summary")
+    validator = GPT_Validator(
+        rate_limiter=RateLimiter.from_env(),
+        retry_policy=RetryPolicy(circuit_breaker=CircuitBreaker()),
+        cache=cache,
+        telemetry=telemetry,
+    )
     
     combined_text_parts = []
+    documents = []
+    headers = []
+    full_texts = []
     processed_files = []
     failed_files = []
     
-    # Извлекаем текст из каждого указанного PDF файла
+    existing_files = []
     for pdf_file in pdf_file_list:
-        pdf_path = os.path.join(data_folder, pdf_file)
-        
-        if not os.path.exists(pdf_path):
+        if not os.path.exists(os.path.join(data_folder, pdf_file)):
             print(f"ВНИМАНИЕ: Файл {pdf_file} не найден в папке {data_folder}")
             failed_files.append(pdf_file)
             continue
-        
-        print(f"Извлечение текста из файла: {pdf_file}...")
-        
-        # Извлекаем весь текст из PDF
-        full_text = extract_text_from_pdf(pdf_path)
-        print(full_text[:1000])
+        existing_files.append(pdf_file)
+    
+    # Извлекаем текст из всех файлов сразу (страницы распределяются по ядрам);
+    # текст остается постраничным: страницы нужны для разбиения на фрагменты
+    print(f"Извлечение текста из файлов: {', '.join(existing_files)}...")
+    extracted = extract_pdfs([os.path.join(data_folder, pdf_file) for pdf_file in existing_files])
+    print_extraction_timings(extracted)
+    print()
+    
+    for pdf_file, pdf in zip(existing_files, extracted):
+        pages = pdf.pages
+        full_text = pdf.text
         
         if not full_text:
             print(f"Не удалось извлечь текст из файла {pdf_file}\n")
@@ -201,19 +343,28 @@ def combine_pdfs_and_summarize(pdf_file_list, data_folder="data"):
             continue
         
         # Добавляем разделитель с именем файла перед текстом
-        text_with_header = f"\n\n{'='*80}\nДОКУМЕНТ: {pdf_file}\n{'='*80}\n\n{full_text}"
-        combined_text_parts.append(text_with_header)
+        header = f"\n\n{'='*80}\nДОКУМЕНТ: {pdf_file}\n{'='*80}\n\n"
+        combined_text_parts.append(header + full_text)
+        headers.append(header)
+        full_texts.append(full_text)
+        documents.append((pdf_file, pages))
         processed_files.append(pdf_file)
-        
-        # Получаем статистику по тексту
-        stats = get_text_statistics(full_text)
-        print(f"✓ Текст извлечен. Символов: {stats['characters']}, Слов: {stats['words']}, Токенов: {stats['tokens']}\n")
     
     # Проверяем, были ли успешно обработаны файлы
     if not combined_text_parts:
         print("Не удалось извлечь текст ни из одного файла!")
         return
     
+    # Считаем токены всех документов одним пакетом; итог по объединенному тексту -
+    # сумма по документам и заголовкам, без повторного кодирования всего текста
+    model_name = validator.model
+    doc_tokens = count_tokens_batch(full_texts, model_name)
+    header_tokens = count_tokens_batch(headers, model_name)
+    doc_words = [count_words(text) for text in full_texts]
+    for pdf_file, text, words, tokens in zip(processed_files, full_texts, doc_words, doc_tokens):
+        print(f"✓ {pdf_file}: Символов: {len(text)}, Слов: {words}, Токенов: {tokens}")
+    print()
+    
     if failed_files:
         print(f"Предупреждение: не удалось обработать следующие файлы: {', '.join(failed_files)}\n")
     
@@ -221,7 +372,11 @@ def combine_pdfs_and_summarize(pdf_file_list, data_folder="data"):
     combined_text = "\n".join(combined_text_parts)
     
     # Получаем статистику по объединенному тексту
-    combined_stats = get_text_statistics(combined_text)
+    combined_stats = {
+        'characters': len(combined_text),
+        'words': sum(doc_words) + sum(count_words(header) for header in headers),
+        'tokens': sum(doc_tokens) + sum(header_tokens),
+    }
     
     print(f"{'='*80}")
     print(f"СТАТИСТИКА ОБЪЕДИНЕНИЯ")
@@ -237,21 +392,35 @@ def combine_pdfs_and_summarize(pdf_file_list, data_folder="data"):
     print(f"Первые 1000 символов объединенного текста:\n{combined_text[:1000]}...\n")
     
     try:
-        # Отправляем объединенный текст в GPT для суммаризации
-        print("Отправка объединенного текста в GPT для создания суммаризации...\n")
-        summary = validator(summary_prompt, combined_text)
+        # Проверяем, помещается ли объединенный текст в контекст модели вместе с промтом и ответом
+        budget = prompt_text_budget(PDF_COMBINED_SUMMARY_PROMPT, validator.max_tokens, model_name)
+        if combined_stats['tokens'] <= budget:
+            print(f"Текст помещается в контекст модели ({combined_stats['tokens']:,} из {budget:,} токенов)")
+            print("Отправка объединенного текста в GPT для создания суммаризации...\n")
+            summary = validator(PDF_COMBINED_SUMMARY_PROMPT, combined_text)
+        else:
+            print(f"Текст не помещается в контекст модели ({combined_stats['tokens']:,} из {budget:,} токенов)")
+            print("Суммаризация по частям (map-reduce)...\n")
+            summary = map_reduce_summarize(validator, documents, scale_workers(MAP_WORKERS, validator.endpoint_pool))
         
         print(f"{'='*80}")
         print(f"РЕЗУЛЬТАТ СУММАРИЗАЦИИ ОБЪЕДИНЕННЫХ ДОКУМЕНТОВ")
         print(f"{'='*80}\n")
         print(summary)
         print(f"\n{'='*80}\n")
+        if cache is not None:
+            print(cache.summary())
         
         return summary
         
     except Exception as e:
         print(f"Ошибка при обработке объединенного текста в GPT: {e}\n")
         return None
+    finally:
+        if validator.endpoint_pool is not None:
+            print(validator.endpoint_pool.summary())
+        print(telemetry.format_summary())
+        telemetry.close()
 
 
 if __name__ == "__main__":
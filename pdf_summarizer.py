@@ -1,64 +1,38 @@
 import os
-from pypdf import PdfReader
-from openai import OpenAI
 from dotenv import load_dotenv
 
-load_dotenv()
-
-class GPT_Validator:
-    client = OpenAI(
-        api_key=os.getenv("API_KEY"), # ваш ключ в VseGPT после регистрации
-        base_url=os.getenv("BASE_URL"),
-    )
-
-    def gpt_validation(self, init_prompt: str, dialogue: str):
-        prompt = init_prompt.format(str(dialogue))
-
-        messages = []
-        messages.append({"role": "user", "content": prompt})
+from llm_cache import ResponseCache
+from llm_client import GPT_Validator
+from pdf_extract import extract_pdfs, print_extraction_timings
+from prompts import PDF_SUMMARY_PROMPT
+from rate_limiter import RateLimiter
+from retry import CircuitBreaker, RetryPolicy
+from telemetry import Telemetry
 
-        response_big = self.client.chat.completions.create(
-            # model="openai/gpt-4o-mini", # id модели из списка моделей - можно использовать OpenAI, Anthropic и пр. меняя только этот параметр openai/gpt-4o-mini
-            model=os.getenv("MODEL"),
-            messages=messages,
-            temperature=0.7,
-            n=1,
-            max_tokens=3000, # максимальное число ВЫХОДНЫХ токенов. Для большинства моделей не должно превышать 4096
-            extra_headers={ "X-Title": "My App" }, # опционально - передача информация об источнике API-вызова
-        )
-
-        return response_big.choices[0].message.content
-
-    def __call__(self, p: str, d: str):
-        return self.gpt_validation(p, d)
+load_dotenv()
 
 
-def extract_text_from_pdf(pdf_path):
+def format_stream_summary(stats_list):
     """
-    Извлекает весь текст из PDF файла, объединяя все страницы в один документ.
+    Сводка по потоковым вызовам: средний и максимальный TTFT, средняя скорость генерации.
     
     Args:
-        pdf_path: путь к PDF файлу
-        
-    Returns:
-        str: объединенный текст со всех страниц
+        stats_list: список StreamStats
     """
-    try:
-        reader = PdfReader(pdf_path)
-        full_text = []
-        
-        for page_num, page in enumerate(reader.pages, start=1):
-            text = page.extract_text()
-            if text.strip():  # Добавляем только непустые страницы
-                full_text.append(text)
-        
-        return "\n\n".join(full_text)
-    except Exception as e:
-        print(f"Ошибка при чтении файла {pdf_path}: {e}")
-        return None
+    ttfts = [stats.ttft for stats in stats_list if stats.ttft is not None]
+    speeds = [stats.tokens_per_second for stats in stats_list if stats.tokens_per_second is not None]
+    if not ttfts:
+        return f"Потоковых вызовов: {len(stats_list)} (все из кэша)"
+    line = (
+        f"Потоковых вызовов: {len(stats_list)}, TTFT: средний {sum(ttfts) / len(ttfts):.2f} сек, "
+        f"макс. {max(ttfts):.2f} сек"
+    )
+    if speeds:
+        line += f", скорость генерации: {sum(speeds) / len(speeds):.1f} ток/сек"
+    return line
 
 
-def process_pdf_files(data_folder="data"):
+def process_pdf_files(data_folder="data", stream=True):
     """
     Обрабатывает все PDF файлы из указанной папки:
     1. Извлекает текст из всех страниц каждого PDF
@@ -67,6 +41,7 @@ def process_pdf_files(data_folder="data"):
     
     Args:
         data_folder: путь к папке с PDF файлами (по умолчанию "data")
+        stream: печатать пересказ по мере генерации и замерять TTFT и скорость генерации
     """
     if not os.path.exists(data_folder):
         print(f"Папка {data_folder} не найдена!")
@@ -82,30 +57,27 @@ def process_pdf_files(data_folder="data"):
     pdf_files.sort()  # Сортируем для упорядоченного вывода
     
     # Инициализируем валидатор GPT
-    validator = GPT_Validator()
-    
-    # Промпт для краткого пересказа
-    summary_prompt = """Ты - опытный редактор и специалист по созданию кратких пересказов.
-    Тебе предоставлен текст из документа:
+    # Модель берется из MODEL в .env (см. llm_client.resolve_model), повторные запуски на тех же файлах читают ответы из кэша
+    cache = ResponseCache.from_env()
+    telemetry = Telemetry.from_env("pdf_summary")
+    validator = GPT_Validator(
+        rate_limiter=RateLimiter.from_env(),
+        retry_policy=RetryPolicy(circuit_breaker=CircuitBreaker()),
+        cache=cache,
+        telemetry=telemetry,
+    )
     
-    Текст документа:
-    {}
-    
-    Создай краткий пересказ данного текста, выделив основные мысли, ключевые моменты и важные детали.
-    Пересказ должен быть информативным, структурированным и легко читаемым.
-    """
+    # Извлекаем текст из всех PDF сразу: страницы всех файлов распределяются по ядрам
+    extracted = extract_pdfs([os.path.join(data_folder, pdf_file) for pdf_file in pdf_files])
+    print_extraction_timings(extracted)
     
     # Обрабатываем каждый PDF файл
-    for pdf_file in pdf_files:
-        pdf_path = os.path.join(data_folder, pdf_file)
-        
+    for pdf_file, pdf in zip(pdf_files, extracted):
         print(f"\n{'='*80}")
         print(f"Обработка файла: {pdf_file}")
         print(f"{'='*80}\n")
         
-        # Извлекаем весь текст из PDF
-        full_text = extract_text_from_pdf(pdf_path)
-        print(full_text[:300])
+        full_text = pdf.text
         
         if not full_text:
             print(f"Не удалось извлечь текст из файла {pdf_file}\n")
@@ -121,17 +93,32 @@ def process_pdf_files(data_folder="data"):
         try:
             # Отправляем текст в GPT для получения краткого пересказа
             print("Отправка текста в GPT для создания краткого пересказа...\n")
-            summary = validator(summary_prompt, full_text)
-            
             print(f"{'='*80}")
             print(f"КРАТКИЙ ПЕРЕСКАЗ для файла: {pdf_file}")
             print(f"{'='*80}\n")
-            print(summary)
+            if stream:
+                summary_stream = validator(PDF_SUMMARY_PROMPT, full_text, stream=True)
+                for delta in summary_stream:
+                    print(delta, end="", flush=True)
+                print()
+                print(f"\n[{summary_stream.stats.summary()}]")
+            else:
+                summary = validator(PDF_SUMMARY_PROMPT, full_text)
+                print(summary)
             print(f"\n{'='*80}\n")
             
         except Exception as e:
             print(f"Ошибка при обработке файла {pdf_file} в GPT: {e}\n")
 
+    if validator.stream_stats:
+        print(format_stream_summary(validator.stream_stats))
+    if cache is not None:
+        print(cache.summary())
+    if validator.endpoint_pool is not None:
+        print(validator.endpoint_pool.summary())
+    print(telemetry.format_summary())
+    telemetry.close()
+
 
 if __name__ == "__main__":
     process_pdf_files("data")
@@ -1,10 +1,13 @@
-"""Промты для генерации гороскопов."""
+"""Промты для генерации гороскопов, суммаризации PDF и проверки чатов."""
 
-HOROSCOPE_PROMPT = HOROSCOPE_PROMPT = """Группа Актион — российская медиакомпания. Выпускает справочные и справочно-образовательные системы, печатные и электронные журналы, образовательные курсы для бухгалтеров, кадровиков, финансистов, юристов, медиков, учителей и управленцев.
+# Общие части промта гороскопа: HOROSCOPE_PROMPT (один сотрудник) и HOROSCOPE_PACK_PROMPT (несколько)
+HOROSCOPE_INTRO = """Группа Актион — российская медиакомпания. Выпускает справочные и справочно-образовательные системы, печатные и электронные журналы, образовательные курсы для бухгалтеров, кадровиков, финансистов, юристов, медиков, учителей и управленцев.
 
 Задача - Напиши персональный гороскоп на 2026 год Огненной Лошади для сотрудника компании.
 
-Сотрудник: {name}
+"""
+
+HOROSCOPE_EMPLOYEE = """Сотрудник: {name}
 Должность: {position}
 Город: {city}
 Дата рождения: {birthdate}
@@ -12,7 +15,9 @@ HOROSCOPE_PROMPT = HOROSCOPE_PROMPT = """Группа Актион — росс
 Китайский знак зодиака: {zodiac_animal}
 Пиньинь: {pinyin}
 
-Гороскоп сделай с учетом даты рождения и года рождения. Чем персональнее гороскоп тем лучше. 
+"""
+
+HOROSCOPE_RULES = """Гороскоп сделай с учетом даты рождения и года рождения. Чем персональнее гороскоп тем лучше. 
 Учитывай китайский зодиак. Помимо 12 животных, китайский зодиак включает пять стихий: дерево, огонь, землю, металл и воду. 
 Учитывай энергию, элемент, небесные стволы, земные ветви и знаки.
 
@@ -42,3 +47,117 @@ HOROSCOPE_PROMPT = HOROSCOPE_PROMPT = """Группа Актион — росс
 Девиз года: «Кую кадры, пока горячо, и отбираю лучших, пока не остыли».
 
 """
+
+HOROSCOPE_PROMPT = HOROSCOPE_INTRO + HOROSCOPE_EMPLOYEE + HOROSCOPE_RULES
+
+# Повторный запрос гороскопа, не прошедшего проверку структуры (horoscope_checks.py).
+HOROSCOPE_FIX_PROMPT = HOROSCOPE_PROMPT + """Предыдущий вариант гороскопа этого сотрудника не прошел проверку: {problems}.
+Напиши гороскоп заново: все четыре раздела с заголовками как в примере, обращение по имени, упоминание города.
+"""
+
+
+# Пакет сотрудников в одном запросе (horoscope_generator.py, pack_size > 1).
+# {count} и {cards} подставляются через str.format, поэтому фигурные скобки JSON удвоены.
+HOROSCOPE_PACK_PROMPT = HOROSCOPE_INTRO + """Гороскопы нужны для {count} сотрудников, каждому — свой, персональный.
+
+{cards}
+
+""" + HOROSCOPE_RULES + """
+Ответ верни строго в формате JSON без пояснений:
+{{"horoscopes": [{{"id": "<id сотрудника>", "horoscope": "<текст гороскопа>"}}]}}
+В массиве horoscopes по одному элементу на каждый id из списка выше, всего {count}.
+Текст гороскопа оформи как в примере: имя, должность, город, строка с датой и знаками, затем четыре раздела.
+"""
+
+
+# Промпт для краткого пересказа одного PDF документа (pdf_summarizer.py)
+PDF_SUMMARY_PROMPT = """Ты - опытный редактор и специалист по созданию кратких пересказов.
+    Тебе предоставлен текст из документа:
+    
+    Текст документа:
+    {}
+    
+    Создай краткий пересказ данного текста, выделив основные мысли, ключевые моменты и важные детали.
+    Пересказ должен быть информативным, структурированным и легко читаемым.
+    """
+
+
+# Промпт для суммаризации объединенного текста нескольких PDF (pdf_multiple_summarizer.py)
+PDF_COMBINED_SUMMARY_PROMPT = """Ты - опытный редактор и специалист по созданию кратких пересказов.
+    Тебе предоставлен объединенный текст из нескольких документов:
+    
+    Объединенный текст документов:
+    {}
+    
+    Создай краткую суммаризацию данного текста, выделив основные мысли, ключевые моменты и важные детали из всех документов.
+    Суммаризация должна быть информативной, структурированной и легко читаемой.
+    Обрати внимание на общие темы и связи между разными документами.
+    """
+
+
+# Промпт специалиста контроля качества: разбор диалога Оператора с Пользователем (openai_agent.py)
+CHAT_INSPECTOR_PROMPT = """Ты - опытный специалист службы контроля качества работы колл-центра экспертной поддержки.
+            Тебе для анализа передали диалог Оператора с Пользователем: 
+            Текст диалога: {}
+            
+            Оцени качество работы оператора. Остался ли Пользователь доволен ответами, не выражал ли Пользователь неудовольствие.
+            Выдай аргументированный ответ. В конце прими решение, достоин ли Оператор новогодней премии. 
+            Лишать Оператора премии можно только в случае явного недовольства пользователя.
+            Напиши резолюцию
+            """
+
+
+# Промпт руководителя: резолюция по докладу специалиста (openai_agent.py)
+CHAT_MANAGER_PROMPT = """Ты - мудрый и опытный руководитель колл-центра экспертной поддержки. 
+            Ты получил сообщение от Специалиста службы контроля качества, который оценил работу твоих сотрудников.
+            Твоя задача быть справедливым к своим сотрудникам и штрафовать Операторов только в тех случаях, 
+            когда в докладе явно указано на недовольство Пользователя ответами Оператора.
+            
+            Доклад Специалиста отдела по оценке качества сотрудников колл-центра:
+            {}
+            
+            Внимательно прочитай доклад и прими решение о том, необходимо ли штрафовать Оператора.
+
+            Напиши краткую резолюцию, без объяснений: 
+            ### Не штрафовать Оператора / Оштрафовать Оператора
+            """
+
+
+# Промпт проверки чата за один вызов: доклад и резолюция в одном JSON (openai_agent.py, режим single_call).
+# Фигурные скобки JSON удвоены, так как промпт заполняется через str.format.
+CHAT_VERDICT_JSON_PROMPT = """Ты - опытный специалист службы контроля качества работы колл-центра экспертной поддержки.
+            Тебе для анализа передали диалог Оператора с Пользователем: 
+            Текст диалога: {}
+            
+            Оцени качество работы оператора. Остался ли Пользователь доволен ответами, не выражал ли Пользователь неудовольствие.
+            Выдай аргументированный ответ. Затем прими решение, необходимо ли штрафовать Оператора.
+            Штрафовать Оператора можно только в случае явного недовольства пользователя.
+
+            Ответь строго одним JSON-объектом без пояснений вокруг него:
+            {{"report": "аргументированный доклад о качестве работы оператора", "verdict": "Не штрафовать" или "Оштрафовать"}}
+            """
+
+
+# Этап "map": пересказ одного фрагмента длинного набора документов (pdf_multiple_summarizer.py)
+PDF_CHUNK_SUMMARY_PROMPT = """Ты - опытный редактор и специалист по созданию кратких пересказов.
+    Тебе предоставлен фрагмент большого набора документов. Заголовки ДОКУМЕНТ указывают, из какого файла текст:
+    
+    Фрагмент:
+    {}
+    
+    Создай краткую суммаризацию фрагмента, выделив основные мысли, ключевые моменты и важные детали.
+    Сохрани названия документов, даты, суммы и стороны, чтобы их можно было объединить с другими фрагментами.
+    """
+
+
+# Этап "reduce": объединение частичных суммаризаций в одну (pdf_multiple_summarizer.py)
+PDF_REDUCE_SUMMARY_PROMPT = """Ты - опытный редактор и специалист по созданию кратких пересказов.
+    Тебе предоставлены суммаризации последовательных фрагментов нескольких документов:
+    
+    Суммаризации фрагментов:
+    {}
+    
+    Объедини их в одну краткую суммаризацию, выделив основные мысли, ключевые моменты и важные детали из всех документов.
+    Суммаризация должна быть информативной, структурированной и легко читаемой.
+    Обрати внимание на общие темы и связи между разными документами, убери повторы.
+    """
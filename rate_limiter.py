@@ -0,0 +1,155 @@
+"""Ограничитель частоты запросов к LLM по бюджетам RPM и TPM.
+
+Два "ведра" (token bucket) — запросов в минуту и токенов в минуту —
+пополняются непрерывно. Перед вызовом резервируется один запрос и оценка
+токенов (промт по tokens.count_tokens + ожидаемый ответ), после ответа резерв
+исправляется по фактическому response.usage.
+
+Один экземпляр можно разделять между потоками (acquire) и корутинами
+(acquire_async): состояние защищено threading.Lock, ожидание идет вне его.
+
+Лимиты из окружения: LLM_RPM_LIMIT, LLM_TPM_LIMIT, LLM_EXPECTED_COMPLETION_TOKENS.
+Лимиты задаются на один ключ API: при пуле endpoint-ов (endpoints.py) они
+умножаются на число endpoint-ов.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from endpoints import get_endpoint_pool
+from tokens import count_tokens
+
+
+# Сколько выходных токенов закладывать в резерв, если не задано явно.
+DEFAULT_EXPECTED_COMPLETION_TOKENS = 1000
+
+
+def estimate_prompt_tokens(prompt: str, model_name: Optional[str] = None) -> int:
+    """Оценивает число токенов промта через общий счетчик tokens.count_tokens."""
+    return count_tokens(prompt, model_name)
+
+
+@dataclass
+class Reservation:
+    """Резерв бюджета под один вызов; нужен для последующей корректировки."""
+
+    tokens: int
+    settled: bool = False
+
+
+class _Bucket:
+    """Непрерывно пополняемое ведро емкостью capacity за 60 секунд."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Сколько секунд ждать, пока в ведре наберется amount."""
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+
+class RateLimiter:
+    """Общий лимитер RPM/TPM для синхронных и асинхронных вызывающих."""
+
+    def __init__(
+        self,
+        rpm: Optional[float] = None,
+        tpm: Optional[float] = None,
+        expected_completion_tokens: int = DEFAULT_EXPECTED_COMPLETION_TOKENS,
+    ):
+        self.requests = _Bucket(rpm) if rpm else None
+        self.tokens = _Bucket(tpm) if tpm else None
+        self.expected_completion_tokens = expected_completion_tokens
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> Optional["RateLimiter"]:
+        """Создает лимитер по переменным окружения или None, если лимиты не заданы."""
+        rpm = float(os.getenv("LLM_RPM_LIMIT") or 0)
+        tpm = float(os.getenv("LLM_TPM_LIMIT") or 0)
+        if not rpm and not tpm:
+            return None
+        expected = int(
+            os.getenv("LLM_EXPECTED_COMPLETION_TOKENS") or DEFAULT_EXPECTED_COMPLETION_TOKENS
+        )
+        pool = get_endpoint_pool()
+        if pool is not None:
+            rpm *= len(pool.endpoints)
+            tpm *= len(pool.endpoints)
+        return cls(rpm=rpm or None, tpm=tpm or None, expected_completion_tokens=expected)
+
+    def estimate(self, prompt: str, max_tokens: Optional[int] = None) -> int:
+        completion = self.expected_completion_tokens
+        if max_tokens:
+            completion = min(completion, max_tokens)
+        return estimate_prompt_tokens(prompt) + completion
+
+    def _try_reserve(self, tokens: int) -> float:
+        """Резервирует бюджет и возвращает 0 или время ожидания до следующей попытки."""
+        with self._lock:
+            now = time.monotonic()
+            wait = 0.0
+            for bucket, amount in ((self.requests, 1), (self.tokens, tokens)):
+                if bucket is not None:
+                    bucket.refill(now)
+                    wait = max(wait, bucket.wait_time(amount))
+            if wait > 0:
+                return wait
+            if self.requests is not None:
+                self.requests.level -= 1
+            if self.tokens is not None:
+                self.tokens.level -= min(tokens, self.tokens.capacity)
+            return 0.0
+
+    def acquire(self, prompt: str, max_tokens: Optional[int] = None) -> Reservation:
+        """Блокирует поток, пока бюджет не позволит отправить запрос."""
+        tokens = self.estimate(prompt, max_tokens)
+        while True:
+            wait = self._try_reserve(tokens)
+            if not wait:
+                return Reservation(tokens=tokens)
+            time.sleep(wait)
+
+    async def acquire_async(self, prompt: str, max_tokens: Optional[int] = None) -> Reservation:
+        """Асинхронный вариант acquire: ждет через asyncio.sleep."""
+        tokens = self.estimate(prompt, max_tokens)
+        while True:
+            wait = self._try_reserve(tokens)
+            if not wait:
+                return Reservation(tokens=tokens)
+            await asyncio.sleep(wait)
+
+    def reconcile(self, reservation: Reservation, usage: Any = None) -> None:
+        """Исправляет резерв по фактическому usage.
+
+        Без usage (ошибка до ответа модели) оценочные токены возвращаются в ведро,
+        а запрос остается учтенным.
+        """
+        if reservation.settled:
+            return
+        reservation.settled = True
+        if self.tokens is None:
+            return
+        actual = getattr(usage, "total_tokens", None) if usage is not None else 0
+        if actual is None:
+            return
+        with self._lock:
+            self.tokens.refill(time.monotonic())
+            # Разница может быть отрицательной: перерасход уходит в долг ведра.
+            self.tokens.level = min(
+                self.tokens.capacity, self.tokens.level + reservation.tokens - actual
+            )
@@ -1,5 +1,10 @@
 import os
-from pypdf import PdfReader
+from dotenv import load_dotenv
+
+from pdf_extract import extract_pdfs, print_extraction_timings
+
+load_dotenv()
+
 
 def read_pdf_files(data_folder="data"):
     """
@@ -21,29 +26,28 @@ def read_pdf_files(data_folder="data"):
     
     pdf_files.sort()  # Сортируем для упорядоченного вывода
     
-    # Читаем каждый PDF файл
-    for pdf_file in pdf_files:
-        pdf_path = os.path.join(data_folder, pdf_file)
+    # Извлекаем текст всех файлов параллельно, сохраняя пустые страницы для вывода
+    extracted = extract_pdfs(
+        [os.path.join(data_folder, pdf_file) for pdf_file in pdf_files], keep_empty=True
+    )
+    
+    # Выводим каждый PDF файл
+    for pdf_file, pdf in zip(pdf_files, extracted):
+        if pdf.error is not None:
+            continue  # ошибка уже выведена при извлечении
         
-        try:
-            print(f"\n{'='*80}")
-            print(f"Файл: {pdf_file}")
-            print(f"{'='*80}\n")
-            
-            reader = PdfReader(pdf_path)
-            num_pages = len(reader.pages)
-            
-            print(f"Количество страниц: {num_pages}\n")
-            
-            # Извлекаем текст со всех страниц
-            for page_num, page in enumerate(reader.pages, start=1):
-                print(f"--- Страница {page_num} ---")
-                text = page.extract_text()
-                print(text)
-                print()
-                
-        except Exception as e:
-            print(f"Ошибка при чтении файла {pdf_file}: {e}\n")
+        print(f"\n{'='*80}")
+        print(f"Файл: {pdf_file}")
+        print(f"{'='*80}\n")
+        
+        print(f"Количество страниц: {pdf.num_pages}\n")
+        
+        for page_num, text in zip(pdf.page_numbers, pdf.pages):
+            print(f"--- Страница {page_num} ---")
+            print(text)
+            print()
+    
+    print_extraction_timings(extracted)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,242 @@
+"""Повторы вызовов LLM с экспоненциальной задержкой и автоматический выключатель.
+
+RetryPolicy классифицирует ошибки клиента OpenAI: 429, 5xx, таймауты и обрывы
+соединения повторяются с экспоненциальной задержкой и полным джиттером,
+заголовок Retry-After соблюдается. Остальные ошибки (400, 401, ...) сразу
+пробрасываются.
+
+CircuitBreaker общий для всех воркеров: после серии подряд идущих сбоев он
+размыкается, и все вызовы ждут cooldown вместо того, чтобы расходовать
+попытки на каждую оставшуюся запись. Затем один пробный вызов решает,
+замкнуть цепь или снова разомкнуть.
+"""
+
+import asyncio
+import datetime
+import email.utils
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+import openai
+
+
+def classify_error(exc: BaseException) -> Optional[str]:
+    """Возвращает класс повторяемой ошибки или None, если повтор бессмыслен."""
+    if isinstance(exc, openai.RateLimitError):
+        return "rate_limit"
+    if isinstance(exc, openai.APITimeoutError):
+        return "timeout"
+    if isinstance(exc, openai.APIConnectionError):
+        return "connection"
+    if isinstance(exc, openai.APIStatusError):
+        if exc.status_code == 429:
+            return "rate_limit"
+        if exc.status_code in (408, 409) or exc.status_code >= 500:
+            return "server"
+    return None
+
+
+def describe_error(exc: BaseException) -> str:
+    """Короткое описание ошибки для колонки error в результатах."""
+    kind = classify_error(exc)
+    status = getattr(exc, "status_code", None)
+    label = kind or type(exc).__name__
+    if status is not None:
+        label = f"{label} ({status})"
+    return f"{label}: {exc}"[:500]
+
+
+def get_retry_after(exc: BaseException) -> Optional[float]:
+    """Читает Retry-After / retry-after-ms из ответа сервера, в секундах."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    # HTTP-дата; мусор в заголовке не должен подменять исходную ошибку API.
+    try:
+        parsed = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, parsed.timestamp() - time.time())
+
+
+class CircuitBreaker:
+    """Размыкается после failure_threshold подряд сбоев на reset_timeout секунд."""
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        max_reset_timeout: float = 300.0,
+    ):
+        self.failure_threshold = failure_threshold
+        self.base_reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self) -> float:
+        """0 — вызов разрешен, иначе сколько секунд подождать перед новой проверкой."""
+        with self._lock:
+            if self.state == "closed":
+                return 0.0
+            now = time.monotonic()
+            if self.state == "open":
+                remaining = self.opened_at + self.reset_timeout - now
+                if remaining > 0:
+                    return remaining
+                self.state = "half_open"
+                self._probe_in_flight = False
+            # half_open: пропускаем ровно один пробный вызов, остальные ждут его исхода.
+            if not self._probe_in_flight:
+                self._probe_in_flight = True
+                return 0.0
+            return min(1.0, self.base_reset_timeout)
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != "closed":
+                print("Выключатель замкнут: endpoint снова отвечает")
+            self.state = "closed"
+            self.failures = 0
+            self.reset_timeout = self.base_reset_timeout
+            self._probe_in_flight = False
+
+    def release_probe(self) -> None:
+        """Вызов прерван без исхода (отмена задачи, KeyboardInterrupt): следующий вызов станет пробным."""
+        with self._lock:
+            if self.state == "half_open":
+                self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open":
+                self.reset_timeout = min(self.reset_timeout * 2, self.max_reset_timeout)
+                self._open()
+            elif self.state == "closed" and self.failures >= self.failure_threshold:
+                self._open()
+
+    def _open(self) -> None:
+        self.state = "open"
+        self.opened_at = time.monotonic()
+        self._probe_in_flight = False
+        print(
+            f"Выключатель разомкнут после {self.failures} сбоев подряд, "
+            f"пауза {self.reset_timeout:.1f} сек"
+        )
+
+
+class RetryPolicy:
+    """Повторы с экспоненциальной задержкой, полным джиттером и учетом Retry-After."""
+
+    def __init__(
+        self,
+        max_attempts: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.circuit_breaker = circuit_breaker
+
+    def backoff(self, attempt: int, exc: BaseException) -> float:
+        """Задержка перед попыткой attempt + 1 (attempt считается с 1)."""
+        ceiling = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        delay = random.uniform(0, ceiling)
+        retry_after = get_retry_after(exc)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+    def _should_retry(self, attempt: int, exc: BaseException) -> bool:
+        kind = classify_error(exc)
+        if kind is None:
+            # Сервер ответил осмысленной ошибкой (400, 401, ...) — он доступен.
+            self._on_success()
+            return False
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.record_failure()
+        return attempt < self.max_attempts
+
+    def _on_success(self) -> None:
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.record_success()
+
+    def _on_cancel(self) -> None:
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.release_probe()
+
+    def call(self, func: Callable[[], Any]) -> Any:
+        """Выполняет func с повторами; после исчерпания попыток пробрасывает ошибку."""
+        attempt = 0
+        while True:
+            if self.circuit_breaker is not None:
+                wait = self.circuit_breaker.before_call()
+                while wait:
+                    time.sleep(wait)
+                    wait = self.circuit_breaker.before_call()
+            attempt += 1
+            try:
+                result = func()
+            except Exception as exc:
+                if not self._should_retry(attempt, exc):
+                    raise
+                delay = self.backoff(attempt, exc)
+                print(f"Повтор {attempt}/{self.max_attempts - 1} через {delay:.1f} сек: {describe_error(exc)}")
+                time.sleep(delay)
+                continue
+            except BaseException:
+                self._on_cancel()
+                raise
+            self._on_success()
+            return result
+
+    async def call_async(self, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Асинхронный вариант call."""
+        attempt = 0
+        while True:
+            if self.circuit_breaker is not None:
+                wait = self.circuit_breaker.before_call()
+                while wait:
+                    await asyncio.sleep(wait)
+                    wait = self.circuit_breaker.before_call()
+            attempt += 1
+            try:
+                result = await func()
+            except Exception as exc:
+                if not self._should_retry(attempt, exc):
+                    raise
+                delay = self.backoff(attempt, exc)
+                print(f"Повтор {attempt}/{self.max_attempts - 1} через {delay:.1f} сек: {describe_error(exc)}")
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # CancelledError (отмена задачи) — не Exception: без этого пробный вызов не завершится никогда.
+                self._on_cancel()
+                raise
+            self._on_success()
+            return result
@@ -0,0 +1,352 @@
+"""Телеметрия вызовов LLM: структурированное событие на каждый вызов и сводка запуска.
+
+Валидатор (llm_client) создает CallEvent по времени вызова и response.usage
+и передает его в Telemetry, а она — во все подключенные приемники:
+- JsonlSink — по строке JSON на вызов;
+- CsvSink — таблица с теми же полями;
+- PrometheusTextfileSink — агрегаты в формате textfile collector node_exporter
+  (файл атомарно перезаписывается не чаще flush_interval секунд и при закрытии).
+
+В конце запуска format_summary() печатает пропускную способность,
+перцентили задержки, токены и оценку стоимости.
+
+Настройки из окружения (.env):
+- LLM_TELEMETRY — список приемников через запятую: jsonl, csv, prom
+  (по умолчанию jsonl; off — только сводка без файлов);
+- LLM_TELEMETRY_DIR — папка для файлов (по умолчанию telemetry/);
+- LLM_PRICE_INPUT, LLM_PRICE_OUTPUT, LLM_PRICE_CACHED_INPUT — цены в $ за 1M токенов,
+  переопределяют таблицу MODEL_PRICES.
+"""
+
+import csv
+import json
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass, fields
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_TELEMETRY_DIR = os.path.join(BASE_DIR, "telemetry")
+TELEMETRY_SINKS = ("jsonl", "csv", "prom")
+
+# $ за 1M токенов: (вход, выход, вход из кэша провайдера). Ключ ищется как подстрока id модели.
+MODEL_PRICES: Dict[str, Tuple[float, float, float]] = {
+    "gpt-4o-mini": (0.15, 0.60, 0.075),
+    "gpt-4o": (2.50, 10.00, 1.25),
+    "gpt-4.1-mini": (0.40, 1.60, 0.10),
+    "gpt-4.1": (2.00, 8.00, 0.50),
+}
+
+# Границы корзин гистограммы задержки для Prometheus, сек
+LATENCY_BUCKETS = (0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def percentile(values: Sequence[float], q: float) -> Optional[float]:
+    """Перцентиль q (0..100) с линейной интерполяцией."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    if len(ordered) == 1:
+        return ordered[0]
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    fraction = position - lower
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * fraction
+
+
+def get_prices(model: str) -> Optional[Tuple[float, float, float]]:
+    """Цены модели за 1M токенов или None, если они неизвестны."""
+    input_price = os.getenv("LLM_PRICE_INPUT")
+    output_price = os.getenv("LLM_PRICE_OUTPUT")
+    if input_price and output_price:
+        cached_price = os.getenv("LLM_PRICE_CACHED_INPUT") or input_price
+        return float(input_price), float(output_price), float(cached_price)
+    name = (model or "").lower()
+    # Самый длинный подходящий ключ: "gpt-4o-mini" важнее "gpt-4o".
+    for key in sorted(MODEL_PRICES, key=len, reverse=True):
+        if key in name:
+            return MODEL_PRICES[key]
+    return None
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> Optional[float]:
+    prices = get_prices(model)
+    if prices is None:
+        return None
+    input_price, output_price, cached_price = prices
+    uncached = max(0, prompt_tokens - cached_tokens)
+    return (uncached * input_price + cached_tokens * cached_price + completion_tokens * output_price) / 1_000_000
+
+
+@dataclass
+class CallEvent:
+    """Один вызов LLM."""
+
+    timestamp: float  # начало вызова, unix time
+    run: str
+    model: str
+    status: str  # ok | cache_hit | error
+    latency: float  # от начала вызова до ответа, включая повторы, сек
+    attempts: int = 1
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0  # токены промта из кэша провайдера (usage.prompt_tokens_details)
+    stream: bool = False
+    ttft: Optional[float] = None
+    hedges: int = 0  # дубли запроса (hedging.py)
+    hedge_won: bool = False  # ответ дал дубль
+    cost: Optional[float] = None
+    error: Optional[str] = None
+
+    @classmethod
+    def from_usage(cls, usage: Any, **kwargs: Any) -> "CallEvent":
+        """Событие с токенами из response.usage и оценкой стоимости."""
+        event = cls(**kwargs)
+        if usage is not None:
+            event.prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+            event.completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+            details = getattr(usage, "prompt_tokens_details", None)
+            event.cached_tokens = getattr(details, "cached_tokens", 0) or 0
+        if event.status == "ok":
+            event.cost = estimate_cost(
+                event.model, event.prompt_tokens, event.completion_tokens, event.cached_tokens
+            )
+        return event
+
+
+EVENT_COLUMNS = [f.name for f in fields(CallEvent)]
+
+
+class JsonlSink:
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def emit(self, event: CallEvent) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(asdict(event), ensure_ascii=False) + "\n")
+
+    def close(self) -> None:
+        pass
+
+
+class CsvSink:
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def emit(self, event: CallEvent) -> None:
+        new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        with open(self.path, "a", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=EVENT_COLUMNS)
+            if new_file:
+                writer.writeheader()
+            writer.writerow(asdict(event))
+
+    def close(self) -> None:
+        pass
+
+
+class PrometheusTextfileSink:
+    """Агрегаты для textfile collector: счетчики вызовов, токенов, стоимости и гистограмма задержки."""
+
+    def __init__(self, path: str, flush_interval: float = 5.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.requests: Dict[Tuple[str, str, str], int] = {}
+        self.tokens: Dict[Tuple[str, str, str], int] = {}
+        self.cost: Dict[Tuple[str, str], float] = {}
+        self.hedges: Dict[Tuple[str, str], int] = {}
+        self.hedge_wins: Dict[Tuple[str, str], int] = {}
+        self.latency_buckets: Dict[Tuple[str, str], List[int]] = {}
+        self.latency_sum: Dict[Tuple[str, str], float] = {}
+        self.latency_count: Dict[Tuple[str, str], int] = {}
+        self._last_flush = 0.0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def emit(self, event: CallEvent) -> None:
+        key = (event.run, event.model)
+        status_key = (event.run, event.model, event.status)
+        self.requests[status_key] = self.requests.get(status_key, 0) + 1
+        for kind, value in (
+            ("prompt", event.prompt_tokens),
+            ("completion", event.completion_tokens),
+            ("cached", event.cached_tokens),
+        ):
+            token_key = (event.run, event.model, kind)
+            self.tokens[token_key] = self.tokens.get(token_key, 0) + value
+        if event.cost:
+            self.cost[key] = self.cost.get(key, 0.0) + event.cost
+        if event.hedges:
+            self.hedges[key] = self.hedges.get(key, 0) + event.hedges
+            self.hedge_wins[key] = self.hedge_wins.get(key, 0) + int(event.hedge_won)
+        if event.status == "ok":
+            buckets = self.latency_buckets.setdefault(key, [0] * len(LATENCY_BUCKETS))
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if event.latency <= bound:
+                    buckets[index] += 1
+            self.latency_sum[key] = self.latency_sum.get(key, 0.0) + event.latency
+            self.latency_count[key] = self.latency_count.get(key, 0) + 1
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    @staticmethod
+    def _labels(**labels: str) -> str:
+        parts = []
+        for name, value in labels.items():
+            value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+            parts.append(f'{name}="{value}"')
+        return "{" + ",".join(parts) + "}"
+
+    def render(self) -> str:
+        lines = [
+            "# HELP llm_requests_total Вызовы LLM по статусу",
+            "# TYPE llm_requests_total counter",
+        ]
+        for (run, model, status), value in sorted(self.requests.items()):
+            lines.append(f"llm_requests_total{self._labels(run=run, model=model, status=status)} {value}")
+        lines += ["# HELP llm_tokens_total Токены LLM", "# TYPE llm_tokens_total counter"]
+        for (run, model, kind), value in sorted(self.tokens.items()):
+            lines.append(f"llm_tokens_total{self._labels(run=run, model=model, type=kind)} {value}")
+        lines += ["# HELP llm_cost_usd_total Оценка стоимости, $", "# TYPE llm_cost_usd_total counter"]
+        for (run, model), value in sorted(self.cost.items()):
+            lines.append(f"llm_cost_usd_total{self._labels(run=run, model=model)} {value:.6f}")
+        lines += ["# HELP llm_hedged_requests_total Дубли медленных запросов", "# TYPE llm_hedged_requests_total counter"]
+        for (run, model), value in sorted(self.hedges.items()):
+            lines.append(f"llm_hedged_requests_total{self._labels(run=run, model=model)} {value}")
+        lines += ["# HELP llm_hedge_wins_total Вызовы, где ответ дал дубль", "# TYPE llm_hedge_wins_total counter"]
+        for (run, model), value in sorted(self.hedge_wins.items()):
+            lines.append(f"llm_hedge_wins_total{self._labels(run=run, model=model)} {value}")
+        lines += [
+            "# HELP llm_request_latency_seconds Задержка успешных вызовов LLM",
+            "# TYPE llm_request_latency_seconds histogram",
+        ]
+        for (run, model), buckets in sorted(self.latency_buckets.items()):
+            for bound, value in zip(LATENCY_BUCKETS, buckets):
+                labels = self._labels(run=run, model=model, le=f"{bound:g}")
+                lines.append(f"llm_request_latency_seconds_bucket{labels} {value}")
+            count = self.latency_count[(run, model)]
+            lines.append(f"llm_request_latency_seconds_bucket{self._labels(run=run, model=model, le='+Inf')} {count}")
+            lines.append(f"llm_request_latency_seconds_sum{self._labels(run=run, model=model)} {self.latency_sum[(run, model)]:.6f}")
+            lines.append(f"llm_request_latency_seconds_count{self._labels(run=run, model=model)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def flush(self) -> None:
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        # Атомарная замена: collector не увидит наполовину записанный файл.
+        os.replace(tmp_path, self.path)
+        self._last_flush = time.monotonic()
+
+    def close(self) -> None:
+        self.flush()
+
+
+class Telemetry:
+    """Принимает события вызовов, раздает их приемникам и считает сводку запуска."""
+
+    def __init__(self, run: str = "llm", sinks: Sequence[Any] = ()):
+        self.run = run
+        self.sinks = list(sinks)
+        self.events: List[CallEvent] = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, run: str) -> "Telemetry":
+        """Телеметрия с приемниками из LLM_TELEMETRY; файлы называются <run>_<время>.<расширение>."""
+        names = [
+            name.strip().lower()
+            for name in (os.getenv("LLM_TELEMETRY") or "jsonl").split(",")
+            if name.strip()
+        ]
+        if "off" in names:
+            return cls(run)
+        directory = os.getenv("LLM_TELEMETRY_DIR") or DEFAULT_TELEMETRY_DIR
+        base = os.path.join(directory, f"{run}_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+        sinks = []
+        for name in names:
+            if name == "jsonl":
+                sinks.append(JsonlSink(base + ".jsonl"))
+            elif name == "csv":
+                sinks.append(CsvSink(base + ".csv"))
+            elif name == "prom":
+                sinks.append(PrometheusTextfileSink(base + ".prom"))
+            else:
+                raise ValueError(f"Неизвестный приемник телеметрии: {name} (ожидается один из {TELEMETRY_SINKS})")
+        return cls(run, sinks)
+
+    def record(self, event: CallEvent) -> None:
+        with self._lock:
+            self.events.append(event)
+            for sink in self.sinks:
+                try:
+                    sink.emit(event)
+                except OSError as e:
+                    print(f"Предупреждение: не удалось записать телеметрию ({e})")
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            events = list(self.events)
+        ok = [e for e in events if e.status == "ok"]
+        latencies = [e.latency for e in ok]
+        ttfts = [e.ttft for e in ok if e.ttft is not None]
+        wall = 0.0
+        if events:
+            wall = max(e.timestamp + e.latency for e in events) - min(e.timestamp for e in events)
+        completion_tokens = sum(e.completion_tokens for e in ok)
+        costs = [e.cost for e in ok if e.cost is not None]
+        return {
+            "run": self.run,
+            "calls": len(events),
+            "ok": len(ok),
+            "cache_hits": sum(e.status == "cache_hit" for e in events),
+            "errors": sum(e.status == "error" for e in events),
+            "retries": sum(max(0, e.attempts - 1) for e in events),
+            "hedges": sum(e.hedges for e in events),
+            "hedge_wins": sum(e.hedge_won for e in events),
+            "wall_time": wall,
+            "throughput_rps": len(ok) / wall if wall > 0 else None,
+            "output_tokens_per_sec": completion_tokens / wall if wall > 0 else None,
+            "latency_p50": percentile(latencies, 50),
+            "latency_p90": percentile(latencies, 90),
+            "latency_p99": percentile(latencies, 99),
+            "ttft_p50": percentile(ttfts, 50),
+            "prompt_tokens": sum(e.prompt_tokens for e in ok),
+            "completion_tokens": completion_tokens,
+            "cached_tokens": sum(e.cached_tokens for e in ok),
+            "cost_usd": sum(costs) if costs else None,
+        }
+
+    def format_summary(self) -> str:
+        s = self.summary()
+
+        def fmt(value: Optional[float], suffix: str = " сек") -> str:
+            return "-" if value is None else f"{value:.2f}{suffix}"
+
+        cost = "неизвестна (нет цен модели)" if s["cost_usd"] is None else f"${s['cost_usd']:.4f}"
+        return "\n".join(
+            [
+                f"Телеметрия LLM ({s['run']}): вызовов {s['calls']}, успешно {s['ok']}, "
+                f"из кэша {s['cache_hits']}, ошибок {s['errors']}, повторов {s['retries']}",
+                f"  Пропускная способность: {fmt(s['throughput_rps'], ' запр/сек')}, "
+                f"{fmt(s['output_tokens_per_sec'], ' ток/сек')} за {s['wall_time']:.1f} сек",
+                f"  Задержка: p50 {fmt(s['latency_p50'])}, p90 {fmt(s['latency_p90'])}, "
+                f"p99 {fmt(s['latency_p99'])}" + (f", TTFT p50 {fmt(s['ttft_p50'])}" if s["ttft_p50"] is not None else ""),
+                f"  Токены: промт {s['prompt_tokens']:,} (из кэша провайдера {s['cached_tokens']:,}), "
+                f"ответ {s['completion_tokens']:,}; стоимость {cost}",
+            ]
+            + (
+                [f"  Хеджирование: дублей {s['hedges']}, ответ дал дубль в {s['hedge_wins']} вызовах"]
+                if s["hedges"]
+                else []
+            )
+        )
+
+    def close(self) -> None:
+        for sink in self.sinks:
+            sink.close()
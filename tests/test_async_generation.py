@@ -0,0 +1,113 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import horoscope_generator
+from journal import JsonlJournal
+
+
+class FakeTelemetry:
+    def format_summary(self):
+        return ""
+
+    def close(self):
+        pass
+
+
+class Run:
+    """Подмены сети и сохранений для _generate_horoscopes_async."""
+
+    def __init__(self, monkeypatch, tmp_path, total):
+        self.journal = JsonlJournal(str(tmp_path / "run.jsonl"))
+        self.total = total
+        self.pulled = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.max_read_ahead = 0
+        self.checkpoints = []
+
+        monkeypatch.setattr(horoscope_generator, "CHECKPOINT_EVERY", 4)
+        monkeypatch.setattr(horoscope_generator.ResponseCache, "from_env", staticmethod(lambda: None))
+        monkeypatch.setattr(horoscope_generator.RateLimiter, "from_env", staticmethod(lambda: None))
+        monkeypatch.setattr(horoscope_generator.HedgePolicy, "from_env", staticmethod(lambda: None))
+        monkeypatch.setattr(horoscope_generator.Telemetry, "from_env", staticmethod(lambda name: FakeTelemetry()))
+        monkeypatch.setattr(
+            horoscope_generator, "AsyncGPT_Validator",
+            lambda **kwargs: SimpleNamespace(hedge_policy=None, endpoint_pool=None),
+        )
+        monkeypatch.setattr(horoscope_generator, "make_pack_validator", lambda validator: validator)
+        monkeypatch.setattr(horoscope_generator, "request_horoscope_async", self.request)
+        monkeypatch.setattr(horoscope_generator, "generate_pack_async", self.pack)
+        monkeypatch.setattr(horoscope_generator, "regenerate_failed_async", self.regenerate)
+        monkeypatch.setattr(horoscope_generator, "compact_journal", self.compact)
+
+    def records(self):
+        for n in range(1, self.total + 1):
+            self.pulled += 1
+            yield f"bitrix:{n}", "staff.xlsx", {"BitrixId": n}
+
+    async def _call(self):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        # Сколько записей прочитано сверх уже записанных и находящихся в работе.
+        done = len(self.journal.load())
+        self.max_read_ahead = max(self.max_read_ahead, self.pulled - done)
+        await asyncio.sleep(0.001)
+        self.in_flight -= 1
+
+    async def request(self, validator, record):
+        await self._call()
+        return f"гороскоп {record['BitrixId']}", None
+
+    async def pack(self, validator, pack_validator, pack):
+        await self._call()
+        return [(idx, key, {"horoscope": f"гороскоп {idx}"}) for idx, key, _, _ in pack]
+
+    async def regenerate(self, validator, journal, rounds, concurrency):
+        return 0
+
+    def compact(self, journal, output_path, final=False):
+        self.checkpoints.append(len(journal.load()))
+        return output_path
+
+    def start(self, concurrency, pack_size=1):
+        asyncio.run(
+            horoscope_generator._generate_horoscopes_async(
+                self.records(), concurrency, self.journal, "run.csv", pack_size=pack_size
+            )
+        )
+
+
+@pytest.mark.parametrize("pack_size", [1, 3])
+def test_checkpoints_count_written_records(monkeypatch, tmp_path, pack_size):
+    run = Run(monkeypatch, tmp_path, total=13)
+    run.start(concurrency=1, pack_size=pack_size)
+
+    entries = run.journal.load()
+    assert len(entries) == 13
+    assert sorted(entry["order"] for entry in entries.values()) == list(range(1, 14))
+    # Каждые CHECKPOINT_EVERY=4 записанных записи, независимо от размера пакета.
+    assert run.checkpoints == [4, 8, 12]
+
+
+@pytest.mark.parametrize("pack_size", [1, 3])
+def test_records_are_read_as_workers_free_up(monkeypatch, tmp_path, pack_size):
+    run = Run(monkeypatch, tmp_path, total=60)
+    run.start(concurrency=4, pack_size=pack_size)
+
+    assert len(run.journal.load()) == 60
+    assert run.max_in_flight == 4
+    # Задачи не создаются заранее: прочитано не больше, чем помещается в работающих воркерах.
+    assert run.max_read_ahead <= 4 * pack_size
+
+
+def test_resume_skips_done_records(monkeypatch, tmp_path):
+    run = Run(monkeypatch, tmp_path, total=6)
+    run.journal.append("bitrix:2", {"horoscope": "готово"}, order=2)
+    run.journal.append("bitrix:5", {"horoscope": "готово"}, order=5)
+    run.start(concurrency=2)
+
+    entries = run.journal.load()
+    assert len(entries) == 6
+    assert entries["bitrix:2"]["row"] == {"horoscope": "готово"}
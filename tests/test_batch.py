@@ -0,0 +1,157 @@
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+
+import horoscope_generator
+from llm_batch import (
+    LocalBatchRunner,
+    load_batch_results,
+    make_batch_request,
+    parse_batch_line,
+    read_jsonl,
+    write_batch_file,
+)
+
+
+class ServerError(Exception):
+    status_code = 500
+
+
+class FakeCompletions:
+    """chat.completions: ответ — "гороскоп: <промт>", промты из fail падают с 500."""
+
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.prompts = []
+
+    def create(self, **body):
+        prompt = body["messages"][0]["content"]
+        self.prompts.append(prompt)
+        if prompt in self.fail:
+            raise ServerError("upstream error")
+        content = f"гороскоп: {prompt}"
+        return SimpleNamespace(
+            id=f"req-{len(self.prompts)}",
+            model_dump=lambda: {
+                "choices": [{"message": {"role": "assistant", "content": content}}],
+                "usage": {"prompt_tokens": 3, "completion_tokens": 5},
+            },
+        )
+
+
+def fake_client(fail=()):
+    return SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions(fail)))
+
+
+def test_batch_file_round_trip(tmp_path):
+    path = str(tmp_path / "input.jsonl")
+    requests = [
+        make_batch_request("bitrix:1", "промт 1", "mock", 0.7, 100),
+        make_batch_request("bitrix:2", "промт 2", "mock", 0.7, 100, {"type": "json_object"}),
+    ]
+    assert write_batch_file(path, requests) == 2
+    assert list(read_jsonl(path)) == requests
+    assert requests[1]["body"]["response_format"] == {"type": "json_object"}
+    with pytest.raises(ValueError):
+        write_batch_file(path, requests + requests[:1])
+
+
+def test_parse_batch_line_success_and_errors():
+    ok = parse_batch_line({
+        "custom_id": "a",
+        "response": {"status_code": 200, "body": {"choices": [{"message": {"content": "текст"}}], "usage": {"total_tokens": 7}}},
+    })
+    assert (ok.text, ok.error, ok.usage) == ("текст", None, {"total_tokens": 7})
+
+    failed = parse_batch_line({"custom_id": "b", "response": {"status_code": 429, "body": {"error": {"message": "slow down"}}}})
+    assert failed.text is None and failed.error == "batch (429): slow down"
+
+    expired = parse_batch_line({"custom_id": "c", "response": None, "error": {"code": "batch_expired", "message": "истек срок"}})
+    assert expired.error == "batch_expired: истек срок"
+
+    empty = parse_batch_line({"custom_id": "d", "response": {"status_code": 200, "body": {"choices": []}}})
+    assert empty.error == "batch: в ответе нет текста"
+
+
+def test_local_runner_writes_batch_api_results(tmp_path):
+    input_path = str(tmp_path / "input.jsonl")
+    write_batch_file(input_path, [make_batch_request(f"k{n}", f"промт {n}", "mock", 0.7, 100) for n in range(1, 4)])
+    runner = LocalBatchRunner(client=fake_client(fail={"промт 2"}), workers=2)
+    outcome = runner.run(input_path, str(tmp_path / "output.jsonl"))
+
+    assert outcome.status == "completed"
+    results = load_batch_results([outcome.output_path, None])
+    assert results["k1"].text == "гороскоп: промт 1"
+    assert results["k3"].usage == {"prompt_tokens": 3, "completion_tokens": 5}
+    assert results["k2"].text is None and results["k2"].error.startswith("batch (500)")
+    # Порядок строк результата совпадает со входом
+    assert [line["custom_id"] for line in read_jsonl(outcome.output_path)] == ["k1", "k2", "k3"]
+
+
+class SpyRunner(LocalBatchRunner):
+    def __init__(self, client):
+        super().__init__(client=client, workers=1)
+        self.submitted = []
+
+    def submit(self, input_path, metadata=None):
+        self.submitted.append([request["custom_id"] for request in read_jsonl(input_path)])
+        return f"local_{len(self.submitted)}"
+
+
+@pytest.fixture
+def batch_run(tmp_path, monkeypatch):
+    records = [(f"bitrix:{n}", "input.xlsx", {"BitrixId": n, "ИО": f"Сотрудник {n}"}) for n in range(1, 4)]
+    monkeypatch.setattr(horoscope_generator, "iter_keyed_records", lambda *args: iter(records))
+    monkeypatch.setattr(horoscope_generator, "build_horoscope_prompt", lambda record: record["ИО"])
+    runner = SpyRunner(fake_client(fail={"Сотрудник 2"}))
+    monkeypatch.setattr(horoscope_generator, "get_batch_runner", lambda name=None: runner)
+
+    def run(resume=None):
+        return horoscope_generator.generate_horoscopes_batch(
+            "data", None, None, str(tmp_path), resume=resume, regenerate_rounds=0
+        )
+
+    return run, runner
+
+
+def test_batch_run_and_resume_skip_finished_keys(batch_run):
+    run, runner = batch_run
+    output_path = run()
+    journal_path = output_path[: -len(".csv")] + ".journal.jsonl"
+    rows = {key: entry["row"] for key, entry in horoscope_generator.JsonlJournal(journal_path).load().items()}
+    assert rows["bitrix:1"]["horoscope"] == "гороскоп: Сотрудник 1"
+    assert rows["bitrix:2"]["error"].startswith("batch (500)")
+    # Задание отработано — файл состояния удален
+    assert not os.path.exists(output_path[: -len(".csv")] + ".batch.json")
+
+    runner.client.chat.completions.fail.clear()
+    run(resume=journal_path)
+    # Повторный пакет содержит только запись с ошибкой
+    assert runner.submitted == [["bitrix:1", "bitrix:2", "bitrix:3"], ["bitrix:2"]]
+    rows = {key: entry["row"] for key, entry in horoscope_generator.JsonlJournal(journal_path).load().items()}
+    assert rows["bitrix:2"]["horoscope"] == "гороскоп: Сотрудник 2" and rows["bitrix:2"]["error"] is None
+
+
+def test_resume_waits_for_submitted_batch_instead_of_resubmitting(batch_run, tmp_path):
+    run, runner = batch_run
+    journal_path = str(tmp_path / "horoscopes_20260101_000000.journal.jsonl")
+    run_base = journal_path[: -len(".journal.jsonl")]
+    # Прерванный запуск: задание отправлено, bitrix:1 уже в журнале
+    horoscope_generator.JsonlJournal(journal_path).append("bitrix:1", {"horoscope": "готов", "error": None}, order=1)
+    write_batch_file(
+        f"{run_base}.batch_input.jsonl",
+        [make_batch_request(key, f"Сотрудник {n}", "mock", 0.7, 100) for n, key in ((2, "bitrix:2"), (3, "bitrix:3"))],
+    )
+    with open(f"{run_base}.batch.json", "w", encoding="utf-8") as f:
+        json.dump({"batch_id": "local_1", "input_path": f"{run_base}.batch_input.jsonl"}, f)
+    runner.client.chat.completions.fail.clear()
+
+    run(resume=journal_path)
+
+    assert runner.submitted == []
+    assert runner.client.chat.completions.prompts == ["Сотрудник 2", "Сотрудник 3"]
+    rows = {key: entry["row"] for key, entry in horoscope_generator.JsonlJournal(journal_path).load().items()}
+    assert rows["bitrix:1"]["horoscope"] == "готов"
+    assert rows["bitrix:3"]["horoscope"] == "гороскоп: Сотрудник 3"
@@ -0,0 +1,143 @@
+import httpx
+import openai
+import pytest
+
+import endpoints
+from endpoints import Endpoint, EndpointPool, scale_workers
+
+
+REQUEST = httpx.Request("POST", "http://mock/v1/chat/completions")
+
+
+def status_error(status, headers=None):
+    response = httpx.Response(status, headers=headers or {}, request=REQUEST)
+    classes = {
+        429: openai.RateLimitError,
+        401: openai.AuthenticationError,
+        400: openai.BadRequestError,
+        500: openai.InternalServerError,
+    }
+    return classes[status]("mock", response=response, body=None)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(endpoints.time, "monotonic", clock)
+    return clock
+
+
+def make_pool(weights=(1, 1), **kwargs):
+    return EndpointPool([Endpoint(index=n, api_key=f"k{n}", weight=w) for n, w in enumerate(weights, 1)], **kwargs)
+
+
+def test_routing_follows_weights(clock):
+    pool = make_pool(weights=(3, 1))
+    for _ in range(40):
+        pool.release(pool.acquire())
+    assert [e.requests for e in pool.endpoints] == [30, 10]
+
+
+def test_routing_prefers_fewest_outstanding(clock):
+    pool = make_pool()
+    first, second = pool.acquire(), pool.acquire()
+    assert {first.index, second.index} == {1, 2}
+    pool.release(first)
+    assert pool.acquire() is first
+
+
+def test_rate_limit_ejects_for_retry_after(clock):
+    pool = make_pool(cooldown=30)
+    endpoint = pool.acquire()
+    pool.release(endpoint, status_error(429, {"retry-after": "5"}))
+    assert endpoint.ejected
+    assert all(pool.acquire() is not endpoint for _ in range(5))
+    clock.now += 5
+    pool.acquire()
+    assert not endpoint.ejected
+
+
+def test_garbage_retry_after_falls_back_to_cooldown(clock):
+    pool = make_pool(cooldown=30)
+    endpoint = pool.acquire()
+    pool.release(endpoint, status_error(429, {"retry-after": "soon"}))
+    assert endpoint.ejected_until == clock.now + 30
+
+
+def test_server_errors_eject_after_threshold_and_cooldown_doubles(clock):
+    pool = make_pool(cooldown=10, max_cooldown=25, failure_threshold=3)
+    endpoint = pool.endpoints[0]
+
+    def fail(times):
+        for _ in range(times):
+            endpoint.outstanding += 1
+            pool.release(endpoint, status_error(500))
+
+    fail(2)
+    assert not endpoint.ejected
+    fail(1)
+    assert endpoint.ejected_until == clock.now + 10
+    clock.now += 10
+    pool.acquire()
+    fail(3)
+    assert endpoint.ejected_until == clock.now + 20
+    clock.now += 20
+    pool.acquire()
+    fail(3)
+    assert endpoint.ejected_until == clock.now + 25  # max_cooldown
+    # Успешный ответ сбрасывает cooldown
+    pool.release(endpoint)
+    assert endpoint.next_cooldown == 10
+
+
+def test_bad_key_and_request_errors(clock):
+    pool = make_pool(cooldown=10, max_cooldown=300)
+    first, second = pool.endpoints
+    pool.release(first, status_error(400))
+    assert not first.ejected and first.failures == 0
+    pool.release(first, status_error(401))
+    assert first.ejected_until == clock.now + 300
+
+
+def test_all_ejected_uses_the_one_returning_first(clock):
+    pool = make_pool()
+    first, second = pool.endpoints
+    pool.release(first, status_error(429, {"retry-after": "50"}))
+    pool.release(second, status_error(429, {"retry-after": "20"}))
+    assert pool.acquire() is second
+
+
+def test_from_env_needs_two_endpoints(monkeypatch):
+    for index in range(1, 4):
+        monkeypatch.delenv(f"API_KEY_{index}", raising=False)
+        monkeypatch.delenv(f"BASE_URL_{index}", raising=False)
+    monkeypatch.setenv("API_KEY", "main")
+    monkeypatch.setenv("BASE_URL", "http://gateway/v1")
+    assert EndpointPool.from_env() is None
+    monkeypatch.setenv("API_KEY_3", "extra")
+    monkeypatch.setenv("BASE_URL_3", "http://other/v1")
+    monkeypatch.setenv("LLM_ENDPOINT_WEIGHT_3", "2")
+    pool = EndpointPool.from_env()
+    assert [(e.index, e.api_key, e.base_url, e.weight) for e in pool.endpoints] == [
+        (1, "main", "http://gateway/v1", 1.0),
+        (3, "extra", "http://other/v1", 2.0),
+    ]
+
+
+def test_scale_workers():
+    assert scale_workers(4, None) == 4
+    assert scale_workers(4, make_pool(weights=(1, 1, 1))) == 12
+
+
+def test_concurrent_routing_follows_weights(clock):
+    pool = make_pool(weights=(3, 1))
+    acquired = [pool.acquire() for _ in range(40)]
+    assert [sum(e is endpoint for e in acquired) for endpoint in pool.endpoints] == [30, 10]
@@ -0,0 +1,62 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import excel_ingest
+from excel_ingest import SheetCache, iter_dataframe_records, normalize_mixed_columns, read_sheet
+
+
+def test_normalize_mixed_columns_formats_excel_dates():
+    df = pd.DataFrame(
+        {
+            "День рождения": ["05.02.1983", pd.Timestamp(1990, 1, 20), datetime(2001, 12, 31), None],
+            "Дата приема": [pd.Timestamp(2020, 1, 1)] * 4,
+            "BitrixId": [1, 2, 3, 4],
+        }
+    )
+    normalize_mixed_columns(df)
+    assert df["День рождения"].tolist()[:3] == ["05.02.1983", "20.01.1990", "31.12.2001"]
+    assert df["День рождения"].iloc[3] is None
+    # Столбец только из дат и числовой столбец не меняются
+    assert (df["Дата приема"] == pd.Timestamp(2020, 1, 1)).all()
+    assert df["BitrixId"].tolist() == [1, 2, 3, 4]
+
+
+def test_iter_dataframe_records_replaces_nan_and_applies_limit():
+    df = pd.DataFrame({"ИО": ["Анна", np.nan, "Олег"], "BitrixId": [1.0, np.nan, 3.0]})
+    records = list(iter_dataframe_records(df, limit=2))
+    assert records == [{"ИО": "Анна", "BitrixId": 1.0}, {"ИО": None, "BitrixId": None}]
+
+
+@pytest.fixture
+def workbook(tmp_path):
+    path = tmp_path / "employees.xlsx"
+    with pd.ExcelWriter(path, engine="openpyxl") as writer:
+        pd.DataFrame({"x": [1]}).to_excel(writer, sheet_name="титул", index=False)
+        pd.DataFrame(
+            {"ИО": ["Анна", "Олег"], "День рождения": ["05.02.1983", datetime(1990, 1, 20)]}
+        ).to_excel(writer, sheet_name="сотрудники", index=False)
+    return str(path)
+
+
+def test_read_sheet_uses_cache_on_second_read(workbook, tmp_path, monkeypatch):
+    monkeypatch.setenv("EXCEL_ENGINE", "openpyxl")
+    cache = SheetCache(directory=str(tmp_path / "cache"))
+    first = read_sheet(workbook, cache=cache)
+    assert first["ИО"].tolist() == ["Анна", "Олег"]
+    assert first["День рождения"].tolist() == ["05.02.1983", "20.01.1990"]
+
+    def fail(*args, **kwargs):
+        raise AssertionError("книга открыта повторно")
+
+    monkeypatch.setattr(excel_ingest.pd, "ExcelFile", fail)
+    second = read_sheet(workbook, cache=cache)
+    pd.testing.assert_frame_equal(first, second, check_dtype=False)
+
+
+def test_read_sheet_falls_back_to_first_sheet(workbook, monkeypatch):
+    monkeypatch.setenv("EXCEL_ENGINE", "openpyxl")
+    df = read_sheet(workbook, sheet="нет такого", use_cache=False)
+    assert df.columns.tolist() == ["x"]
@@ -0,0 +1,69 @@
+import threading
+import time
+
+from hedging import HedgeOutcome, HedgePolicy
+
+
+def primed_policy(latency=0.05, **kwargs):
+    """Политика с готовым порогом (~latency) и запасом дублей на каждый вызов."""
+    policy = HedgePolicy(min_samples=5, max_rate=1.0, min_delay=0.01, **kwargs)
+    for _ in range(5):
+        policy.observe(latency)
+    return policy
+
+
+def scripted_send(delays, results):
+    """send(), n-й вызов которого отвечает results[n] через delays[n] сек."""
+    lock = threading.Lock()
+    calls = []
+
+    def send():
+        with lock:
+            n = len(calls)
+            calls.append(time.perf_counter())
+        time.sleep(delays[n])
+        return results[n]
+
+    return send, calls
+
+
+def test_no_hedge_before_threshold():
+    policy = primed_policy(latency=0.2)
+    send, calls = scripted_send([0.02], ["первый"])
+    outcome = HedgeOutcome()
+    assert policy.call(send, outcome) == "первый"
+    assert len(calls) == 1 and outcome.hedges == 0
+
+
+def test_slow_primary_is_hedged_after_threshold_and_loser_dropped():
+    policy = primed_policy(latency=0.05)
+    send, calls = scripted_send([0.5, 0.01], ["медленный", "дубль"])
+    outcome = HedgeOutcome()
+    started = time.perf_counter()
+    assert policy.call(send, outcome) == "дубль"
+    elapsed = time.perf_counter() - started
+    assert outcome.hedges == 1 and outcome.won
+    # Дубль отправлен не раньше порога, ответ — без ожидания проигравшего
+    assert calls[1] - calls[0] >= 0.05
+    assert elapsed < 0.3
+    assert policy.summary().endswith("выиграли 1")
+
+
+def test_concurrent_callers_are_not_queued():
+    # Больше одновременных вызовов, чем было потоков в прежнем общем пуле:
+    # ни один не ждет очереди и не получает лишнего дубля.
+    policy = primed_policy(latency=0.15)
+    outcomes = [HedgeOutcome() for _ in range(96)]
+
+    def worker(outcome):
+        policy.call(lambda: time.sleep(0.1) or "ok", outcome)
+
+    threads = [threading.Thread(target=worker, args=(outcome,)) for outcome in outcomes]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert time.perf_counter() - started < 0.25
+    assert sum(outcome.hedges for outcome in outcomes) == 0
+    assert max(list(policy.latencies)[5:]) < 0.14
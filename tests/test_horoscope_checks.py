@@ -0,0 +1,113 @@
+import pytest
+
+import horoscope_checks
+from horoscope_checks import (
+    check_horoscope,
+    count_sentences,
+    format_problems,
+    mentions,
+    mentions_name,
+    split_sections,
+)
+from horoscope_generator import apply_regeneration
+from journal import JsonlJournal
+
+
+RECORD = {"ИО": "Анна Сергеевна", "Город чист": "Ульяновск"}
+FILLER = " Звезды обещают спокойный и продуктивный период для смелых решений и новых проектов команды."
+
+
+def horoscope(
+    profile="Анна Сергеевна, вы Водолей с ясным умом и тягой к новому." + FILLER + FILLER,
+    forecast="В Ульяновске вас ждут сильные партнеры." + FILLER + FILLER,
+    advice="Доверяйте интуиции." + FILLER + FILLER,
+    motto="«Вперед, к звездам!»",
+    heading="**{}:**",
+):
+    sections = [("Астро-профиль", profile), ("Бизнес-прогноз", forecast), ("Совет", advice), ("Девиз года", motto)]
+    return "\n\n".join(f"{heading.format(name)} {text}" for name, text in sections if text is not None)
+
+
+def test_valid_horoscope_passes():
+    text = horoscope()
+    assert horoscope_checks.MIN_CHARS <= len(text) <= horoscope_checks.MAX_CHARS
+    assert check_horoscope(text, RECORD) == []
+
+
+@pytest.mark.parametrize("heading", ["**{}:**", "### {}\n", "{} —", "{}:"])
+def test_section_heading_variants(heading):
+    sections = split_sections(horoscope(heading=heading))
+    assert list(sections) == ["Астро-профиль", "Бизнес-прогноз", "Совет", "Девиз года"]
+    assert sections["Девиз года"] == "«Вперед, к звездам!»"
+
+
+def test_missing_and_empty_sections():
+    problems = check_horoscope(horoscope(advice=None, motto=" "), RECORD)
+    assert "нет раздела «Совет»" in problems
+    assert "пустой раздел «Девиз года»" in problems
+
+
+def test_sentence_limit_per_section():
+    problems = check_horoscope(horoscope(motto="Первое. Второе."), RECORD)
+    assert problems == ["в разделе «Девиз года» 2 предложений (не больше 1)"]
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("", 0),
+        ("Одно предложение без точки", 1),
+        ("Переезд в г. Москва. Новый офис!", 2),
+        ("Он сказал: «Стой. Иди. Беги!» И ушел.", 1),
+        ("Что дальше? Рост… И успех.", 3),
+        ("Рост на 5.5 процента. Итог", 2),
+    ],
+)
+def test_count_sentences(text, expected):
+    assert count_sentences(text) == expected
+
+
+def test_name_and_city_in_any_case():
+    assert mentions_name("Анне Сергеевне повезет", "Анна Сергеевна")
+    assert mentions_name("Сергеевна, вперед", "Анна Сергеевна")
+    assert mentions("Офис в Ульяновске", "Ульяновск")
+    assert mentions("Путь в Нижний Новгород", "Нижний Новгород")
+    assert not mentions("Путь в Нижний Тагил", "Нижний Новгород")
+
+
+def test_missing_name_and_city_are_reported():
+    problems = check_horoscope(
+        horoscope(profile="Вы Водолей." + FILLER + FILLER, forecast="Рост." + FILLER + FILLER + FILLER), RECORD
+    )
+    assert problems == ["не упомянуто имя (Анна Сергеевна)", "не упомянут город (Ульяновск)"]
+
+
+def test_length_limits(monkeypatch):
+    monkeypatch.setattr(horoscope_checks, "MAX_CHARS", 100)
+    assert check_horoscope(horoscope(), RECORD)[0].startswith("слишком длинный")
+    assert check_horoscope("", RECORD) == ["пустой текст"]
+    short = check_horoscope(horoscope(profile="Анна.", forecast="Ульяновск.", advice="Да."), {})
+    assert short[0].startswith("слишком короткий")
+
+
+def test_format_problems():
+    assert format_problems([]) is None
+    assert format_problems(["a", "b"]) == "a; b"
+
+
+def test_apply_regeneration_keeps_the_better_variant(tmp_path):
+    journal = JsonlJournal(str(tmp_path / "run.journal.jsonl"))
+    bad = horoscope(motto="Первое. Второе.")
+    row = dict(RECORD, horoscope=bad, error=None, check_errors=None)
+    problems = check_horoscope(bad, row)
+    failure = ("bitrix:1", {"row": row, "order": 1}, problems)
+
+    # Вариант с большим числом нарушений не принимается, но check_errors прежнего обновляется.
+    assert not apply_regeneration(journal, failure, horoscope(advice=None, motto="Первое. Второе."), None)
+    assert journal.load()["bitrix:1"]["row"]["horoscope"] == bad
+    assert journal.load()["bitrix:1"]["row"]["check_errors"] == format_problems(problems)
+
+    assert apply_regeneration(journal, failure, horoscope(), None)
+    fixed = journal.load()["bitrix:1"]["row"]
+    assert fixed["horoscope"] == horoscope()
+    assert fixed["check_errors"] is None
@@ -0,0 +1,192 @@
+import pytest
+from openai.types.chat import ChatCompletion
+
+import llm_cache
+from llm_cache import ResponseCache, make_cache_key
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(llm_cache.time, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def make_cache(tmp_path):
+    caches = []
+
+    def make(**kwargs):
+        cache = ResponseCache(path=str(tmp_path / "cache.sqlite"), **kwargs)
+        caches.append(cache)
+        return cache
+
+    yield make
+    for cache in caches:
+        cache.close()
+
+
+def completion(text="Ответ", model="gpt-test"):
+    return ChatCompletion.model_validate(
+        {
+            "id": "chatcmpl-test",
+            "object": "chat.completion",
+            "created": 1,
+            "model": model,
+            "choices": [
+                {
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": text},
+                }
+            ],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+        }
+    )
+
+
+BASE = dict(model="gpt-test", prompt="Гороскоп для Овна", temperature=0.5, max_tokens=100)
+
+
+def test_cache_key_is_stable():
+    assert make_cache_key(**BASE) == make_cache_key(**BASE)
+    assert make_cache_key(**BASE, response_format=None) == make_cache_key(**BASE)
+    fmt = {"type": "json_object"}
+    assert make_cache_key(**BASE, response_format=fmt) == make_cache_key(**BASE, response_format=dict(fmt))
+
+
+@pytest.mark.parametrize(
+    "changes",
+    [
+        {"model": "gpt-other"},
+        {"prompt": "Гороскоп для Тельца"},
+        {"temperature": 0.7},
+        {"max_tokens": 200},
+        {"max_tokens": None},
+        {"response_format": {"type": "json_object"}},
+    ],
+)
+def test_cache_key_depends_on_every_field(changes):
+    assert make_cache_key(**{**BASE, **changes}) != make_cache_key(**BASE)
+
+
+def test_use_mode_round_trips_completion(make_cache, clock):
+    cache = make_cache()
+    key = make_cache_key(**BASE)
+    assert cache.get(key) is None
+    cache.put(key, completion())
+
+    cached = cache.get(key)
+    assert isinstance(cached, ChatCompletion)
+    assert cached.choices[0].message.content == "Ответ"
+    assert cached.usage.total_tokens == 15
+    assert cache.stats == {"hits": 1, "misses": 1, "writes": 1, "evictions": 0}
+
+
+def test_cache_survives_reopen(make_cache, clock):
+    key = make_cache_key(**BASE)
+    make_cache().put(key, completion())
+    assert make_cache().get(key).choices[0].message.content == "Ответ"
+
+
+def test_refresh_mode_skips_reads_but_overwrites(make_cache, clock):
+    key = make_cache_key(**BASE)
+    make_cache().put(key, completion("Старый"))
+
+    refresh = make_cache(mode="refresh")
+    assert refresh.get(key) is None
+    assert refresh.stats["misses"] == 0
+    refresh.put(key, completion("Новый"))
+
+    assert make_cache().get(key).choices[0].message.content == "Новый"
+
+
+def test_off_mode_neither_reads_nor_writes(make_cache, clock):
+    key = make_cache_key(**BASE)
+    off = make_cache(mode="off")
+    off.put(key, completion())
+    assert off.get(key) is None
+    assert off.stats["writes"] == 0
+    assert make_cache().get(key) is None
+
+
+def test_unknown_mode_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        ResponseCache(path=str(tmp_path / "cache.sqlite"), mode="sometimes")
+
+
+def test_from_env_modes(monkeypatch, tmp_path):
+    monkeypatch.setenv("LLM_CACHE_PATH", str(tmp_path / "cache.sqlite"))
+    monkeypatch.setenv("LLM_CACHE", "off")
+    assert ResponseCache.from_env() is None
+
+    monkeypatch.setenv("LLM_CACHE", "Refresh")
+    monkeypatch.setenv("LLM_CACHE_MAX_AGE_DAYS", "2")
+    monkeypatch.setenv("LLM_CACHE_MAX_ENTRIES", "10")
+    monkeypatch.setenv("LLM_CACHE_MAX_MB", "0.5")
+    cache = ResponseCache.from_env()
+    assert cache.mode == "refresh"
+    assert cache.max_age == 2 * 86400
+    assert cache.max_entries == 10
+    assert cache.max_bytes == 512 * 1024
+
+
+def test_expired_entry_is_a_miss(make_cache, clock):
+    cache = make_cache(max_age=60)
+    key = make_cache_key(**BASE)
+    cache.put(key, completion())
+    clock.now += 59
+    assert cache.get(key) is not None
+
+    clock.now += 2
+    assert cache.get(key) is None
+    assert cache.stats["evictions"] == 1
+
+
+def test_put_drops_expired_entries(make_cache, clock):
+    cache = make_cache(max_age=60)
+    old = make_cache_key(**{**BASE, "prompt": "old"})
+    cache.put(old, completion())
+    clock.now += 120
+    cache.put(make_cache_key(**BASE), completion())
+
+    assert cache.stats["evictions"] == 1
+    assert make_cache().get(old) is None
+
+
+def test_entry_limit_evicts_least_recently_read(make_cache, clock):
+    cache = make_cache(max_entries=2)
+    keys = [make_cache_key(**{**BASE, "prompt": str(n)}) for n in range(3)]
+    cache.put(keys[0], completion())
+    clock.now += 1
+    cache.put(keys[1], completion())
+    clock.now += 1
+    # Чтение освежает первую запись: вытеснена будет вторая.
+    assert cache.get(keys[0]) is not None
+    clock.now += 1
+    cache.put(keys[2], completion())
+
+    assert cache.stats["evictions"] == 1
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[2]) is not None
+
+
+def test_size_limit_evicts_oldest_reads(make_cache, clock):
+    size = len(completion("x" * 1000).model_dump_json())
+    cache = make_cache(max_bytes=size * 2 + size // 2)
+    keys = [make_cache_key(**{**BASE, "prompt": str(n)}) for n in range(4)]
+    for key in keys:
+        cache.put(key, completion("x" * 1000))
+        clock.now += 1
+
+    assert cache.stats["evictions"] == 2
+    assert [cache.get(key) is not None for key in keys] == [False, False, True, True]
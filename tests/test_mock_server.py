@@ -0,0 +1,56 @@
+import openai
+import pytest
+
+from mock_server import MockServerConfig, MockState, build_completion, start_mock_server
+
+
+class ByteEncoding:
+    """Кодировка "токен = байт UTF-8": кириллическая буква — два токена, обрезка может разрезать букву."""
+
+    def encode(self, text):
+        return list(text.encode("utf-8"))
+
+    def decode(self, tokens, errors="strict"):
+        return bytes(tokens).decode("utf-8", errors=errors)
+
+
+@pytest.fixture(params=["byte", "approximate"])
+def state(request):
+    state = MockState(MockServerConfig(output_tokens=200))
+    state.encoding = ByteEncoding() if request.param == "byte" else None
+    return state
+
+
+@pytest.mark.parametrize(
+    "max_tokens, finish_reason",
+    [(None, "stop"), (500, "stop"), (200, "stop"), (51, "length"), (1, "length")],
+)
+def test_usage_and_finish_reason_follow_token_budget(state, max_tokens, finish_reason):
+    response, _ = build_completion(state, {"messages": [{"content": "промт"}], "max_tokens": max_tokens})
+    usage = response["usage"]
+    limit = min(200, max_tokens or 200)
+    # Обрезка посреди буквы теряет не больше токенов, чем занимает одна буква
+    assert limit - 2 < usage["completion_tokens"] <= limit
+    assert usage["completion_tokens"] == state.count_tokens(response["choices"][0]["message"]["content"])
+    assert response["choices"][0]["finish_reason"] == finish_reason
+
+
+def test_generation_time_uses_token_rate():
+    state = MockState(MockServerConfig(output_tokens=100, tokens_per_second=50))
+    state.encoding = ByteEncoding()
+    response, generation_time = build_completion(state, {"messages": []})
+    assert generation_time == pytest.approx(response["usage"]["completion_tokens"] / 50)
+
+
+def test_client_round_trip_respects_max_tokens():
+    server, base_url = start_mock_server(MockServerConfig(latency_mean=0.0, output_tokens=300))
+    try:
+        client = openai.OpenAI(api_key="test", base_url=base_url, max_retries=0)
+        response = client.chat.completions.create(
+            model="mock", messages=[{"role": "user", "content": "Привет"}], max_tokens=40
+        )
+        assert response.usage.completion_tokens <= 40
+        assert response.choices[0].finish_reason == "length"
+    finally:
+        server.shutdown()
+        server.server_close()
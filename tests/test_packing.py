@@ -0,0 +1,99 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from horoscope_generator import generate_pack, iter_packs, parse_pack_response, resolve_pack_size
+
+
+IDS = ["1", "2", "3"]
+
+
+def pack_json(items):
+    return json.dumps({"horoscopes": items}, ensure_ascii=False)
+
+
+def test_parse_pack_response_object_and_bare_list():
+    items = [{"id": 1, "horoscope": " первый "}, {"id": "2", "horoscope": "второй"}]
+    assert parse_pack_response(pack_json(items), IDS) == {"1": "первый", "2": "второй"}
+    assert parse_pack_response(json.dumps(items), IDS) == {"1": "первый", "2": "второй"}
+
+
+@pytest.mark.parametrize("fence", ["```json\n{}\n```", "```\n{}\n```"])
+def test_parse_pack_response_code_block(fence):
+    text = fence.replace("{}", pack_json([{"id": 3, "horoscope": "третий"}]))
+    assert parse_pack_response(text, IDS) == {"3": "третий"}
+
+
+def test_parse_pack_response_drops_unknown_duplicate_and_empty():
+    items = [
+        {"id": 1, "horoscope": "первый"},
+        {"id": 1, "horoscope": "повтор"},
+        {"id": 7, "horoscope": "чужой"},
+        {"id": 2, "horoscope": "  "},
+        {"id": 3, "horoscope": None},
+        "не объект",
+    ]
+    assert parse_pack_response(pack_json(items), IDS) == {"1": "первый"}
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        None,
+        "   ",
+        '{"horoscopes": [{"id": 1, "horoscope": "обрезан',  # ответ обрезан по max_tokens
+        '{"result": []}',
+        "Извините, не могу",
+    ],
+)
+def test_parse_pack_response_rejects_unusable_answer(text):
+    with pytest.raises(ValueError):
+        parse_pack_response(text, IDS)
+
+
+def test_resolve_pack_size_respects_output_budget():
+    assert resolve_pack_size(None) == 1
+    assert resolve_pack_size(5, max_tokens=7000) == 5
+    assert resolve_pack_size(50, max_tokens=7000) == 10
+
+
+def test_iter_packs_keeps_tail():
+    assert list(iter_packs(range(7), 3)) == [[0, 1, 2], [3, 4, 5], [6]]
+
+
+class FakeValidator:
+    def __init__(self, content=None, error=None):
+        self.content = content
+        self.error = error
+        self.prompts = []
+
+    def create_completion(self, prompt, response_format=None):
+        if self.error:
+            raise self.error
+        message = SimpleNamespace(content=self.content)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    def __call__(self, prompt, text):
+        self.prompts.append(prompt)
+        return "по одному"
+
+
+def make_pack(size):
+    return [(n, f"bitrix:{n}", "input.xlsx", {"ИО": f"Сотрудник {n}"}) for n in range(1, size + 1)]
+
+
+def test_generate_pack_requests_missing_horoscopes_one_by_one():
+    single = FakeValidator()
+    packed = FakeValidator(pack_json([{"id": 2, "horoscope": "из пакета"}]))
+    rows = generate_pack(single, packed, make_pack(3))
+    assert [(idx, key) for idx, key, _ in rows] == [(1, "bitrix:1"), (2, "bitrix:2"), (3, "bitrix:3")]
+    assert [row["horoscope"] for _, _, row in rows] == ["по одному", "из пакета", "по одному"]
+    assert len(single.prompts) == 2
+
+
+def test_generate_pack_falls_back_when_pack_fails():
+    single = FakeValidator()
+    rows = generate_pack(single, FakeValidator(error=RuntimeError("обрыв")), make_pack(2))
+    assert [row["horoscope"] for _, _, row in rows] == ["по одному", "по одному"]
+    assert all(row["error"] is None for _, _, row in rows)
@@ -0,0 +1,92 @@
+import threading
+
+import pytest
+
+import pdf_multiple_summarizer
+from pdf_multiple_summarizer import map_reduce_summarize, summarize_chunks
+
+
+CHUNK_PROMPT = pdf_multiple_summarizer.PDF_CHUNK_SUMMARY_PROMPT
+
+
+class FakeValidator:
+    """Суммаризация — "итог[<текст>]"; тексты с маркерами из fail падают fail[маркер] раз."""
+
+    model = None
+    max_tokens = 100
+
+    def __init__(self, fail=None):
+        self.fail = dict(fail or {})
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, prompt, text):
+        with self._lock:
+            self.calls.append((prompt, text))
+            for marker, left in self.fail.items():
+                if marker in text and left:
+                    self.fail[marker] = left - 1
+                    raise RuntimeError(f"сбой {marker}")
+        return f"итог[{text}]"
+
+
+def chunk(name, text):
+    return f"{'=' * 80}\nДОКУМЕНТ: {name}\n{'=' * 80}\n\n{text}"
+
+
+CHUNKS = [chunk("a.pdf", "стр1"), chunk("a.pdf", "стр2"), chunk("b.pdf", "стр3")]
+
+
+def test_all_chunks_succeed():
+    validator = FakeValidator()
+    summaries, skipped = summarize_chunks(validator, CHUNK_PROMPT, CHUNKS, workers=3)
+    assert summaries == [f"итог[{text}]" for text in CHUNKS]
+    assert skipped == []
+    assert len(validator.calls) == 3
+
+
+def test_failed_chunk_is_retried_once():
+    validator = FakeValidator(fail={"стр2": 1})
+    summaries, skipped = summarize_chunks(validator, CHUNK_PROMPT, CHUNKS, workers=3)
+    assert summaries == [f"итог[{text}]" for text in CHUNKS]
+    assert skipped == []
+    assert len(validator.calls) == 4
+
+
+def test_persistent_failure_keeps_other_chunks(capsys):
+    validator = FakeValidator(fail={"стр2": 5})
+    summaries, skipped = summarize_chunks(validator, CHUNK_PROMPT, CHUNKS, workers=3)
+    assert summaries == [f"итог[{CHUNKS[0]}]", f"итог[{CHUNKS[2]}]"]
+    assert skipped == [2]
+    # Повтор ровно один: исходная попытка и одна повторная.
+    assert sum("стр2" in text for _, text in validator.calls) == 2
+    assert "фрагмент 2 (a.pdf) пропущен" in capsys.readouterr().out
+
+
+def test_gives_up_when_no_chunk_succeeds():
+    validator = FakeValidator(fail={"стр": 100})
+    with pytest.raises(RuntimeError, match="ни одного из 3"):
+        summarize_chunks(validator, CHUNK_PROMPT, CHUNKS, workers=2)
+
+
+def test_map_reduce_skips_failed_chunk(monkeypatch):
+    # Каждая страница — отдельный фрагмент, reduce объединяет все суммаризации за один уровень.
+    monkeypatch.setattr(pdf_multiple_summarizer, "prompt_text_budget", lambda *args, **kwargs: 10_000)
+    monkeypatch.setattr(pdf_multiple_summarizer, "MAP_CHUNK_TOKENS", 20)
+    # Токены считаются словами: заголовок — до 5, страница — 10; две страницы во фрагмент не помещаются.
+    monkeypatch.setattr(pdf_multiple_summarizer, "count_tokens", lambda text, model_name=None: len(text.split()))
+    monkeypatch.setattr(
+        pdf_multiple_summarizer, "count_tokens_batch",
+        lambda texts, model_name=None: [len(text.split()) for text in texts],
+    )
+    documents = [("a.pdf", ["первая " * 10, "вторая " * 10]), ("b.pdf", ["третья " * 10])]
+    validator = FakeValidator(fail={"вторая": 5})
+
+    summary = map_reduce_summarize(validator, documents, workers=2)
+
+    map_calls = [text for prompt, text in validator.calls if prompt == CHUNK_PROMPT]
+    reduce_calls = [text for prompt, text in validator.calls if prompt != CHUNK_PROMPT]
+    assert len(map_calls) == 4
+    assert len(reduce_calls) == 1
+    assert "первая" in summary and "третья" in summary
+    assert "вторая" not in reduce_calls[0]
@@ -0,0 +1,54 @@
+import threading
+
+import pytest
+
+from openai_agent import VERDICT_FINE, TwoStagePipeline
+
+
+class FakeValidator:
+    """Доклад — текст диалога, резолюция — "Оштрафовать"."""
+
+    def __call__(self, prompt, text, response_format=None):
+        return VERDICT_FINE if text.startswith("доклад") else f"доклад: {text}"
+
+
+class WorkerCrash(BaseException):
+    """Не Exception: обходит обработчик ошибок отдельного чата."""
+
+
+def run_with_timeout(pipeline, items):
+    results, errors = [], []
+
+    def consume():
+        try:
+            results.extend(pipeline.run(items))
+        except BaseException as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=consume, daemon=True)
+    thread.start()
+    thread.join(timeout=5)
+    assert not thread.is_alive(), "конвейер завис"
+    return results, errors
+
+
+def test_pipeline_returns_every_item():
+    items = [{"chat_id": str(n), "dialogue": f"чат {n}"} for n in range(20)]
+    results, errors = run_with_timeout(TwoStagePipeline(FakeValidator(), 3, 2, queue_size=2), items)
+    assert not errors
+    assert sorted(int(row["chat_id"]) for row in results) == list(range(20))
+    assert {row["verdict"] for row in results} == {VERDICT_FINE}
+
+
+@pytest.mark.parametrize("stage", ["_inspect", "_decide"])
+def test_crashed_workers_do_not_hang_pipeline(stage):
+    class CrashingPipeline(TwoStagePipeline):
+        pass
+
+    def crash(self, text):
+        raise WorkerCrash(stage)
+
+    setattr(CrashingPipeline, stage, crash)
+    items = [{"chat_id": str(n), "dialogue": f"чат {n}"} for n in range(20)]
+    results, errors = run_with_timeout(CrashingPipeline(FakeValidator(), 2, 2, queue_size=2), items)
+    assert len(errors) == 1 and isinstance(errors[0], WorkerCrash)
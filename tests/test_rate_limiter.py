@@ -0,0 +1,157 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import endpoints
+import rate_limiter
+from endpoints import Endpoint, EndpointPool
+from rate_limiter import RateLimiter
+
+
+class FakeClock:
+    """Часы, которые двигает только sleep: ожидания лимитера видны без реальных пауз."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    async def sleep_async(self, seconds):
+        self.sleep(seconds)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter.time, "monotonic", clock)
+    monkeypatch.setattr(rate_limiter.time, "sleep", clock.sleep)
+    monkeypatch.setattr(rate_limiter.asyncio, "sleep", clock.sleep_async)
+    # Промт в тестах меряется символами, чтобы оценка не зависела от tiktoken.
+    monkeypatch.setattr(rate_limiter, "estimate_prompt_tokens", lambda prompt, model_name=None: len(prompt))
+    return clock
+
+
+def test_rpm_waits_for_refill(clock):
+    limiter = RateLimiter(rpm=60)
+    for _ in range(60):
+        limiter.acquire("")
+    assert clock.sleeps == []
+
+    limiter.acquire("")
+    # 60 запросов в минуту — один запрос пополняется за секунду.
+    assert clock.sleeps == [pytest.approx(1.0)]
+
+
+def test_tpm_waits_for_estimated_tokens(clock):
+    limiter = RateLimiter(tpm=600, expected_completion_tokens=100)
+    reservation = limiter.acquire("x" * 200, max_tokens=100)
+    assert reservation.tokens == 300
+    limiter.acquire("x" * 200, max_tokens=100)
+    assert clock.sleeps == []
+
+    # Ведро пусто: 300 токенов при 10 токенах в секунду набираются за 30 секунд.
+    limiter.acquire("x" * 200, max_tokens=100)
+    assert sum(clock.sleeps) == pytest.approx(30.0)
+
+
+def test_estimate_caps_completion_by_max_tokens(clock):
+    limiter = RateLimiter(tpm=1000, expected_completion_tokens=500)
+    assert limiter.estimate("abc") == 503
+    assert limiter.estimate("abc", max_tokens=50) == 53
+
+
+def test_oversized_request_waits_for_full_bucket_only(clock):
+    limiter = RateLimiter(tpm=120)
+    limiter.acquire("x" * 60, max_tokens=1)
+    # Запрос больше емкости ведра ждет полного ведра, а не вечно.
+    limiter.acquire("x" * 1000, max_tokens=1)
+    assert sum(clock.sleeps) == pytest.approx(30.5)
+    assert limiter.tokens.level == pytest.approx(0.0)
+
+
+def test_async_acquire_shares_budget(clock):
+    limiter = RateLimiter(rpm=60)
+
+    async def run():
+        for _ in range(62):
+            await limiter.acquire_async("")
+
+    asyncio.run(run())
+    assert sum(clock.sleeps) == pytest.approx(2.0)
+
+
+def test_reconcile_returns_unused_tokens(clock):
+    limiter = RateLimiter(tpm=1000, expected_completion_tokens=500)
+    reservation = limiter.acquire("x" * 100)
+    assert limiter.tokens.level == pytest.approx(400)
+
+    limiter.reconcile(reservation, SimpleNamespace(total_tokens=250))
+    assert limiter.tokens.level == pytest.approx(750)
+    # Повторная корректировка того же резерва ничего не меняет.
+    limiter.reconcile(reservation, SimpleNamespace(total_tokens=0))
+    assert limiter.tokens.level == pytest.approx(750)
+
+
+def test_reconcile_overspend_goes_into_debt(clock):
+    limiter = RateLimiter(tpm=600, expected_completion_tokens=100)
+    reservation = limiter.acquire("x" * 100)
+    limiter.reconcile(reservation, SimpleNamespace(total_tokens=700))
+    assert limiter.tokens.level == pytest.approx(-100)
+
+    # Долг отдается ожиданием: 100 долга + 200 на новый запрос при 10 токенах в секунду.
+    limiter.acquire("x" * 100)
+    assert sum(clock.sleeps) == pytest.approx(30.0)
+
+
+def test_reconcile_without_usage(clock):
+    limiter = RateLimiter(rpm=10, tpm=1000, expected_completion_tokens=500)
+    failed = limiter.acquire("x" * 100)
+    limiter.reconcile(failed)
+    # Ошибка до ответа: токены возвращены, запрос остается учтенным.
+    assert limiter.tokens.level == pytest.approx(1000)
+    assert limiter.requests.level == pytest.approx(9)
+
+    unknown = limiter.acquire("x" * 100)
+    limiter.reconcile(unknown, SimpleNamespace(total_tokens=None))
+    # Ответ без usage: резерв оставляем как есть.
+    assert limiter.tokens.level == pytest.approx(400)
+
+
+@pytest.fixture
+def limits_env(monkeypatch):
+    for name in ("LLM_RPM_LIMIT", "LLM_TPM_LIMIT", "LLM_EXPECTED_COMPLETION_TOKENS"):
+        monkeypatch.delenv(name, raising=False)
+    yield monkeypatch
+    endpoints.configure_endpoints()
+
+
+def test_from_env_without_limits(limits_env):
+    endpoints.configure_endpoints(EndpointPool([Endpoint(index=1, api_key="k1")]))
+    assert RateLimiter.from_env() is None
+
+
+def test_from_env_single_endpoint(limits_env, clock):
+    limits_env.setenv("LLM_RPM_LIMIT", "100")
+    limits_env.setenv("LLM_EXPECTED_COMPLETION_TOKENS", "200")
+    limits_env.setattr(rate_limiter, "get_endpoint_pool", lambda: None)
+    limiter = RateLimiter.from_env()
+    assert limiter.requests.capacity == 100
+    assert limiter.tokens is None
+    assert limiter.expected_completion_tokens == 200
+
+
+def test_from_env_scales_by_endpoint_count(limits_env, clock):
+    limits_env.setenv("LLM_RPM_LIMIT", "100")
+    limits_env.setenv("LLM_TPM_LIMIT", "50000")
+    pool = EndpointPool([Endpoint(index=n, api_key=f"k{n}") for n in (1, 2, 3)])
+    endpoints.configure_endpoints(pool)
+    limiter = RateLimiter.from_env()
+    assert limiter.requests.capacity == 300
+    assert limiter.tokens.capacity == 150000
@@ -0,0 +1,93 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import httpx
+import openai
+import pytest
+
+from retry import CircuitBreaker, RetryPolicy, get_retry_after
+
+
+def half_open_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+    breaker.record_failure()
+    assert breaker.state == "open"
+    time.sleep(0.02)
+    return breaker
+
+
+def test_cancelled_async_probe_releases_breaker():
+    breaker = half_open_breaker()
+    policy = RetryPolicy(circuit_breaker=breaker)
+
+    async def scenario():
+        started = asyncio.Event()
+
+        async def hang():
+            started.set()
+            await asyncio.sleep(60)
+
+        probe = asyncio.ensure_future(policy.call_async(hang))
+        await started.wait()
+        assert breaker.state == "half_open"
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        async def ok():
+            return "ok"
+
+        return await asyncio.wait_for(policy.call_async(ok), timeout=2)
+
+    assert asyncio.run(scenario()) == "ok"
+    assert breaker.state == "closed"
+
+
+def test_interrupted_sync_probe_releases_breaker():
+    breaker = half_open_breaker()
+    policy = RetryPolicy(circuit_breaker=breaker)
+
+    def interrupt():
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        policy.call(interrupt)
+    assert breaker.before_call() == 0.0
+
+
+def rate_limit_error(headers):
+    request = httpx.Request("POST", "http://mock/v1/chat/completions")
+    response = httpx.Response(429, headers=headers, request=request)
+    return openai.RateLimitError("Rate limit exceeded", response=response, body=None)
+
+
+def test_retry_after_seconds_and_milliseconds():
+    assert get_retry_after(rate_limit_error({"retry-after": "2.5"})) == 2.5
+    assert get_retry_after(rate_limit_error({"retry-after-ms": "250", "retry-after": "9"})) == 0.25
+    assert get_retry_after(rate_limit_error({})) is None
+
+
+def test_retry_after_http_date():
+    moment = datetime.now(timezone.utc) + timedelta(seconds=30)
+    delay = get_retry_after(rate_limit_error({"retry-after": format_datetime(moment, usegmt=True)}))
+    assert 25 <= delay <= 30
+    # Дата без часового пояса считается UTC
+    naive = moment.strftime("%a, %d %b %Y %H:%M:%S")
+    assert 25 <= get_retry_after(rate_limit_error({"retry-after": naive})) <= 30
+
+
+def test_garbage_retry_after_is_ignored_and_call_is_retried():
+    error = rate_limit_error({"retry-after": "soon"})
+    assert get_retry_after(error) is None
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) == 1:
+            raise error
+        return "ok"
+
+    assert RetryPolicy(base_delay=0.0).call(flaky) == "ok"
+    assert len(calls) == 2
@@ -0,0 +1,88 @@
+import os
+
+import pandas as pd
+import pytest
+
+import horoscope_generator
+from horoscope_generator import merge_parts, parse_shard, shard_of
+from journal import JsonlJournal
+
+
+TEXT = "гороскоп"
+
+
+@pytest.fixture
+def records(monkeypatch):
+    """Пять записей входа вместо чтения xlsx."""
+    items = [(f"bitrix:{n}", "input.xlsx", {"BitrixId": n, "ИО": f"Сотрудник {n}"}) for n in range(1, 6)]
+    monkeypatch.setattr(horoscope_generator, "iter_keyed_records", lambda data_dir, target_file, limit: iter(items))
+    return items
+
+
+def make_row(key, horoscope=TEXT, error=None, check_errors=None):
+    return {"BitrixId": key.split(":")[1], "horoscope": horoscope, "error": error, "check_errors": check_errors}
+
+
+def test_parse_shard():
+    assert parse_shard(None) is None
+    assert parse_shard("2/4") == (2, 4)
+    for value in ("0/4", "5/4", "2", "a/b"):
+        with pytest.raises(ValueError):
+            parse_shard(value)
+
+
+def test_shard_of_is_stable_and_covers_all_shards():
+    keys = [f"bitrix:{n}" for n in range(1000)]
+    shards = [shard_of(key, 4) for key in keys]
+    assert shards == [shard_of(key, 4) for key in keys]
+    assert set(shards) == {1, 2, 3, 4}
+    # Каждая запись попадает ровно в один шард.
+    pending = {}
+    for index in range(1, 5):
+        items = horoscope_generator.iter_pending(((key, "f", {}) for key in keys), set(), (index, 4))
+        for idx, key, _, _ in items:
+            assert key not in pending
+            pending[key] = idx
+    assert sorted(pending.values()) == list(range(1, len(keys) + 1))
+
+
+def test_merge_parts_keeps_input_order(tmp_path, records):
+    part1 = JsonlJournal(str(tmp_path / "horoscopes_1.part1of2.journal.jsonl"))
+    part2 = JsonlJournal(str(tmp_path / "horoscopes_1.part2of2.journal.jsonl"))
+    # Части записаны вперемешку, порядок восстанавливается по входу.
+    for order, key in ((5, "bitrix:5"), (1, "bitrix:1"), (3, "bitrix:3")):
+        part1.append(key, make_row(key), order=order)
+    for order, key in ((4, "bitrix:4"), (2, "bitrix:2")):
+        part2.append(key, make_row(key), order=order)
+
+    output = merge_parts([], str(tmp_path), None, None, str(tmp_path))
+
+    merged = pd.read_csv(output)
+    assert merged["BitrixId"].tolist() == [1, 2, 3, 4, 5]
+    assert os.path.exists(os.path.splitext(output)[0] + ".xlsx")
+
+
+def test_merge_parts_reports_missing_and_duplicates(tmp_path, records, capsys):
+    part1 = JsonlJournal(str(tmp_path / "a.journal.jsonl"))
+    part2 = JsonlJournal(str(tmp_path / "b.journal.jsonl"))
+    part1.append("bitrix:1", make_row("bitrix:1"), order=1)
+    part1.append("bitrix:2", make_row("bitrix:2", horoscope=None, error="timeout"), order=2)
+    part2.append("bitrix:2", make_row("bitrix:2", horoscope="второй"), order=2)
+    part2.append("bitrix:3", make_row("bitrix:3", check_errors="нет раздела"), order=3)
+    part1.append("bitrix:3", make_row("bitrix:3", horoscope="прошел"), order=3)
+
+    output = merge_parts([part1.path, part2.path], str(tmp_path), None, None, str(tmp_path))
+
+    report = capsys.readouterr().out
+    assert "Нет результата для 2 записей: bitrix:4, bitrix:5" in report
+    assert "Записи в нескольких частях: 2" in report
+    merged = pd.read_csv(output)
+    assert merged["BitrixId"].tolist() == [1, 2, 3]
+    # Из дублей берется строка без ошибки, а из успешных — прошедшая проверку.
+    assert merged["horoscope"].tolist() == [TEXT, "второй", "прошел"]
+    assert merged["error"].isna().all()
+
+
+def test_merge_parts_without_parts(tmp_path, records):
+    with pytest.raises(FileNotFoundError):
+        merge_parts([], str(tmp_path), None, None, str(tmp_path))
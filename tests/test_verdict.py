@@ -0,0 +1,44 @@
+import pytest
+
+from openai_agent import VERDICT_FINE, VERDICT_NO_FINE, normalize_verdict, parse_verdict_response
+
+
+@pytest.mark.parametrize(
+    "text, verdict",
+    [
+        ("Оштрафовать", VERDICT_FINE),
+        ("Решение: не штрафовать оператора", VERDICT_NO_FINE),
+        ("НЕ ШТРАФОВАТЬ", VERDICT_NO_FINE),
+        ("Нужна доп. проверка", None),
+        (None, None),
+    ],
+)
+def test_normalize_verdict(text, verdict):
+    assert normalize_verdict(text) == verdict
+
+
+def test_plain_json():
+    text = '{"report": "Оператор грубил", "verdict": "Оштрафовать"}'
+    assert parse_verdict_response(text) == ("Оператор грубил", VERDICT_FINE)
+
+
+def test_json_in_code_block_and_text():
+    text = 'Вот ответ:\n```json\n{"report": "Все вежливо", "verdict": "Не штрафовать"}\n```'
+    assert parse_verdict_response(text) == ("Все вежливо", VERDICT_NO_FINE)
+
+
+def test_json_without_report_keeps_whole_answer():
+    text = '{"verdict": "Оштрафовать"}'
+    assert parse_verdict_response(text) == (text, VERDICT_FINE)
+
+
+def test_unknown_verdict_needs_second_call():
+    report, verdict = parse_verdict_response('{"report": "Сложный случай", "verdict": "на усмотрение"}')
+    assert (report, verdict) == ("Сложный случай", None)
+
+
+def test_free_text_fallback():
+    text = "Оператор ответил по делу. Итог: не штрафовать."
+    assert parse_verdict_response(text) == (text, VERDICT_NO_FINE)
+    assert parse_verdict_response("Обрезанный ответ {\"report\": \"...") == ("Обрезанный ответ {\"report\": \"...", None)
+    assert parse_verdict_response(None) == ("", None)
@@ -0,0 +1,87 @@
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from zodiac import compute_zodiac, enrich_zodiac, find_mismatches
+
+
+def zodiac_of(value):
+    return compute_zodiac([value]).iloc[0]
+
+
+def values(series):
+    """Значения столбца; пропуск — None."""
+    return [None if pd.isna(value) else value for value in series]
+
+
+@pytest.mark.parametrize(
+    "birth_date, sign",
+    [
+        ("19.01.1990", "Козерог"),
+        ("20.01.1990", "Водолей"),
+        ("18.02.1990", "Водолей"),
+        ("19.02.1990", "Рыбы"),
+        ("20.03.1990", "Рыбы"),
+        ("21.03.1990", "Овен"),
+        ("22.07.1990", "Рак"),
+        ("23.07.1990", "Лев"),
+        ("21.12.1990", "Стрелец"),
+        ("22.12.1990", "Козерог"),
+        ("31.12.1990", "Козерог"),
+        ("01.01.1991", "Козерог"),
+    ],
+)
+def test_western_sign_boundaries(birth_date, sign):
+    assert zodiac_of(birth_date)["Знак зодиака"] == sign
+
+
+@pytest.mark.parametrize(
+    "birth_date, calendar, pinyin",
+    [
+        # Новый год 1983 — 13.02: раньше — еще год Собаки
+        ("05.02.1983", "Водяная Собака", "Жэнь Сюй"),
+        ("12.02.1983", "Водяная Собака", "Жэнь Сюй"),
+        ("13.02.1983", "Водяной Кабан", "Гуй Хай"),
+        # Новый год 1984 — 02.02, начало шестидесятилетнего цикла
+        ("01.02.1984", "Водяной Кабан", "Гуй Хай"),
+        ("02.02.1984", "Деревянная Крыса", "Цзя Цзы"),
+        ("11.02.2021", "Металлическая Крыса", "Гэн Цзы"),
+        ("12.02.2021", "Металлический Бык", "Синь Чоу"),
+        # До Нового года 1900 (31.01) — 1899 год, его начало таблице не нужно
+        ("30.01.1900", "Земляной Кабан", "Цзи Хай"),
+        ("31.01.1900", "Металлическая Крыса", "Гэн Цзы"),
+    ],
+)
+def test_chinese_year_boundaries(birth_date, calendar, pinyin):
+    row = zodiac_of(birth_date)
+    assert values(row[["Китайский календарь", "Пиньинь"]]) == [calendar, pinyin]
+
+
+def test_stem_gives_element_and_yin_yang():
+    row = zodiac_of("12.02.2021")
+    assert (row["Стихия"], row["Инь-Ян"]) == ("Металл", "Инь")
+
+
+def test_excel_dates_and_unparsed_values():
+    result = compute_zodiac([datetime(2021, 2, 12), "не дата", None, "01.01.2031"])
+    assert values(result["Знак зодиака"])[:3] == ["Водолей", None, None]
+    assert values(result["Китайский календарь"]) == ["Металлический Бык", None, None, None]
+    # Вне таблицы Нового года знак зодиака известен, китайский год — нет
+    assert result.iloc[3]["Знак зодиака"] == "Козерог"
+
+
+def test_enrich_fills_only_blank_cells():
+    df = pd.DataFrame(
+        {
+            "День рождения": ["20.01.1990", "21.03.1990"],
+            "Знак зодиака": ["Вручную", ""],
+        },
+        index=[10, 11],
+    )
+    filled = enrich_zodiac(df)
+    assert df["Знак зодиака"].tolist() == ["Вручную", "Овен"]
+    assert df.loc[10, "Китайский календарь"] == "Земляная Змея"
+    assert filled == 1 + 2 + 2
+    mismatches = find_mismatches(df)
+    assert mismatches[["row", "given", "computed"]].values.tolist() == [[10, "Вручную", "Водолей"]]
@@ -0,0 +1,115 @@
+"""Подсчет токенов и слов для бюджетов контекста и лимитов запросов.
+
+Кодировки tiktoken загружаются один раз на процесс (lru_cache). Несколько
+текстов считаются одним вызовом encode_ordinary_batch, а длинный текст
+режется по переносам строк на куски, которые кодируются в нескольких
+потоках (tiktoken отпускает GIL). На стыках кусков число токенов может
+отличаться от кодирования целиком на единицы — для бюджетов это несущественно.
+
+Если кодировка недоступна (нет сети для загрузки), используется оценка
+~3 символа на токен.
+"""
+
+import os
+import re
+from functools import lru_cache
+from typing import List, Optional, Sequence
+
+import tiktoken
+
+
+DEFAULT_ENCODING = "cl100k_base"
+# Тексты длиннее порога кодируются кусками параллельно
+PARALLEL_THRESHOLD_CHARS = 200_000
+PIECE_CHARS = 50_000
+# Число потоков для encode_ordinary_batch (TOKEN_COUNT_THREADS в .env)
+TOKEN_COUNT_THREADS = int(os.getenv("TOKEN_COUNT_THREADS") or 8)
+
+WORD_PATTERN = re.compile(r"\b\w+\b")
+
+
+@lru_cache(maxsize=None)
+def encoding_name_for_model(model_name: str) -> str:
+    """Имя кодировки tiktoken для модели."""
+    name = model_name.lower()
+    # Для большинства современных OpenAI моделей используется cl100k_base,
+    # для старых GPT-3 — p50k_base
+    if "gpt-4" in name or "gpt-3.5" in name:
+        return "cl100k_base"
+    if "gpt-3" in name:
+        return "p50k_base"
+    return DEFAULT_ENCODING
+
+
+@lru_cache(maxsize=None)
+def get_encoding(encoding_name: str):
+    """Кодировка tiktoken или None, если ее не удалось загрузить."""
+    try:
+        return tiktoken.get_encoding(encoding_name)
+    except Exception as e:
+        print(f"Предупреждение: кодировка {encoding_name} недоступна ({e}), используется приблизительный подсчет")
+        return None
+
+
+def get_model_encoding(model_name: Optional[str] = None):
+    """Кодировка для модели; без имени берется MODEL из окружения."""
+    if model_name is None:
+        model_name = os.getenv("MODEL") or "gpt-4"
+    return get_encoding(encoding_name_for_model(model_name))
+
+
+def split_for_encoding(text: str, piece_chars: int = PIECE_CHARS) -> List[str]:
+    """Режет текст на куски ~piece_chars символов по переносам строк (или пробелам)."""
+    pieces = []
+    start = 0
+    while len(text) - start > piece_chars:
+        end = start + piece_chars
+        cut = text.rfind("\n", start, end)
+        if cut <= start:
+            cut = text.rfind(" ", start, end)
+        if cut <= start:
+            cut = end
+        pieces.append(text[start:cut])
+        start = cut
+    pieces.append(text[start:])
+    return pieces
+
+
+def count_tokens_batch(texts: Sequence[str], model_name: Optional[str] = None) -> List[int]:
+    """Число токенов каждого текста; все тексты кодируются одним пакетом в потоках."""
+    encoding = get_model_encoding(model_name)
+    if encoding is None:
+        return [len(text) // 3 if text else 0 for text in texts]
+
+    pieces: List[str] = []
+    owners: List[int] = []
+    for index, text in enumerate(texts):
+        if not text:
+            continue
+        text_pieces = split_for_encoding(text) if len(text) >= PARALLEL_THRESHOLD_CHARS else [text]
+        pieces.extend(text_pieces)
+        owners.extend([index] * len(text_pieces))
+
+    counts = [0] * len(texts)
+    if len(pieces) == 1:
+        # Один короткий текст: без накладных расходов на пул потоков
+        counts[owners[0]] = len(encoding.encode_ordinary(pieces[0]))
+        return counts
+    encoded = encoding.encode_ordinary_batch(pieces, num_threads=TOKEN_COUNT_THREADS)
+    for owner, tokens in zip(owners, encoded):
+        counts[owner] += len(tokens)
+    return counts
+
+
+def count_tokens(text: str, model_name: Optional[str] = None) -> int:
+    """Число токенов текста для модели (по умолчанию MODEL из окружения)."""
+    if not text:
+        return 0
+    return count_tokens_batch([text], model_name)[0]
+
+
+def count_words(text: str) -> int:
+    """Число слов в тексте без построения списка совпадений."""
+    if not text:
+        return 0
+    return sum(1 for _ in WORD_PATTERN.finditer(text))
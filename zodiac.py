@@ -0,0 +1,241 @@
+"""Знак зодиака и китайский календарь для целого столбца дат рождения.
+
+Все значения считаются векторно (NumPy/pandas), без цикла по записям:
+западный знак — по границам месяц-день, китайский год — по таблице дат
+Нового года по лунному календарю. Дата до праздника относится к предыдущему
+китайскому году, поэтому 05.02.1983 — Водяная Собака, а не Водяной Кабан.
+
+Из номера китайского года берутся небесный ствол (стихия, инь/ян) и земная
+ветвь (животное); в колонки пишутся те же строки, что в подготовленных
+вручную таблицах: "Металлический Бык", пиньинь "Синь Чоу".
+
+Таблица LUNAR_NEW_YEAR_TABLE рассчитана заранее (вторая новая луна после
+зимнего солнцестояния по пекинскому времени) на 1900–2030 годы; для дат вне
+этого диапазона значения не заполняются.
+
+Проверка и дозаполнение таблицы сотрудников:
+    python zodiac.py "horoscope_data/Гороскопы 2026 год.xlsx" --output enriched.xlsx
+"""
+
+import argparse
+from typing import Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+# Колонка с датой рождения: в таблице сотрудников и в справочных таблицах
+BIRTH_DATE_COLUMNS = ("День рождения", "Дата рождения")
+# Колонки, которые используются в промте гороскопа (build_horoscope_prompt)
+ZODIAC_COLUMNS = ["Знак зодиака", "Китайский календарь", "Пиньинь"]
+EXTRA_COLUMNS = ["Стихия", "Инь-Ян"]
+
+# Первый день знака (месяц * 100 + день) в порядке года; до 20.01 — Козерог
+WESTERN_SIGN_STARTS = np.array([120, 219, 321, 420, 521, 622, 723, 823, 923, 1023, 1122, 1222])
+WESTERN_SIGNS = np.array([
+    "Водолей", "Рыбы", "Овен", "Телец", "Близнецы", "Рак",
+    "Лев", "Дева", "Весы", "Скорпион", "Стрелец", "Козерог",
+], dtype=object)
+
+# Земные ветви и животные; 4 год н. э. — год Цзя Цзы (Деревянная Крыса)
+ANIMALS = np.array([
+    "Крыса", "Бык", "Тигр", "Кролик", "Дракон", "Змея",
+    "Лошадь", "Коза", "Обезьяна", "Петух", "Собака", "Кабан",
+], dtype=object)
+FEMININE_ANIMALS = np.array([name in ("Крыса", "Змея", "Лошадь", "Коза", "Обезьяна", "Собака") for name in ANIMALS])
+EARTHLY_BRANCHES = np.array(["Цзы", "Чоу", "Инь", "Мао", "Чэнь", "Сы", "У", "Вэй", "Шэнь", "Ю", "Сюй", "Хай"], dtype=object)
+
+# Небесные стволы: по два на стихию, четный — ян, нечетный — инь
+HEAVENLY_STEMS = np.array(["Цзя", "И", "Бин", "Дин", "У", "Цзи", "Гэн", "Синь", "Жэнь", "Гуй"], dtype=object)
+ELEMENTS = np.array(["Дерево", "Огонь", "Земля", "Металл", "Вода"], dtype=object)
+ELEMENT_ADJECTIVES = np.array(["Деревянный", "Огненный", "Земляной", "Металлический", "Водяной"], dtype=object)
+ELEMENT_ADJECTIVES_FEMININE = np.array(["Деревянная", "Огненная", "Земляная", "Металлическая", "Водяная"], dtype=object)
+YIN_YANG = np.array(["Ян", "Инь"], dtype=object)
+
+LUNAR_NEW_YEAR_TABLE = """
+1900-01-31 1901-02-19 1902-02-08 1903-01-29 1904-02-16 1905-02-04 1906-01-25 1907-02-13
+1908-02-02 1909-01-22 1910-02-10 1911-01-30 1912-02-18 1913-02-06 1914-01-26 1915-02-14
+1916-02-03 1917-01-23 1918-02-11 1919-02-01 1920-02-20 1921-02-08 1922-01-28 1923-02-16
+1924-02-05 1925-01-24 1926-02-13 1927-02-02 1928-01-23 1929-02-10 1930-01-30 1931-02-17
+1932-02-06 1933-01-26 1934-02-14 1935-02-04 1936-01-24 1937-02-11 1938-01-31 1939-02-19
+1940-02-08 1941-01-27 1942-02-15 1943-02-05 1944-01-25 1945-02-13 1946-02-02 1947-01-22
+1948-02-10 1949-01-29 1950-02-17 1951-02-06 1952-01-27 1953-02-14 1954-02-03 1955-01-24
+1956-02-12 1957-01-31 1958-02-18 1959-02-08 1960-01-28 1961-02-15 1962-02-05 1963-01-25
+1964-02-13 1965-02-02 1966-01-21 1967-02-09 1968-01-30 1969-02-17 1970-02-06 1971-01-27
+1972-02-15 1973-02-03 1974-01-23 1975-02-11 1976-01-31 1977-02-18 1978-02-07 1979-01-28
+1980-02-16 1981-02-05 1982-01-25 1983-02-13 1984-02-02 1985-02-20 1986-02-09 1987-01-29
+1988-02-17 1989-02-06 1990-01-27 1991-02-15 1992-02-04 1993-01-23 1994-02-10 1995-01-31
+1996-02-19 1997-02-07 1998-01-28 1999-02-16 2000-02-05 2001-01-24 2002-02-12 2003-02-01
+2004-01-22 2005-02-09 2006-01-29 2007-02-18 2008-02-07 2009-01-26 2010-02-14 2011-02-03
+2012-01-23 2013-02-10 2014-01-31 2015-02-19 2016-02-08 2017-01-28 2018-02-16 2019-02-05
+2020-01-25 2021-02-12 2022-02-01 2023-01-22 2024-02-10 2025-01-29 2026-02-17 2027-02-06
+2028-01-26 2029-02-13 2030-02-03
+"""
+LUNAR_NEW_YEAR = np.array(LUNAR_NEW_YEAR_TABLE.split(), dtype="datetime64[D]")
+FIRST_TABLE_YEAR = 1900
+LAST_TABLE_YEAR = FIRST_TABLE_YEAR + len(LUNAR_NEW_YEAR) - 1
+
+
+def parse_birth_dates(values: Iterable) -> pd.Series:
+    """Даты рождения из строк "дд.мм.гггг" или дат Excel; нераспознанные — NaT."""
+    values = pd.Series(values)
+    index = values.index
+    values = values.reset_index(drop=True)
+    dates = pd.to_datetime(values, format="%d.%m.%Y", errors="coerce")
+    rest = dates.isna() & values.notna()
+    if rest.any():
+        # Редкие ячейки с датой Excel или другим написанием разбираются по одной
+        dates[rest] = pd.to_datetime(values[rest].astype(str), dayfirst=True, errors="coerce", format="mixed")
+    dates.index = index
+    return dates
+
+
+def western_signs(dates: pd.Series) -> np.ndarray:
+    """Западный знак зодиака для каждой даты (None для NaT)."""
+    month_day = (dates.dt.month * 100 + dates.dt.day).to_numpy(dtype=float, na_value=np.nan)
+    valid = ~np.isnan(month_day)
+    # -1 (до первой границы года) указывает на последний элемент — Козерог
+    positions = np.searchsorted(WESTERN_SIGN_STARTS, np.where(valid, month_day, 0), side="right") - 1
+    return np.where(valid, WESTERN_SIGNS[positions], None)
+
+
+def chinese_years(dates: pd.Series) -> np.ndarray:
+    """Год по китайскому календарю; -1 для NaT и дат вне LUNAR_NEW_YEAR_TABLE."""
+    days = dates.to_numpy(dtype="datetime64[D]")
+    valid = ~np.isnat(days)
+    years = np.where(valid, dates.dt.year.to_numpy(dtype=float, na_value=0), 0).astype(int)
+    valid &= (years >= FIRST_TABLE_YEAR) & (years <= LAST_TABLE_YEAR)
+    new_year = LUNAR_NEW_YEAR[np.clip(years - FIRST_TABLE_YEAR, 0, len(LUNAR_NEW_YEAR) - 1)]
+    result = years - (days < new_year)
+    return np.where(valid, result, -1)
+
+
+def compute_zodiac(birth_dates: Iterable) -> pd.DataFrame:
+    """Колонки ZODIAC_COLUMNS и EXTRA_COLUMNS для столбца дат рождения."""
+    dates = parse_birth_dates(birth_dates)
+    years = chinese_years(dates)
+    known = years >= 0
+    stems = (years - 4) % 10
+    branches = (years - 4) % 12
+    elements = stems // 2
+
+    adjectives = np.where(
+        FEMININE_ANIMALS[branches], ELEMENT_ADJECTIVES_FEMININE[elements], ELEMENT_ADJECTIVES[elements]
+    )
+    calendar = adjectives + " " + ANIMALS[branches]
+    pinyin = HEAVENLY_STEMS[stems] + " " + EARTHLY_BRANCHES[branches]
+
+    return pd.DataFrame(
+        {
+            "Знак зодиака": western_signs(dates),
+            "Китайский календарь": np.where(known, calendar, None),
+            "Пиньинь": np.where(known, pinyin, None),
+            "Стихия": np.where(known, ELEMENTS[elements], None),
+            "Инь-Ян": np.where(known, YIN_YANG[stems % 2], None),
+        },
+        index=dates.index,
+    )
+
+
+def find_date_column(df: pd.DataFrame) -> Optional[str]:
+    for column in BIRTH_DATE_COLUMNS:
+        if column in df.columns:
+            return column
+    return None
+
+
+def _is_blank(values: pd.Series) -> pd.Series:
+    return values.isna() | (values.astype(str).str.strip() == "")
+
+
+def enrich_zodiac(
+    df: pd.DataFrame,
+    columns: Optional[List[str]] = None,
+    date_column: Optional[str] = None,
+    overwrite: bool = False,
+) -> int:
+    """Дозаполняет колонки (по умолчанию ZODIAC_COLUMNS) по дате рождения на месте.
+
+    Отсутствующие колонки добавляются, в существующих заполняются только
+    пустые ячейки (overwrite=True — пересчитываются все). Возвращает число
+    заполненных ячеек; без колонки с датой таблица не меняется.
+    """
+    date_column = date_column or find_date_column(df)
+    if date_column not in df.columns:
+        return 0
+    columns = columns or ZODIAC_COLUMNS
+    computed = compute_zodiac(df[date_column])
+    filled = 0
+    for column in columns:
+        if column not in df.columns:
+            df[column] = None
+        target = computed[column].notna()
+        if not overwrite:
+            target &= _is_blank(df[column])
+        if target.any():
+            df[column] = df[column].astype(object)
+            df.loc[target, column] = computed.loc[target, column]
+            filled += int(target.sum())
+    return filled
+
+
+def find_mismatches(df: pd.DataFrame, date_column: Optional[str] = None) -> pd.DataFrame:
+    """Строки, где заполненные вручную ZODIAC_COLUMNS расходятся с расчетом."""
+    date_column = date_column or find_date_column(df)
+    if date_column not in df.columns:
+        raise KeyError(f"В таблице нет колонки с датой рождения ({', '.join(BIRTH_DATE_COLUMNS)})")
+    computed = compute_zodiac(df[date_column])
+    rows = []
+    for column in ZODIAC_COLUMNS:
+        if column not in df.columns:
+            continue
+        given = df[column].astype(str).str.strip()
+        differs = ~_is_blank(df[column]) & computed[column].notna() & (given != computed[column])
+        for index in df.index[differs]:
+            rows.append(
+                {
+                    "row": index,
+                    date_column: df.at[index, date_column],
+                    "column": column,
+                    "given": df.at[index, column],
+                    "computed": computed.at[index, column],
+                }
+            )
+    return pd.DataFrame(rows, columns=["row", date_column, "column", "given", "computed"])
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Проверка и заполнение знаков зодиака по дате рождения")
+    parser.add_argument("path", help="xlsx или csv с колонкой даты рождения")
+    parser.add_argument("--sheet", default=None, help="Лист xlsx (по умолчанию первый)")
+    parser.add_argument("--date-column", default=None, help="Колонка с датой рождения (по умолчанию ищется)")
+    parser.add_argument("--output", default=None, help="Куда сохранить таблицу с заполненными колонками")
+    parser.add_argument("--overwrite", action="store_true", help="Пересчитать и заполненные ячейки")
+    parser.add_argument("--extra", action="store_true", help="Добавить колонки Стихия и Инь-Ян")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    if args.path.lower().endswith(".csv"):
+        df = pd.read_csv(args.path)
+    else:
+        df = pd.read_excel(args.path, sheet_name=args.sheet or 0)
+
+    mismatches = find_mismatches(df, args.date_column)
+    print(f"Записей: {len(df)}, расхождений с расчетом: {len(mismatches)}")
+    if not mismatches.empty:
+        print(mismatches.to_string(index=False))
+
+    if args.output:
+        columns = ZODIAC_COLUMNS + (EXTRA_COLUMNS if args.extra else [])
+        filled = enrich_zodiac(df, columns, args.date_column, overwrite=args.overwrite)
+        if args.output.lower().endswith(".csv"):
+            df.to_csv(args.output, index=False)
+        else:
+            df.to_excel(args.output, index=False)
+        print(f"Заполнено ячеек: {filled}, таблица сохранена в {args.output}")
+
+
+if __name__ == "__main__":
+    main()